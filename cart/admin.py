@@ -1,3 +1,12 @@
 from django.contrib import admin
+from .models import Cart, CartLine
 
-# Register your models here.
+class CartLineInline(admin.TabularInline):
+    model = CartLine
+    raw_id_fields = ['product']
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'created', 'updated']
+    raw_id_fields = ['user']
+    inlines = [CartLineInline]
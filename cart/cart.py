@@ -1,18 +1,35 @@
 from decimal import Decimal
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from products.models import Product
+from .models import Cart as StoredCart, CartLine
 
 class Cart:
+    """
+    Shopping cart kept in the session as {product_id: {'quantity', 'price'}}.
+
+    For logged-in users the session copy is written through to a Cart/CartLine
+    row set, which is the authoritative cart: it is merged with the session
+    cart at login and re-read whenever the line items are hydrated, so the
+    cart follows the user across devices. Counting and totals still come from
+    the session alone.
+    """
+
     def __init__(self, request):
         """
         Initialize the cart.
         """
         self.session = request.session
-        cart = self.session.get('cart')
-        if not cart:
-            # save an empty cart in the session
-            cart = self.session['cart'] = {}
-        self.cart = cart
+        user = getattr(request, 'user', None)
+        self.user = user if user is not None and user.is_authenticated else None
+        # An empty cart is only written to the session once something is
+        # added, so merely looking at the cart never creates a session.
+        self.cart = self.session.get('cart') or {}
+        self._items = None
+
+    def _stored_cart(self):
+        return StoredCart.objects.get_or_create(user=self.user)[0]
 
     def add(self, product, quantity=1, override_quantity=False):
         """
@@ -26,37 +43,154 @@ class Cart:
             self.cart[product_id]['quantity'] = quantity
         else:
             self.cart[product_id]['quantity'] += quantity
+        self.cart[product_id]['price'] = str(product.price)
+
+        if self.user is not None:
+            with transaction.atomic():
+                line, created = CartLine.objects.get_or_create(
+                    cart=self._stored_cart(), product=product,
+                    defaults={'quantity': quantity},
+                )
+                if not created:
+                    # Another session may have changed this line; the stored
+                    # quantity is the one to build on.
+                    line.quantity = quantity if override_quantity else F('quantity') + quantity
+                    line.save(update_fields=['quantity'])
+                    line.refresh_from_db(fields=['quantity'])
+            self.cart[product_id]['quantity'] = line.quantity
         self.save()
 
     def save(self):
         """
-        Mark the session as "modified" to make sure it gets saved
+        Store the cart in the session and mark it as "modified" to make sure
+        it gets saved
         """
+        self.session['cart'] = self.cart
         self.session.modified = True
+        self._items = None
 
     def remove(self, product):
         """
         Remove a product from the cart.
         """
         product_id = str(product.id)
+        if self.user is not None:
+            CartLine.objects.filter(cart__user=self.user, product_id=product.id).delete()
         if product_id in self.cart:
             del self.cart[product_id]
             self.save()
 
+    def sync_with_stored(self):
+        """
+        Merge the session cart into the user's stored cart, keeping the larger
+        quantity for products in both, then load the result into the session.
+        Called at login.
+        """
+        if self.user is None:
+            return
+        session_lines = {}
+        for product_id, line in self.cart.items():
+            try:
+                session_lines[int(product_id)] = int(line['quantity'])
+            except (KeyError, TypeError, ValueError):
+                continue
+        if session_lines:
+            with transaction.atomic():
+                stored = self._stored_cart()
+                existing = {
+                    line.product_id: line
+                    for line in stored.lines.select_for_update().filter(product_id__in=session_lines)
+                }
+                valid_ids = set(Product.objects.filter(id__in=session_lines).values_list('id', flat=True))
+                new_lines = []
+                changed = []
+                for product_id, quantity in session_lines.items():
+                    if product_id not in valid_ids or quantity <= 0:
+                        continue
+                    line = existing.get(product_id)
+                    if line is None:
+                        new_lines.append(CartLine(cart=stored, product_id=product_id, quantity=quantity))
+                    elif quantity > line.quantity:
+                        line.quantity = quantity
+                        changed.append(line)
+                CartLine.objects.bulk_create(new_lines, ignore_conflicts=True)
+                CartLine.objects.bulk_update(changed, ['quantity'])
+        self._load_stored()
+
+    def _load_stored(self):
+        """
+        Replace the session copy with the stored cart, hydrated in one query.
+        """
+        lines = (
+            CartLine.objects.filter(cart__user=self.user)
+            .select_related('product__category')
+            .order_by('added', 'id')
+        )
+        stored = {}
+        items = []
+        for line in lines:
+            stored[str(line.product_id)] = {
+                'quantity': line.quantity,
+                'price': str(line.product.price),
+            }
+            items.append(self._item(line.product, line.quantity))
+        if stored != self.cart or self.session.get('cart_user') != self.user.pk:
+            self.cart = stored
+            self.session['cart_user'] = self.user.pk
+            self.save()
+        self._items = items
+        return items
+
+    @staticmethod
+    def _item(product, quantity):
+        return {
+            'product': product,
+            'quantity': quantity,
+            'price': product.price,
+            'total_price': product.price * quantity,
+        }
+
+    def hydrate(self):
+        """
+        Build the line items with their products (and categories) in one
+        query. Prices are the products' current ones; the session's price
+        snapshots are refreshed to match and lines for deleted products are
+        dropped. The session itself only ever holds plain JSON values.
+        """
+        if self.user is not None:
+            if self.session.get('cart_user') != self.user.pk:
+                # A session from before login tracking: merge it first.
+                self.sync_with_stored()
+                return self._items
+            return self._load_stored()
+
+        products = Product.objects.select_related('category').in_bulk(
+            [int(product_id) for product_id in self.cart]
+        )
+        items = []
+        stale = False
+        for product_id, line in list(self.cart.items()):
+            product = products.get(int(product_id))
+            if product is None:
+                del self.cart[product_id]
+                stale = True
+                continue
+            if line.get('price') != str(product.price):
+                line['price'] = str(product.price)
+                stale = True
+            items.append(self._item(product, line['quantity']))
+        if stale:
+            self.save()
+        self._items = items
+        return items
+
     def __iter__(self):
         """
-        Iterate over the items in the cart and get the products from the database.
+        Iterate over the items in the cart with their products loaded.
         """
-        product_ids = self.cart.keys()
-        # get the product objects and add them to the cart
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-        for product in products:
-            cart[str(product.id)]['product'] = product
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+        if self._items is None:
+            self.hydrate()
+        return iter(self._items)
 
     def __len__(self):
         """
@@ -75,5 +209,10 @@ class Cart:
         """
         Remove cart from session.
         """
-        del self.session['cart']
-        self.save()
+        self.cart = {}
+        self._items = None
+        if self.user is not None:
+            CartLine.objects.filter(cart__user=self.user).delete()
+        if 'cart' in self.session:
+            del self.session['cart']
+            self.session.modified = True
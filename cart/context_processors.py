@@ -1,4 +1,8 @@
+from django.utils.functional import SimpleLazyObject
 from .cart import Cart
 
 def cart(request):
-    return {'cart': Cart(request)}
+    # Built on first use: pages that never mention the cart don't read the
+    # session, and the item count and total come from session data alone.
+    # Only iterating the line items queries products.
+    return {'cart': SimpleLazyObject(lambda: Cart(request))}
@@ -1,3 +1,39 @@
 from django.db import models
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from products.models import Product
 
-# Create your models here.
+class Cart(models.Model):
+    """
+    Persistent cart for a logged-in user, so it survives logout and follows
+    the user across devices. The session cart stays the working copy.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Cart for {self.user}'
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(Cart, related_name='lines', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='cart_lines', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    added = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['added']
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id}'
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    if request is None or not hasattr(request, 'session'):
+        return
+    from .cart import Cart as SessionCart
+    SessionCart(request).sync_with_stored()
@@ -9,6 +9,8 @@ logger = logging.getLogger(__name__)
 
 def cart_detail(request):
     cart = Cart(request)
+    # Load the lines up front so the count reflects the stored cart too
+    cart.hydrate()
     return render(request, 'cart/detail.html', {
         'cart': cart
     })
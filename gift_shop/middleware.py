@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .routers import REPLICA_DB_ALIAS, routing_state
+
+PRIMARY_COOKIE = 'db_primary_until'
+
+
+class PrimaryAfterWriteMiddleware:
+    """
+    Read-your-writes for the replica router: once a request writes to the
+    database, that browser's reads go to the primary for
+    REPLICA_STICKY_SECONDS, until the replica has caught up.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        with routing_state(pinned=pinned) as state:
+            response = self.get_response(request)
+        if state.wrote and REPLICA_DB_ALIAS in connections.settings:
+            seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+            response.set_cookie(
+                PRIMARY_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,107 @@
+"""
+Database routers.
+
+ReplicaRouter sends reads of the catalog and reviews (product_list,
+product_detail, review lists) to the 'replica' database when one is
+configured (DATABASE_REPLICA_URL), as well as every read inside a view
+wrapped in ``read_from_replica`` (the admin dashboard). Everything else, and
+every write, uses 'default'.
+
+A replica lags the primary, so after a request that wrote something,
+PrimaryAfterWriteMiddleware pins that browser's reads to the primary for
+REPLICA_STICKY_SECONDS: a customer sees their own review or order straight
+away.
+"""
+import contextvars
+import functools
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+
+@dataclass
+class RoutingState:
+    # Reads must see the primary (recent write by this client)
+    pinned: bool = False
+    # Send all reads to the replica, whatever the model
+    replica: bool = False
+    # Set by the router when the request writes
+    wrote: bool = False
+
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+@contextmanager
+def routing_state(**kwargs):
+    token = _routing.set(RoutingState(**kwargs))
+    try:
+        yield _routing.get()
+    finally:
+        _routing.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Route every read in the block to the replica, unless the client is
+    pinned to the primary.
+    """
+    state = _routing.get()
+    if state is None:
+        with routing_state(replica=True):
+            yield
+        return
+    previous, state.replica = state.replica, True
+    try:
+        yield
+    finally:
+        state.replica = previous
+
+
+def read_from_replica(view):
+    """
+    View decorator for read-heavy pages that can be slightly stale.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    replica_apps = {'products', 'reviews'}
+
+    def db_for_read(self, model, **hints):
+        if REPLICA_DB_ALIAS not in connections.settings:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations on the database the object came from
+            return instance._state.db
+        state = _routing.get()
+        if state is not None and (state.pinned or state.wrote):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads that feed a write (checkout, stock) must see the primary
+            return DEFAULT_DB_ALIAS
+        if (state is not None and state.replica) or model._meta.app_label in self.replica_apps:
+            return REPLICA_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DB_ALIAS
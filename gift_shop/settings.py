@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     'orders.apps.OrdersConfig',
     'payment.apps.PaymentConfig',
     'reviews.apps.ReviewsConfig',
+    'notifications.apps.NotificationsConfig',
 ]
 
 MIDDLEWARE = [
@@ -64,6 +65,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Pins a client's reads to the primary database after it writes
+    'gift_shop.middleware.PrimaryAfterWriteMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,6 +84,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'cart.context_processors.cart',
+                'products.context_processors.catalog',
             ],
         },
     },
@@ -94,28 +98,113 @@ WSGI_APPLICATION = 'gift_shop.wsgi.application'
 
 # Database configuration
 DATABASE_URL = config('DATABASE_URL', default='')
+# Optional read replica; catalog, review and admin dashboard reads are routed
+# to it (gift_shop.routers). After a write, that client reads from the primary
+# for REPLICA_STICKY_SECONDS so it sees its own changes despite replica lag.
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=15, cast=int)
+
+# Connection management. Connections are kept open between requests for
+# DATABASE_CONN_MAX_AGE seconds (0 closes them after every request, None
+# keeps them forever) and checked before reuse so a connection the server
+# dropped doesn't fail the next request.
+DATABASE_CONN_MAX_AGE = config('DATABASE_CONN_MAX_AGE', default=600, cast=lambda v: None if v == 'None' else int(v))
+DATABASE_CONN_HEALTH_CHECKS = config('DATABASE_CONN_HEALTH_CHECKS', default=True, cast=bool)
+# PostgreSQL only: use a psycopg 3 connection pool per process instead of
+# persistent connections (needs psycopg[pool]). Sizes are per process.
+DATABASE_POOL = config('DATABASE_POOL', default=False, cast=bool)
+DATABASE_POOL_MIN_SIZE = config('DATABASE_POOL_MIN_SIZE', default=2, cast=int)
+DATABASE_POOL_MAX_SIZE = config('DATABASE_POOL_MAX_SIZE', default=10, cast=int)
+# Seconds a request waits for a free pooled connection before failing
+DATABASE_POOL_TIMEOUT = config('DATABASE_POOL_TIMEOUT', default=10, cast=float)
+
+
+def database_config(url=None, **database):
+    """
+    DATABASES entry for ``url``, or for the given settings (ENGINE, NAME, ...)
+    when there is no URL, with the connection management settings above.
+    """
+    if url:
+        if not dj_database_url:
+            # If a database URL is provided we expect dj-database-url to be installed
+            # so we can parse production-style database URLs (e.g. Render/Postgres).
+            raise RuntimeError(
+                "DATABASE_URL is set but the 'dj-database-url' package is not installed. "
+                "Install it with: pip install dj-database-url"
+            )
+        database = dj_database_url.parse(url)
+    database['CONN_MAX_AGE'] = DATABASE_CONN_MAX_AGE
+    database['CONN_HEALTH_CHECKS'] = DATABASE_CONN_HEALTH_CHECKS
+    if DATABASE_POOL and database['ENGINE'] == 'django.db.backends.postgresql':
+        try:
+            import psycopg_pool  # noqa: F401
+        except Exception:
+            raise RuntimeError(
+                "DATABASE_POOL is set but psycopg 3 with its pool isn't installed. "
+                "Install it with: pip install 'psycopg[binary,pool]'"
+            )
+        # The pool keeps connections open; Django must hand them back after
+        # each request rather than holding on to them.
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+            'timeout': DATABASE_POOL_TIMEOUT,
+        }
+    return database
 
-if DATABASE_URL:
-    # If DATABASE_URL is provided we expect dj-database-url to be installed
-    # so we can parse production-style database URLs (e.g. Render/Postgres).
-    if not dj_database_url:
-        raise RuntimeError(
-            "DATABASE_URL is set but the 'dj-database-url' package is not installed. "
-            "Install it with: pip install dj-database-url"
-        )
 
+if DATABASE_URL:
     # Production database (PostgreSQL on Render)
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL)
+        'default': database_config(DATABASE_URL)
     }
 else:
     # Development database (SQLite)
     DATABASES = {
+        'default': database_config(
+            ENGINE='django.db.backends.sqlite3',
+            NAME=BASE_DIR / 'db.sqlite3',
+        )
+    }
+
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = database_config(DATABASE_REPLICA_URL)
+    # Tests run against the primary only
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['gift_shop.routers.ReplicaRouter']
+
+
+# Cache configuration
+# Local memory by default; set CACHE_URL (redis://... or memcached://host:port)
+# to share cached fragments and catalog summaries between workers.
+CACHE_URL = config('CACHE_URL', default='')
+
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
         }
     }
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_URL[len('memcached://'):],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'giftnest',
+        }
+    }
+
+# Seconds a rendered template fragment (product card, footer) stays cached
+FRAGMENT_CACHE_TIMEOUT = config('FRAGMENT_CACHE_TIMEOUT', default=3600, cast=int)
 
 
 # Payment Gateway Settings
@@ -137,19 +226,81 @@ RAZORPAY_ENABLED = config('RAZORPAY_ENABLED', default=True, cast=bool)
 # Payment Gateway Priority (which gateway to use first)
 DEFAULT_PAYMENT_GATEWAY = config('DEFAULT_PAYMENT_GATEWAY', default='razorpay')  # 'stripe' or 'razorpay'
 
+# Client class per gateway; e.g. {'razorpay': 'payment.gateways.FakeRazorpayGateway'}
+# runs payments against the in-process stand-in (see payment/tests.py and
+# manage.py benchmark_payments)
+PAYMENT_GATEWAYS = {}
+# Gateway API calls: seconds to connect and to wait for a response, and
+# keep-alive connections pooled per gateway
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = config('PAYMENT_GATEWAY_CONNECT_TIMEOUT', default=3.05, cast=float)
+PAYMENT_GATEWAY_READ_TIMEOUT = config('PAYMENT_GATEWAY_READ_TIMEOUT', default=10, cast=float)
+PAYMENT_GATEWAY_POOL_SIZE = config('PAYMENT_GATEWAY_POOL_SIZE', default=10, cast=int)
+# Circuit breaker: after this many failed calls in a row (a call slower than
+# PAYMENT_GATEWAY_SLOW_CALL seconds counts as failed) the method is hidden
+# for PAYMENT_CIRCUIT_OPEN_SECONDS
+PAYMENT_GATEWAY_SLOW_CALL = config('PAYMENT_GATEWAY_SLOW_CALL', default=5, cast=float)
+PAYMENT_CIRCUIT_FAILURES = config('PAYMENT_CIRCUIT_FAILURES', default=5, cast=int)
+PAYMENT_CIRCUIT_OPEN_SECONDS = config('PAYMENT_CIRCUIT_OPEN_SECONDS', default=60, cast=int)
+
 # Currency settings
-DEFAULT_CURRENCY = config('DEFAULT_CURRENCY', default='USD')  # USD for Stripe, INR for Razorpay
+# Stored on each new order, which every gateway then charges in
+DEFAULT_CURRENCY = config('DEFAULT_CURRENCY', default='USD')
 
 # UPI manual payment settings
 UPI_ENABLED = config('UPI_ENABLED', default=True, cast=bool)
 UPI_VPA = config('UPI_VPA', default='giftnest@upi')
 UPI_PAYEE_NAME = config('UPI_PAYEE_NAME', default='GiftNest')
 
+# Webhook processing (manage.py process_webhooks)
+WEBHOOK_MAX_ATTEMPTS = config('WEBHOOK_MAX_ATTEMPTS', default=5, cast=int)
+# Retry delay in seconds, doubled after every failed attempt
+WEBHOOK_RETRY_DELAY = config('WEBHOOK_RETRY_DELAY', default=30, cast=int)
+
+# Catalog settings
+# Upper edges of the price buckets shown as listing facets
+CATALOG_PRICE_BUCKETS = [25, 50, 100, 250]
+# Safety net for writers that bypass model signals (queryset.update())
+CATALOG_SUMMARY_TIMEOUT = config('CATALOG_SUMMARY_TIMEOUT', default=300, cast=int)
+# Seconds before a worker's in-memory autocomplete index is rebuilt from the DB
+AUTOCOMPLETE_MAX_AGE = config('AUTOCOMPLETE_MAX_AGE', default=300, cast=int)
+# Keyword/regex rules used by assign_categories; None uses products.categorize.DEFAULT_RULES
+PRODUCT_CATEGORY_RULES = None
+# Neighbours kept per product by refresh_related_products, and how its
+# co-purchase, same-category and price-proximity signals are weighted
+RELATED_PRODUCTS_STORED = 12
+RELATED_PRODUCTS_WEIGHTS = {'co_purchase': 3.0, 'category': 1.0, 'price': 0.5}
+
+# Resized WebP/JPEG copies of product images, generated in the background by
+# IMAGE_DERIVATIVE_WORKERS processes and stored under MEDIA_ROOT/IMAGE_DERIVATIVE_DIR
+IMAGE_DERIVATIVE_WIDTHS = config('IMAGE_DERIVATIVE_WIDTHS', default='120,240,400,800,1200',
+                                 cast=lambda v: tuple(int(w) for w in v.split(',') if w.strip()))
+IMAGE_DERIVATIVE_DIR = 'derivatives'
+IMAGE_DERIVATIVE_WORKERS = config('IMAGE_DERIVATIVE_WORKERS', default=1, cast=int)
+
+# Order settings
+# Seconds an unpaid order keeps its stock before expire_stock_holds returns it
+STOCK_HOLD_TTL = config('STOCK_HOLD_TTL', default=900, cast=int)
+# Invoice PDFs are rendered once per order version by a process pool and kept
+# under MEDIA_ROOT/INVOICE_STORAGE_DIR
+INVOICE_STORAGE_DIR = 'invoices'
+INVOICE_RENDER_WORKERS = config('INVOICE_RENDER_WORKERS', default=2, cast=int)
+# Seconds the invoice view may wait for a render before answering 202
+INVOICE_RENDER_WAIT = config('INVOICE_RENDER_WAIT', default=0, cast=float)
+# Seconds an invoice version that failed to render is served as HTML
+# before another render is tried
+INVOICE_FAILURE_TIMEOUT = config('INVOICE_FAILURE_TIMEOUT', default=3600, cast=int)
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'GiftNest <noreply@giftnest.com>'
 CONTACT_EMAIL = 'contact@giftnest.com'
 
+# Outbox worker (manage.py send_queued_email)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+# Retry delay in seconds, doubled after every failed attempt up to the maximum
+EMAIL_OUTBOX_RETRY_DELAY = config('EMAIL_OUTBOX_RETRY_DELAY', default=60, cast=int)
+EMAIL_OUTBOX_MAX_RETRY_DELAY = config('EMAIL_OUTBOX_MAX_RETRY_DELAY', default=3600, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
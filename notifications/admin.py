@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import OutgoingEmail
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created']
+    list_filter = ['status', 'created']
+    search_fields = ['subject', 'last_error']
+    readonly_fields = ['created', 'sent_at']
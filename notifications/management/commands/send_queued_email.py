@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from notifications.outbox import deliver_due
+
+class Command(BaseCommand):
+    help = 'Send queued outbox email in batches over one mail connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages sent per connection')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a worker instead of exiting')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = failed = 0
+            # Drain everything that is due, one batch at a time
+            while True:
+                batch_sent, batch_failed = deliver_due(options['batch_size'])
+                sent += batch_sent
+                failed += batch_failed
+                if batch_sent + batch_failed < options['batch_size']:
+                    break
+            if sent or failed or options['verbosity'] > 1:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails, {failed} failed'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,128 @@
+"""
+Database-backed email outbox.
+
+``queue_email`` stores a rendered message and returns at once; queued mail is
+committed or rolled back with the surrounding transaction. ``deliver_due``
+claims a batch of due messages and sends them over a single backend
+connection (one SMTP session for the whole batch). A failed message is
+retried with exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS, then left
+as failed.
+
+Attachments that are expensive to produce, like invoice PDFs, are queued as
+a dotted path to a builder plus its arguments and built by the worker. A
+builder returns (filename, content, mimetype), or None to skip the
+attachment.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(subject, body_text, recipients, body_html='', from_email=None, attachments=()):
+    """
+    Put a message in the outbox. ``attachments`` is a sequence of
+    (builder_path, args) pairs.
+    """
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+        body_text=body_text,
+        body_html=body_html,
+        attachments=[{'builder': builder, 'args': list(args)} for builder, args in attachments],
+    )
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait before the next try after ``attempts`` failures.
+    """
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'EMAIL_OUTBOX_MAX_RETRY_DELAY', 3600))
+
+
+def claim_batch(batch_size, now=None):
+    """
+    Lease up to ``batch_size`` due messages to this worker by pushing their
+    next attempt past the lease time, so other workers skip them.
+    """
+    now = now or timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE', 300))
+    with transaction.atomic():
+        batch = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.QUEUED, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            OutgoingEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt_at=now + lease,
+            )
+    return batch
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body_text, email.from_email, email.recipients, connection=connection,
+    )
+    if email.body_html:
+        message.attach_alternative(email.body_html, 'text/html')
+    for attachment in email.attachments:
+        built = import_string(attachment['builder'])(*attachment['args'])
+        if built is not None:
+            message.attach(*built)
+    return message
+
+
+def _record_failure(email, error):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5):
+        email.status = OutgoingEmail.FAILED
+        logger.error(f'Giving up on email {email.pk} after {email.attempts} attempts: {email.last_error}')
+    else:
+        email.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(email.attempts))
+        logger.warning(f'Email {email.pk} failed (attempt {email.attempts}): {email.last_error}')
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_due(batch_size=50):
+    """
+    Send one batch of due messages over a single connection. Returns
+    (sent, failed).
+    """
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        for email in batch:
+            try:
+                # Opens the session on first use; a no-op while it's open
+                connection.open()
+                connection.send_messages([build_message(email, connection)])
+            except Exception as e:
+                failed += 1
+                _record_failure(email, e)
+                # The session may be unusable after an error; start afresh.
+                connection.close()
+                continue
+            sent += 1
+            email.status = OutgoingEmail.SENT
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.last_error = ''
+            email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+    finally:
+        connection.close()
+    return sent, failed
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem
+from .models import Order, OrderItem, StockHold
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -8,7 +8,18 @@ class OrderItemInline(admin.TabularInline):
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'first_name', 'last_name', 'email',
-                    'address', 'postal_code', 'city', 'paid',
-                    'created', 'updated']
+                    'address', 'postal_code', 'city', 'total', 'item_count',
+                    'paid', 'created', 'updated']
     list_filter = ['paid', 'created', 'updated']
+    readonly_fields = ['total', 'item_count']
     inlines = [OrderItemInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_totals()
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'product', 'quantity', 'status', 'expires_at']
+    list_filter = ['status']
+    raw_id_fields = ['order', 'product']
@@ -0,0 +1,140 @@
+"""
+Stock holds for unpaid orders.
+
+Checkout takes stock out of sale (products.inventory.reserve_stock) and
+records a StockHold per product with a deadline of STOCK_HOLD_TTL seconds.
+Paying for the order, or choosing cash on delivery, confirms the holds.
+Cancelling the payment releases them at once, and expire_holds(), run
+periodically by the expire_stock_holds command, returns lapsed ones.
+
+Every transition is a conditional UPDATE on ``status``, so a hold is only
+ever given back to stock once, even with a cancel and a sweep racing.
+Returning stock moves a whole batch in one UPDATE ... RETURNING, so only
+the holds that statement actually moved are restocked.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from products.inventory import InsufficientStock, release_stock, reserve_stock
+from .models import StockHold
+
+logger = logging.getLogger(__name__)
+
+
+def hold_deadline(now=None):
+    return (now or timezone.now()) + timedelta(seconds=getattr(settings, 'STOCK_HOLD_TTL', 900))
+
+
+def place_holds(order, lines):
+    """
+    Record holds for stock already reserved for ``order``; ``lines`` are
+    (product_id, quantity) pairs.
+    """
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    expires_at = hold_deadline()
+    StockHold.objects.bulk_create([
+        StockHold(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def _return_to_stock(hold_ids, status):
+    """
+    Move the given held holds to ``status`` and put their stock back, with
+    one UPDATE for the holds and one for the stock. Holds that changed
+    state concurrently are skipped.
+    """
+    if not hold_ids:
+        return 0
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(hold_ids))
+    quantities = {}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # The queryset API can't say which rows an UPDATE matched
+            cursor.execute(
+                f'UPDATE {qn(StockHold._meta.db_table)} SET {qn("status")} = %s, {qn("updated")} = %s '
+                f'WHERE {qn("id")} IN ({placeholders}) AND {qn("status")} = %s '
+                f'RETURNING {qn("product_id")}, {qn("quantity")}',
+                [status, connection.ops.adapt_datetimefield_value(timezone.now()), *hold_ids, StockHold.HELD],
+            )
+            rows = cursor.fetchall()
+        for product_id, quantity in rows:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        if quantities:
+            release_stock(list(quantities.items()))
+    return len(rows)
+
+
+def release_holds(order):
+    """
+    Give back the stock held for ``order``, e.g. when its payment is cancelled.
+    """
+    hold_ids = list(order.stock_holds.filter(status=StockHold.HELD).values_list('pk', flat=True))
+    return _return_to_stock(hold_ids, StockHold.RELEASED)
+
+
+def lapsed_holds(now=None):
+    return StockHold.objects.filter(
+        status=StockHold.HELD, expires_at__lte=now or timezone.now(), order__paid=False,
+    )
+
+
+def expire_holds(now=None, batch_size=500):
+    """
+    Return stock for up to ``batch_size`` lapsed holds of unpaid orders.
+    Returns the number of holds expired, which is lower when some of the
+    batch were released, paid or expired by someone else meanwhile.
+    """
+    hold_ids = list(lapsed_holds(now).order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+    return _return_to_stock(hold_ids, StockHold.EXPIRED)
+
+
+def renew_holds(order):
+    """
+    Make sure ``order`` holds its stock before a payment attempt. Active
+    holds get a fresh deadline; if they were released or expired the stock is
+    reserved again. Raises InsufficientStock when it has sold out meanwhile.
+    Orders placed before holds existed have none and are left alone.
+    """
+    holds = order.stock_holds.all()
+    if holds.filter(status=StockHold.HELD).update(expires_at=hold_deadline(), updated=timezone.now()):
+        return
+    if not holds.exists() or holds.filter(status=StockHold.CONFIRMED).exists():
+        return
+    lines = [(item.product_id, item.quantity) for item in order.items.all()]
+    with transaction.atomic():
+        reserve_stock(lines)
+        place_holds(order, lines)
+
+
+def confirm_holds(order):
+    """
+    Keep the held stock for good: the order is paid or will be paid on
+    delivery. A payment that arrives after the holds lapsed takes the stock
+    again if it is still there.
+    """
+    if order.stock_holds.filter(status=StockHold.HELD).update(
+            status=StockHold.CONFIRMED, updated=timezone.now()):
+        return
+    holds = order.stock_holds.all()
+    if not holds.exists() or holds.filter(status=StockHold.CONFIRMED).exists():
+        return
+    lines = [(item.product_id, item.quantity) for item in order.items.all()]
+    try:
+        with transaction.atomic():
+            reserve_stock(lines)
+            now = timezone.now()
+            StockHold.objects.bulk_create([
+                StockHold(order=order, product_id=product_id, quantity=quantity,
+                          status=StockHold.CONFIRMED, expires_at=now)
+                for product_id, quantity in lines
+            ])
+    except InsufficientStock as e:
+        logger.error(f'Order {order.id} was paid after its stock hold lapsed and is short: {e}')
@@ -0,0 +1,140 @@
+"""
+Invoice PDF rendering service.
+
+An invoice is rendered once per order version and kept in the default
+storage backend under ``INVOICE_STORAGE_DIR/<order id>/<digest>.pdf``, where
+the digest is derived from the order id and its ``updated`` timestamp. Any
+change to the order gives it a new address, and older versions are removed
+when the new one is stored. The digest doubles as the HTTP ETag.
+
+PDF conversion runs in a process pool (INVOICE_RENDER_WORKERS processes), so
+web workers only render the HTML and never run xhtml2pdf themselves. The
+view asks the client to retry while a render is in flight, and the email
+worker, which may block, waits for the result.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+
+from utils.background import BackgroundPool
+from utils.pdf import html_to_pdf, pisa
+
+logger = logging.getLogger(__name__)
+
+LOGO = 'images/GIFTNEST.png'
+
+_pool = BackgroundPool('INVOICE_RENDER_WORKERS', 2)
+
+
+def invoice_digest(order):
+    version = f'{order.pk}:{order.updated.isoformat()}'
+    return hashlib.sha256(version.encode('utf-8')).hexdigest()[:32]
+
+
+def invoice_dir(order_id):
+    return f"{getattr(settings, 'INVOICE_STORAGE_DIR', 'invoices')}/{order_id}"
+
+
+def invoice_path(order):
+    return f'{invoice_dir(order.pk)}/{invoice_digest(order)}.pdf'
+
+
+def invoice_filename(order):
+    return f'invoice_order_{order.pk}.pdf'
+
+
+def render_invoice_html(order):
+    """
+    Invoice HTML for ``order``. The logo is referenced as a local file so
+    the PDF renderer doesn't fetch it over HTTP.
+    """
+    return render_to_string('orders/invoice.html', {'order': order, 'logo_path': finders.find(LOGO)})
+
+
+def stored_invoice(order):
+    """
+    Storage path of the current invoice for ``order``, or None if it hasn't
+    been rendered yet.
+    """
+    path = invoice_path(order)
+    return path if default_storage.exists(path) else None
+
+
+def store_invoice(order_id, path, pdf):
+    """
+    Save a rendered invoice at ``path`` and remove older versions.
+    """
+    if not default_storage.exists(path):
+        saved = default_storage.save(path, ContentFile(pdf))
+        if saved != path:
+            # Another process stored the same version first
+            default_storage.delete(saved)
+    directory = invoice_dir(order_id)
+    try:
+        _, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for name in files:
+        stale = f'{directory}/{name}'
+        if stale != path:
+            default_storage.delete(stale)
+
+
+def failure_key(path):
+    return f'orders:invoice_failed:{path}'
+
+
+def invoice_failed(order):
+    """
+    True if this version of the invoice couldn't be rendered as a PDF
+    within the last INVOICE_FAILURE_TIMEOUT seconds.
+    """
+    return cache.get(failure_key(invoice_path(order)), False)
+
+
+def request_invoice(order):
+    """
+    Start rendering the invoice for ``order`` in the process pool, unless
+    the same version is already being rendered. Returns a future whose
+    result is the storage path, or None if the PDF couldn't be rendered.
+    """
+    path = invoice_path(order)
+    order_id = order.pk
+
+    def store(render):
+        # Runs in the pool's result thread once the PDF is back
+        try:
+            pdf = render.result()
+            if pdf is None:
+                # Kept in the cache, so failures expire and are shared
+                # between processes instead of piling up in this one
+                cache.set(failure_key(path), True, getattr(settings, 'INVOICE_FAILURE_TIMEOUT', 3600))
+                return None
+            store_invoice(order_id, path, pdf)
+            return path
+        except Exception as e:
+            logger.error(f'Rendering the invoice for order {order_id} failed: {e}')
+            raise
+
+    return _pool.submit(path, html_to_pdf, render_invoice_html(order), on_done=store)
+
+
+def invoice_pdf(order, timeout=None):
+    """
+    Return the invoice PDF bytes for ``order``, rendering and storing it if
+    needed and waiting up to ``timeout`` seconds. For background jobs; views
+    should use stored_invoice() and request_invoice() instead.
+    """
+    if pisa is None:
+        return None
+    path = stored_invoice(order) or request_invoice(order).result(timeout=timeout)
+    if path is None:
+        return None
+    with default_storage.open(path, 'rb') as f:
+        return f.read()
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from orders.holds import expire_holds, lapsed_holds
+
+class Command(BaseCommand):
+    help = 'Return the stock of lapsed holds on unpaid orders, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Holds expired per UPDATE')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a worker instead of exiting')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = self.sweep(options['batch_size'])
+            if expired or options['verbosity'] > 1:
+                self.stdout.write(self.style.SUCCESS(f'Expired {expired} stock holds'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def sweep(self, batch_size):
+        total = 0
+        while True:
+            expired = expire_holds(batch_size=batch_size)
+            total += expired
+            # A short batch may only mean others moved some holds first
+            if expired < batch_size and not lapsed_holds().exists():
+                return total
@@ -0,0 +1,109 @@
+import datetime
+import multiprocessing
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from orders.invoices import invoice_filename, render_invoice_html, stored_invoice
+from orders.models import Order
+from utils.pdf import pisa, write_pdf
+
+class Command(BaseCommand):
+    help = 'Export the invoices of paid orders placed in a date range as one zip archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', type=datetime.date.fromisoformat, help='First order date (YYYY-MM-DD)')
+        parser.add_argument('end', type=datetime.date.fromisoformat, help='Last order date (YYYY-MM-DD), inclusive')
+        parser.add_argument('--output', help='Zip file to write (default invoices_<start>_<end>.zip)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Rendering processes')
+        parser.add_argument('--restart', action='store_true',
+                            help='Discard invoices rendered by an interrupted run instead of resuming it')
+
+    def handle(self, *args, **options):
+        if pisa is None:
+            raise CommandError('xhtml2pdf is not installed')
+        start, end = options['start'], options['end']
+        output = options['output'] or f'invoices_{start:%Y%m%d}_{end:%Y%m%d}.zip'
+        # Invoices are rendered into a staging directory first. A rerun skips
+        # the ones already there, so an interrupted export resumes where it
+        # stopped; the zip is assembled from disk at the end.
+        staging = f'{output}.parts'
+        if options['restart'] and os.path.isdir(staging):
+            shutil.rmtree(staging)
+        os.makedirs(staging, exist_ok=True)
+
+        orders = (
+            Order.objects.filter(paid=True, created__date__gte=start, created__date__lte=end)
+            .prefetch_related('items__product')
+            .order_by('created', 'id')
+        )
+        counts = {'rendered': 0, 'cached': 0, 'resumed': 0, 'failed': 0}
+        names = []
+        started = time.perf_counter()
+        window = options['workers'] * 4
+        in_flight = {}
+        next_report = 100
+
+        def collect(done):
+            nonlocal next_report
+            for future in done:
+                order_id = in_flight.pop(future)
+                try:
+                    size = future.result()
+                except Exception as e:
+                    size = None
+                    self.stderr.write(f'Order {order_id}: {e}')
+                counts['rendered' if size is not None else 'failed'] += 1
+            processed = counts['rendered'] + counts['failed']
+            if processed >= next_report:
+                next_report += 100
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'  {processed} rendered, {processed / elapsed:.1f} invoices/sec')
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+            for order in orders.iterator(chunk_size=500):
+                name = invoice_filename(order)
+                path = os.path.join(staging, name)
+                names.append(name)
+                if os.path.exists(path):
+                    counts['resumed'] += 1
+                    continue
+                stored = stored_invoice(order)
+                if stored is not None:
+                    # Already rendered for the site; copy it instead
+                    with default_storage.open(stored, 'rb') as src, open(path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    counts['cached'] += 1
+                    continue
+                if len(in_flight) >= window:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight[pool.submit(write_pdf, render_invoice_html(order), path)] = order.id
+            collect(wait(in_flight).done)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{len(names)} orders: {counts["rendered"]} rendered, {counts["cached"]} from the invoice '
+            f'cache, {counts["resumed"]} from an earlier run, {counts["failed"]} failed'
+        )
+        if counts['rendered']:
+            self.stdout.write(f'Rendering throughput: {counts["rendered"] / elapsed:.1f} invoices/sec')
+        if counts['failed']:
+            raise CommandError(
+                f'{counts["failed"]} invoices could not be rendered; run the command again to retry them'
+            )
+
+        # Entries are streamed from disk, so only one PDF is in memory at a time
+        partial = f'{output}.partial'
+        with zipfile.ZipFile(partial, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name in names:
+                archive.write(os.path.join(staging, name), arcname=name)
+        os.replace(partial, output)
+        shutil.rmtree(staging)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(names)} invoices to {output} in {time.perf_counter() - started:.1f}s'
+        ))
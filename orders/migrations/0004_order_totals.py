@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:11
+
+import orders.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    cost = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    totals = OrderItem.objects.values('order_id').annotate(total=Sum(cost), n=Sum('quantity')).order_by()
+    for row in totals:
+        Order.objects.filter(pk=row['order_id']).update(total=row['total'], item_count=row['n'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stockhold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='currency',
+            field=models.CharField(default=orders.models.default_currency, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['paid', 'created'], name='orders_orde_paid_374df1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total'], name='orders_orde_total_e60176_idx'),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,17 @@
+from decimal import Decimal
+from django.conf import settings
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
 from django.contrib.auth.models import User
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from products.models import Product
 
+def default_currency():
+    return getattr(settings, 'DEFAULT_CURRENCY', 'USD').upper()
+
+ITEM_COST = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     first_name = models.CharField(max_length=50)
@@ -15,18 +25,47 @@ class Order(models.Model):
     paid = models.BooleanField(default=False)
     stripe_id = models.CharField(max_length=250, blank=True)
     payment_intent_id = models.CharField(max_length=250, blank=True)
+    # Stored when the order is placed, so listings and revenue reports never
+    # have to read the order items
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    currency = models.CharField(max_length=3, default=default_currency)
 
     class Meta:
         ordering = ['-created']
         indexes = [
             models.Index(fields=['-created']),
+            models.Index(fields=['paid', 'created']),
+            models.Index(fields=['total']),
         ]
 
     def __str__(self):
         return f'Order {self.id}'
 
     def get_total_cost(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return self.total
+
+    @staticmethod
+    def totals_for(lines):
+        """
+        Return (total, item_count) for an iterable of (price, quantity).
+        """
+        total = Decimal('0')
+        item_count = 0
+        for price, quantity in lines:
+            total += price * quantity
+            item_count += quantity
+        return total, item_count
+
+    def update_totals(self):
+        """
+        Recompute total and item_count from the order items, e.g. after the
+        items were edited.
+        """
+        totals = self.items.aggregate(total=Sum(ITEM_COST), item_count=Sum('quantity'))
+        self.total = totals['total'] or Decimal('0')
+        self.item_count = totals['item_count'] or 0
+        Order.objects.filter(pk=self.pk).update(total=self.total, item_count=self.item_count)
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -39,3 +78,43 @@ class OrderItem(models.Model):
 
     def get_cost(self):
         return self.price * self.quantity
+
+class StockHold(models.Model):
+    """
+    Stock taken out of sale for an unpaid order. A hold is confirmed once the
+    order is paid (or placed as cash on delivery); until then it lapses at
+    ``expires_at`` and expire_stock_holds returns the quantity to stock.
+    """
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+        (EXPIRED, 'Expired'),
+    ]
+    ACTIVE = (HELD, CONFIRMED)
+
+    order = models.ForeignKey(Order, related_name='stock_holds', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='stock_holds', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} for order {self.order_id} ({self.status})'
+
+@receiver(post_save, sender=Order)
+def confirm_paid_order_holds(sender, instance, **kwargs):
+    if instance.paid:
+        from .holds import confirm_holds
+        confirm_holds(instance)
@@ -1,3 +1,175 @@
-from django.test import TestCase
+import io
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
\ No newline at end of file
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Product
+from .holds import _return_to_stock, expire_holds, place_holds, release_holds
+from . import invoices
+from .invoices import invoice_failed, invoice_path, invoice_pdf, request_invoice
+from .models import Order, OrderItem, StockHold
+
+
+class StockHoldTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.product = Product.objects.create(name='Tea Set', slug='tea-set', price=10, stock=8)
+        self.order = Order.objects.create(
+            user=self.user, first_name='A', last_name='B', email='buyer@example.com',
+            address='1 Road', postal_code='1', city='Town',
+        )
+        place_holds(self.order, [(self.product.pk, 2)])
+        self.hold = self.order.stock_holds.get()
+
+    def stock(self):
+        return Product.objects.values_list('stock', flat=True).get(pk=self.product.pk)
+
+    def test_release_returns_stock_once(self):
+        self.assertEqual(release_holds(self.order), 1)
+        self.assertEqual(release_holds(self.order), 0)
+        StockHold.objects.filter(pk=self.hold.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(expire_holds(), 0)
+        self.assertEqual(self.stock(), 10)
+
+    def test_expire_returns_lapsed_holds(self):
+        StockHold.objects.filter(pk=self.hold.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(expire_holds(), 1)
+        self.assertEqual(StockHold.objects.get(pk=self.hold.pk).status, StockHold.EXPIRED)
+        self.assertEqual(self.stock(), 10)
+
+    def test_hold_changed_after_select_is_not_restocked(self):
+        # A concurrent expiry moves the hold on after we picked its id
+        StockHold.objects.filter(pk=self.hold.pk).update(status=StockHold.EXPIRED)
+        self.assertEqual(_return_to_stock([self.hold.pk], StockHold.RELEASED), 0)
+        self.assertEqual(StockHold.objects.get(pk=self.hold.pk).status, StockHold.EXPIRED)
+        self.assertEqual(self.stock(), 8)
+
+    def test_sweep_continues_past_a_short_batch(self):
+        place_holds(self.order, [(self.product.pk, 1), (self.product.pk, 1)])
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        calls = []
+
+        def expire(batch_size):
+            # Someone else moved half of the first batch
+            calls.append(batch_size)
+            return expire_holds(batch_size=1 if len(calls) == 1 else batch_size)
+
+        with mock.patch('orders.management.commands.expire_stock_holds.expire_holds', side_effect=expire):
+            call_command('expire_stock_holds', batch_size=2, stdout=io.StringIO())
+        self.assertFalse(StockHold.objects.filter(status=StockHold.HELD).exists())
+        self.assertEqual(self.stock(), 12)
+
+
+class InvoiceTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=media)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.order = Order.objects.create(
+            user=user, first_name='A', last_name='B', email='buyer@example.com',
+            address='1 Road', postal_code='1', city='Town',
+        )
+
+    def test_invoice_is_rendered_in_the_pool_and_stored(self):
+        future = request_invoice(self.order)
+        self.assertIs(request_invoice(self.order), future)
+        self.assertEqual(future.result(timeout=60), invoice_path(self.order))
+        self.assertTrue(invoice_pdf(self.order).startswith(b'%PDF'))
+
+    def test_failed_render_is_remembered_per_version(self):
+        def submit(key, fn, *args, on_done):
+            # The worker couldn't convert the HTML
+            render = Future()
+            render.set_result(None)
+            return on_done(render)
+
+        with mock.patch.object(invoices._pool, 'submit', side_effect=submit):
+            self.assertIsNone(request_invoice(self.order))
+        self.assertTrue(invoice_failed(self.order))
+        self.order.city = 'Elsewhere'
+        self.order.save()
+        self.assertFalse(invoice_failed(self.order))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    buyers = 20
+    stock = 15
+
+    def checkout(self, client, details, attempts=50):
+        # SQLite serialises writers and reports contention as a locked
+        # database, or as a 400 when it's the session save that loses. The
+        # stock invariant holds either way, so just resubmit
+        for attempt in range(attempts):
+            try:
+                response = client.post(reverse('orders:order_create'), details)
+            except OperationalError:
+                if attempt == attempts - 1:
+                    raise
+            else:
+                if response.status_code != 400 and b'is locked' not in response.content:
+                    return response
+            time.sleep(0.01 * (attempt + 1))
+        return response
+
+    def test_parallel_checkouts_never_oversell(self):
+        product = Product.objects.create(name='Contested', slug='contested', price=5, stock=self.stock)
+        details = {
+            'first_name': 'Load', 'last_name': 'Test', 'email': 'load@example.com',
+            'address': '1 Test Street', 'postal_code': '00000', 'city': 'Testville',
+        }
+        rng = random.Random(0)
+        clients = []
+        for i in range(self.buyers):
+            client = Client()
+            client.force_login(User.objects.create_user(username=f'buyer-{i}'))
+            client.post(reverse('cart:cart_add', args=[product.id]), {'quantity': rng.randint(1, 2)})
+            clients.append(client)
+
+        outcomes = []
+        barrier = threading.Barrier(self.buyers)
+
+        def buyer(client):
+            try:
+                # Release every checkout at once
+                barrier.wait()
+                response = self.checkout(client, details)
+                if response.status_code == 302:
+                    outcomes.append('ordered')
+                elif b'items available' in response.content:
+                    outcomes.append('sold_out')
+                else:
+                    outcomes.append(f'HTTP {response.status_code}')
+            except Exception as exc:
+                outcomes.append(repr(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([outcome for outcome in outcomes if outcome not in ('ordered', 'sold_out')], [])
+        product.refresh_from_db()
+        sold = OrderItem.objects.filter(product=product).aggregate(n=Sum('quantity'))['n'] or 0
+        self.assertGreater(sold, 0)
+        self.assertGreaterEqual(product.stock, 0)
+        self.assertEqual(sold + product.stock, self.stock)
+        self.assertEqual(StockHold.objects.filter(product=product).aggregate(n=Sum('quantity'))['n'], sold)
@@ -3,38 +3,37 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
 from .models import OrderItem, Order
+from .holds import place_holds
 from cart.cart import Cart
 from products.models import Product
+from products.inventory import InsufficientStock, reserve_stock
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.template.loader import render_to_string
-from django.http import HttpResponse
-import io
-try:
-    from xhtml2pdf import pisa  # type: ignore
-except Exception:
-    pisa = None
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from utils.pdf import pisa
+from .invoices import (
+    invoice_digest, invoice_failed, invoice_filename, request_invoice, stored_invoice,
+)
 
 @login_required
 def order_create(request):
     cart = Cart(request)
+    cart.hydrate()
     if len(cart) == 0:
         return redirect('cart:cart_detail')
     
     if request.method == 'POST':
-        # First, check stock availability for all items
-        stock_errors = []
-        for item in cart:
-            product = item['product']
-            if product.stock < item['quantity']:
-                stock_errors.append(f"{product.name}: Only {product.stock} items available, but {item['quantity']} requested")
-        
-        if stock_errors:
-            for error in stock_errors:
-                messages.error(request, error)
-            return render(request, 'orders/create.html', {'cart': cart})
-        
+        items = list(cart)
         # Use transaction to ensure atomicity
         try:
             with transaction.atomic():
+                # All lines are taken from stock in one conditional UPDATE,
+                # so concurrent checkouts can't oversell.
+                lines = [(item['product'].id, item['quantity']) for item in items]
+                reserve_stock(lines)
+                total, item_count = Order.totals_for((item['price'], item['quantity']) for item in items)
                 order = Order.objects.create(
                     user=request.user,
                     first_name=request.POST['first_name'],
@@ -42,25 +41,36 @@ def order_create(request):
                     email=request.POST['email'],
                     address=request.POST['address'],
                     postal_code=request.POST['postal_code'],
-                    city=request.POST['city']
+                    city=request.POST['city'],
+                    total=total,
+                    item_count=item_count,
                 )
-                for item in cart:
-                    OrderItem.objects.create(
+                OrderItem.objects.bulk_create([
+                    OrderItem(
                         order=order,
                         product=item['product'],
                         price=item['price'],
                         quantity=item['quantity']
                     )
-                    # Reduce stock safely
-                    product = item['product']
-                    product.stock -= item['quantity']
-                    product.save()
-                cart.clear()
-                messages.success(request, 'Order created successfully!')
-                return redirect('payment:process', order_id=order.id)
+                    for item in items
+                ])
+                # Stock comes back if the order isn't paid in time
+                place_holds(order, lines)
+        except InsufficientStock as e:
+            names = {item['product'].id: item['product'].name for item in items}
+            for shortfall in e.shortfalls:
+                name = names.get(shortfall.product_id, shortfall.product_id)
+                if shortfall.available is None:
+                    messages.error(request, f"{name}: stock is changing quickly, please try again")
+                else:
+                    messages.error(request, f"{name}: Only {shortfall.available} items available, but {shortfall.requested} requested")
+            return render(request, 'orders/create.html', {'cart': cart})
         except Exception as e:
             messages.error(request, f'An error occurred while creating the order: {str(e)}')
             return render(request, 'orders/create.html', {'cart': cart})
+        cart.clear()
+        messages.success(request, 'Order created successfully!')
+        return redirect('payment:process', order_id=order.id)
     return render(request, 'orders/create.html', {
         'cart': cart
     })
@@ -73,15 +83,34 @@ def order_detail(request, id):
 @login_required
 def order_invoice_pdf(request, id):
     order = get_object_or_404(Order, id=id, user=request.user)
-    html = render_to_string('orders/invoice.html', {'order': order}, request=request)
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="invoice_order_{order.id}.pdf"'
+    if pisa is None or invoice_failed(order):
+        return HttpResponse(render_to_string('orders/invoice.html', {'order': order}, request=request))
+
+    etag = f'"{invoice_digest(order)}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    path = stored_invoice(order)
+    if path is None:
+        # Rendering happens in the invoice process pool; don't tie up this
+        # worker waiting for it.
+        try:
+            path = request_invoice(order).result(timeout=getattr(settings, 'INVOICE_RENDER_WAIT', 0))
+        except TimeoutError:
+            response = render(request, 'orders/invoice_pending.html', {'order': order}, status=202)
+            response['Retry-After'] = '2'
+            response['Refresh'] = '2'
+            return response
+        if path is None:
+            return HttpResponse(render_to_string('orders/invoice.html', {'order': order}, request=request))
 
-    if pisa is None:
-        return HttpResponse(html)
-    result = io.BytesIO()
-    pdf_status = pisa.CreatePDF(io.BytesIO(html.encode('utf-8')), dest=result, encoding='utf-8')
-    if pdf_status.err:
-        return HttpResponse(html)
-    response.write(result.getvalue())
+    response = FileResponse(
+        default_storage.open(path, 'rb'),
+        as_attachment=True,
+        filename=invoice_filename(order),
+        content_type='application/pdf',
+    )
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
     return response
@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import WebhookEvent
 
-# Register your models here.
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'gateway', 'event_type', 'event_id', 'status', 'attempts', 'received', 'processed_at']
+    list_filter = ['gateway', 'status', 'event_type']
+    search_fields = ['event_id', 'last_error']
+    readonly_fields = ['received', 'processed_at']
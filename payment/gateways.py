@@ -0,0 +1,316 @@
+"""
+Payment gateway clients.
+
+Views reach Razorpay and Stripe only through ``get_gateway(name)``. The
+PAYMENT_GATEWAYS setting maps a gateway name to the dotted path of its class,
+so a deployment, a test (see payment/tests.py) or the benchmark_payments
+command can swap in ``FakeRazorpayGateway`` / ``FakeStripeGateway``. The
+fakes answer in-process (after PAYMENT_FAKE_GATEWAY_LATENCY seconds) and sign
+their payment signatures and webhooks with the same HMAC schemes as the real
+gateways, so the verifying views run unchanged.
+
+API calls go through GatewayClient.call(), which applies the gateway's
+circuit breaker and records latency metrics (see payment.health). The real
+clients share a keep-alive connection pool per gateway with connect and read
+timeouts of PAYMENT_GATEWAY_CONNECT_TIMEOUT / PAYMENT_GATEWAY_READ_TIMEOUT
+seconds, so a slow gateway can't hold a web worker for long.
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import razorpay
+import requests
+import stripe.checkout
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+from .health import ERROR, OK, REJECTED, CircuitBreaker, GatewayUnavailable, record_call
+
+DEFAULT_GATEWAYS = {
+    'razorpay': 'payment.gateways.RazorpayGateway',
+    'stripe': 'payment.gateways.StripeGateway',
+}
+
+_gateways = {}
+_lock = threading.Lock()
+
+
+def get_gateway(name):
+    """
+    The configured client for gateway ``name`` ('razorpay' or 'stripe').
+    """
+    gateway = _gateways.get(name)
+    if gateway is None:
+        with _lock:
+            gateway = _gateways.get(name)
+            if gateway is None:
+                backends = {**DEFAULT_GATEWAYS, **getattr(settings, 'PAYMENT_GATEWAYS', {})}
+                gateway = _gateways[name] = import_string(backends[name])()
+    return gateway
+
+
+@receiver(setting_changed)
+def reset_gateways(*, setting, **kwargs):
+    # Clients read their keys once; rebuild them under override_settings
+    if setting.startswith(('PAYMENT_', 'RAZORPAY_', 'STRIPE_')):
+        with _lock:
+            _gateways.clear()
+
+
+def razorpay_signature(secret, message):
+    """
+    Hex HMAC-SHA256 of ``message`` (bytes or str), as Razorpay signs
+    payments and webhooks.
+    """
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+class GatewaySession(requests.Session):
+    """
+    A requests session with a pool of keep-alive connections and a default
+    (connect, read) timeout. Failed requests are not retried here; payment
+    calls aren't safe to repeat blindly.
+    """
+    def __init__(self):
+        super().__init__()
+        self.timeout = (
+            getattr(settings, 'PAYMENT_GATEWAY_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'PAYMENT_GATEWAY_READ_TIMEOUT', 10),
+        )
+        pool_size = getattr(settings, 'PAYMENT_GATEWAY_POOL_SIZE', 10)
+        self.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+class GatewayClient:
+    """
+    Base class of the gateway clients. ``client_errors`` are errors where the
+    gateway answered normally but refused the request; they don't count
+    against its health.
+    """
+    name = None
+    operations = ()
+    configured = False
+    client_errors = ()
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(self.name)
+
+    @property
+    def available(self):
+        """
+        Whether the payment method should be offered right now.
+        """
+        return self.configured and not self.breaker.is_open()
+
+    def call(self, operation, func, *args, **kwargs):
+        if not self.breaker.allow():
+            record_call(self.name, operation, 0, REJECTED)
+            raise GatewayUnavailable(f'{self.name} is temporarily unavailable')
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except self.client_errors:
+            record_call(self.name, operation, time.perf_counter() - start, ERROR)
+            self.breaker.success()
+            raise
+        except Exception:
+            record_call(self.name, operation, time.perf_counter() - start, ERROR)
+            self.breaker.failure()
+            raise
+        elapsed = time.perf_counter() - start
+        record_call(self.name, operation, elapsed, OK)
+        if elapsed > getattr(settings, 'PAYMENT_GATEWAY_SLOW_CALL', 5):
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return result
+
+
+class RazorpayGateway(GatewayClient):
+    name = 'razorpay'
+    operations = ('create_order',)
+    client_errors = (razorpay.errors.BadRequestError,)
+
+    def __init__(self):
+        super().__init__()
+        self.key_id = settings.RAZORPAY_KEY_ID
+        self.client = None
+        if settings.RAZORPAY_KEY_ID and settings.RAZORPAY_KEY_SECRET:
+            self.client = razorpay.Client(
+                session=GatewaySession(), auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+            )
+
+    @property
+    def configured(self):
+        return self.client is not None
+
+    def create_order(self, amount, currency, receipt):
+        """
+        Create a Razorpay order for ``amount`` in the smallest currency unit.
+        Returns a dict with 'id', 'amount' and 'currency'.
+        """
+        return self.call('create_order', self.client.order.create, {
+            'amount': amount,
+            'currency': currency,
+            'receipt': receipt,
+            'payment_capture': 1,
+        })
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        """
+        Check the signature Checkout returned for a payment. Raises on a
+        mismatch.
+        """
+        self.client.utility.verify_payment_signature({
+            'razorpay_order_id': order_id,
+            'razorpay_payment_id': payment_id,
+            'razorpay_signature': signature,
+        })
+
+
+class StripeGateway(GatewayClient):
+    name = 'stripe'
+    operations = ('create_checkout_session',)
+    client_errors = (stripe.error.CardError, stripe.error.InvalidRequestError, stripe.error.IdempotencyError)
+
+    def __init__(self):
+        super().__init__()
+        self.api_key = settings.STRIPE_SECRET_KEY
+        if self.api_key:
+            # stripe 7 takes the HTTP client from a module global
+            session = GatewaySession()
+            stripe.default_http_client = stripe.http_client.RequestsClient(timeout=session.timeout, session=session)
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def create_checkout_session(self, **session_data):
+        """
+        Create a Checkout Session. Returns an object with 'id' and
+        'payment_intent'.
+        """
+        return self.call('create_checkout_session', stripe.checkout.Session.create, api_key=self.api_key, **session_data)
+
+
+class FakeGatewayError(Exception):
+    pass
+
+
+class FakeGateway(GatewayClient):
+    """
+    Shared behaviour of the in-process gateways: a simulated API round trip
+    that fails PAYMENT_FAKE_GATEWAY_FAILURE_RATE of the time, and unique ids.
+    """
+    configured = True
+
+    def __init__(self):
+        super().__init__()
+        self.latency = getattr(settings, 'PAYMENT_FAKE_GATEWAY_LATENCY', 0)
+        self.failure_rate = getattr(settings, 'PAYMENT_FAKE_GATEWAY_FAILURE_RATE', 0)
+        self._ids = itertools.count(1)
+
+    def round_trip(self, response):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise FakeGatewayError(f'{self.name} returned 503')
+        return response
+
+    def new_id(self, prefix):
+        return f'{prefix}_fake{uuid.uuid4().hex[:10]}{next(self._ids)}'
+
+
+class FakeRazorpayGateway(FakeGateway):
+    name = 'razorpay'
+    operations = ('create_order',)
+
+    def __init__(self):
+        super().__init__()
+        self.key_id = settings.RAZORPAY_KEY_ID or 'rzp_test_fake'
+        self.key_secret = settings.RAZORPAY_KEY_SECRET or 'fake-key-secret'
+
+    def create_order(self, amount, currency, receipt):
+        order = {'id': self.new_id('order'), 'amount': amount, 'currency': currency, 'receipt': receipt}
+        return self.call('create_order', self.round_trip, order)
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        if not hmac.compare_digest(razorpay_signature(self.key_secret, f'{order_id}|{payment_id}'), signature):
+            raise razorpay.errors.SignatureVerificationError('Razorpay Signature Verification Failed')
+
+    def pay(self, order_id):
+        """
+        Simulate the customer completing Checkout for ``order_id``. Returns
+        what Checkout hands the browser: the payment id and its signature.
+        """
+        payment_id = self.new_id('pay')
+        return payment_id, razorpay_signature(self.key_secret, f'{order_id}|{payment_id}')
+
+    def payment_captured_webhook(self, order_id, payment_id, amount, currency='INR'):
+        """
+        A signed payment.captured delivery. Returns (body, headers) with
+        headers keyed as request.META names.
+        """
+        body = json.dumps({
+            'entity': 'event',
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {
+                'id': payment_id, 'order_id': order_id, 'amount': amount,
+                'currency': currency, 'status': 'captured',
+            }}},
+            'created_at': int(time.time()),
+        }).encode('utf-8')
+        return body, {
+            'HTTP_X_RAZORPAY_SIGNATURE': razorpay_signature(settings.RAZORPAY_WEBHOOK_SECRET, body),
+            'HTTP_X_RAZORPAY_EVENT_ID': self.new_id('evt'),
+        }
+
+
+class FakeStripeGateway(FakeGateway):
+    name = 'stripe'
+    operations = ('create_checkout_session',)
+
+    def create_checkout_session(self, **session_data):
+        session = SimpleNamespace(
+            id=self.new_id('cs'), payment_intent=self.new_id('pi'),
+            client_reference_id=session_data.get('client_reference_id'),
+        )
+        return self.call('create_checkout_session', self.round_trip, session)
+
+    def checkout_completed_webhook(self, session):
+        """
+        A checkout.session.completed delivery for ``session``, signed for
+        stripe.Webhook.construct_event. Returns (body, headers).
+        """
+        body = json.dumps({
+            'id': self.new_id('evt'),
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'data': {'object': {
+                'id': session.id, 'object': 'checkout.session',
+                'client_reference_id': session.client_reference_id,
+                'payment_intent': session.payment_intent, 'payment_status': 'paid',
+            }},
+        })
+        timestamp = int(time.time())
+        signature = hmac.new(
+            settings.STRIPE_WEBHOOK_SECRET.encode('utf-8'), f'{timestamp}.{body}'.encode('utf-8'), hashlib.sha256,
+        ).hexdigest()
+        return body.encode('utf-8'), {'HTTP_STRIPE_SIGNATURE': f't={timestamp},v1={signature}'}
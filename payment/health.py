@@ -0,0 +1,153 @@
+"""
+Payment gateway health: circuit breakers and call latency metrics.
+
+Both live in the default cache, so with a shared cache (CACHE_URL) every
+worker sees the same state; with the local-memory default they are per
+process, and the gateway_status command refuses to report them.
+
+A gateway's circuit opens after PAYMENT_CIRCUIT_FAILURES consecutive failed
+or slow calls (slower than PAYMENT_GATEWAY_SLOW_CALL seconds). While it is
+open, calls fail fast with GatewayUnavailable and the payment method is not
+offered. After PAYMENT_CIRCUIT_OPEN_SECONDS a single trial call is let
+through; it closes the circuit on success and reopens it on failure.
+
+Every call is counted per gateway and operation, with its latency in one of
+LATENCY_BUCKETS, which is enough to estimate percentiles across workers.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+OK, ERROR, REJECTED = 'ok', 'error', 'rejected'
+
+
+class GatewayUnavailable(Exception):
+    pass
+
+
+def shared_state():
+    """
+    Whether breakers and metrics are seen by every process, rather than
+    kept separately by each one.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _incr(key, delta=1):
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, delta, None)
+        return delta
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.key = f'payment:circuit:{name}'
+
+    @property
+    def threshold(self):
+        return getattr(settings, 'PAYMENT_CIRCUIT_FAILURES', 5)
+
+    def failures(self):
+        return cache.get(f'{self.key}:failures', 0)
+
+    def is_open(self):
+        return cache.get(f'{self.key}:open') is not None
+
+    def state(self):
+        if self.is_open():
+            return 'open'
+        return 'half-open' if self.failures() >= self.threshold else 'closed'
+
+    def allow(self):
+        """
+        Whether a call may go ahead. After the open period only one trial
+        call is allowed at a time.
+        """
+        if self.is_open():
+            return False
+        if self.failures() < self.threshold:
+            return True
+        return cache.add(f'{self.key}:trial', True, getattr(settings, 'PAYMENT_GATEWAY_SLOW_CALL', 5) * 2)
+
+    def success(self):
+        if self.failures():
+            logger.info(f'Payment gateway {self.name} recovered')
+            cache.delete_many([f'{self.key}:failures', f'{self.key}:trial'])
+
+    def failure(self):
+        failures = _incr(f'{self.key}:failures')
+        if failures >= self.threshold:
+            seconds = getattr(settings, 'PAYMENT_CIRCUIT_OPEN_SECONDS', 60)
+            cache.set(f'{self.key}:open', True, seconds)
+            cache.delete(f'{self.key}:trial')
+            logger.warning(
+                f'Payment gateway {self.name} failed {failures} times in a row; '
+                f'not using it for {seconds}s'
+            )
+
+
+def _metric_key(gateway, operation, name):
+    return f'payment:metrics:{gateway}:{operation}:{name}'
+
+
+def record_call(gateway, operation, seconds, outcome):
+    """
+    Count one gateway call with its outcome (OK, ERROR or REJECTED) and
+    latency.
+    """
+    _incr(_metric_key(gateway, operation, outcome))
+    if outcome == REJECTED:
+        return
+    bucket = next((bound for bound in LATENCY_BUCKETS if seconds <= bound), 'inf')
+    _incr(_metric_key(gateway, operation, f'le:{bucket}'))
+    _incr(_metric_key(gateway, operation, 'ms'), int(seconds * 1000))
+    logger.debug(f'{gateway}.{operation} {outcome} in {seconds * 1000:.0f}ms')
+
+
+def _percentile(histogram, count, q):
+    target = q * count
+    seen = 0
+    for bound, n in histogram:
+        seen += n
+        if seen >= target:
+            return bound
+    return None
+
+
+def call_metrics(gateway, operation):
+    """
+    Totals for one gateway operation. Percentiles are bucket upper bounds in
+    seconds (float('inf') beyond the last bucket), or None without calls.
+    """
+    bounds = [*LATENCY_BUCKETS, 'inf']
+    names = [OK, ERROR, REJECTED, 'ms', *(f'le:{bound}' for bound in bounds)]
+    values = cache.get_many([_metric_key(gateway, operation, name) for name in names])
+    value = lambda name: values.get(_metric_key(gateway, operation, name), 0)
+    histogram = [(float(bound), value(f'le:{bound}')) for bound in bounds]
+    timed = value(OK) + value(ERROR)
+    return {
+        'calls': timed + value(REJECTED),
+        'errors': value(ERROR),
+        'rejected': value(REJECTED),
+        'mean': value('ms') / 1000 / timed if timed else None,
+        'p50': _percentile(histogram, timed, 0.5) if timed else None,
+        'p99': _percentile(histogram, timed, 0.99) if timed else None,
+    }
+
+
+def reset_metrics(gateway, operation):
+    names = [OK, ERROR, REJECTED, 'ms', *(f'le:{bound}' for bound in (*LATENCY_BUCKETS, 'inf'))]
+    cache.delete_many([_metric_key(gateway, operation, name) for name in names])
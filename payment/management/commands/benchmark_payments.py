@@ -0,0 +1,203 @@
+import json
+import statistics
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from notifications.models import OutgoingEmail
+from orders.models import Order
+from payment.gateways import get_gateway
+from payment.models import WebhookEvent
+from payment.webhooks import process_pending
+from products.models import Product
+
+STEPS = ['cart', 'order', 'payment', 'verify', 'webhook', 'apply']
+
+class Command(BaseCommand):
+    help = 'Drive order -> payment -> webhook against the fake payment gateways and report latency per step'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100, help='Checkouts to run')
+        parser.add_argument('--concurrency', type=int, default=8, help='Checkouts in flight at once')
+        parser.add_argument('--gateway', choices=['razorpay', 'stripe'], default='razorpay')
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help='Seconds the fake gateway takes per API call')
+        parser.add_argument('--keep', action='store_true', help='Keep the test products, users and orders afterwards')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        gateway_name = options['gateway']
+        product = Product.objects.create(
+            name=f'Payment benchmark {run_id}', slug=f'payment-benchmark-{run_id}',
+            price=5, stock=options['orders'],
+        )
+        users = [
+            User.objects.create_user(username=f'payment-bench-{run_id}-{i}', email=f'bench{i}@example.com')
+            for i in range(options['orders'])
+        ]
+        details = {
+            'first_name': 'Load', 'last_name': 'Test', 'email': 'load@example.com',
+            'address': '1 Test Street', 'postal_code': '00000', 'city': 'Testville',
+        }
+        timings = {step: [] for step in STEPS}
+        errors = []
+        event_ids = []
+        lock = threading.Lock()
+
+        def timed(step, request):
+            start = time.perf_counter()
+            response = self.retry(request)
+            elapsed = time.perf_counter() - start
+            with lock:
+                timings[step].append(elapsed)
+            return response
+
+        def expect(step, response, status):
+            if response.status_code != status:
+                raise CommandError(f'{step}: HTTP {response.status_code} {response.content[:200]!r}')
+            return response
+
+        def checkout(user):
+            client = Client()
+            client.force_login(user)
+            gateway = get_gateway(gateway_name)
+            try:
+                expect('cart', timed('cart', lambda: client.post(
+                    reverse('cart:cart_add', args=[product.id]), {'quantity': 1})), 302)
+                response = expect('order', timed('order', lambda: client.post(
+                    reverse('orders:order_create'), details)), 302)
+                order_id = int(response.url.rstrip('/').rsplit('/', 1)[-1])
+                pay_url = reverse('payment:process', args=[order_id])
+                created = expect('payment', timed('payment', lambda: client.post(
+                    f'{pay_url}?method={gateway_name}')), 200).json()
+
+                if gateway_name == 'razorpay':
+                    # Checkout returns to the browser and the gateway calls
+                    # the webhook; both report the same payment.
+                    payment_id, signature = gateway.pay(created['order_id'])
+                    expect('verify', timed('verify', lambda: client.post(
+                        reverse('payment:razorpay_verify'), {
+                            'razorpay_order_id': created['order_id'],
+                            'razorpay_payment_id': payment_id,
+                            'razorpay_signature': signature,
+                        }, content_type='application/json')), 200)
+                    body, headers = gateway.payment_captured_webhook(
+                        created['order_id'], payment_id, created['amount'])
+                    url = reverse('payment:razorpay_webhook')
+                else:
+                    order = Order.objects.get(pk=order_id)
+                    session = SimpleNamespace(
+                        id=created['sessionId'], payment_intent=order.payment_intent_id,
+                        client_reference_id=order_id,
+                    )
+                    body, headers = gateway.checkout_completed_webhook(session)
+                    url = reverse('payment:stripe_webhook')
+                with lock:
+                    event_ids.append(headers.get('HTTP_X_RAZORPAY_EVENT_ID') or json.loads(body)['id'])
+                webhook = Client()
+                expect('webhook', timed('webhook', lambda: webhook.post(
+                    url, body, content_type='application/json', **headers)), 200)
+            except Exception as e:
+                with lock:
+                    errors.append(f'{user.username}: {e}')
+            finally:
+                connection.close()
+
+        gateway_settings = {
+            'ALLOWED_HOSTS': ['testserver'],
+            'PAYMENT_GATEWAYS': {
+                'razorpay': 'payment.gateways.FakeRazorpayGateway',
+                'stripe': 'payment.gateways.FakeStripeGateway',
+            },
+            'PAYMENT_FAKE_GATEWAY_LATENCY': options['latency'],
+            'RAZORPAY_ENABLED': True,
+            'RAZORPAY_WEBHOOK_SECRET': 'benchmark-razorpay-secret',
+            'STRIPE_ENABLED': True,
+            'STRIPE_WEBHOOK_SECRET': 'benchmark-stripe-secret',
+        }
+        if connection.vendor == 'sqlite':
+            # Take the write lock when a transaction starts, so concurrent
+            # writers wait for each other instead of failing on upgrade
+            connection.settings_dict['OPTIONS'].setdefault('transaction_mode', 'IMMEDIATE')
+            connection.close()
+        finished = threading.Event()
+
+        def processor():
+            # Stands in for a process_webhooks --loop worker
+            try:
+                while True:
+                    if not sum(process_pending(100).values()):
+                        if finished.is_set():
+                            break
+                        time.sleep(0.05)
+            finally:
+                connection.close()
+
+        with override_settings(**gateway_settings):
+            worker = threading.Thread(target=processor)
+            worker.start()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                list(pool.map(checkout, users))
+            checkout_time = time.perf_counter() - start
+            finished.set()
+            worker.join()
+
+        orders = Order.objects.filter(user__in=users)
+        events = WebhookEvent.objects.filter(gateway=gateway_name, event_id__in=event_ids)
+        timings['apply'] = [
+            (processed - received).total_seconds()
+            for received, processed in events.filter(status=WebhookEvent.PROCESSED).values_list('received', 'processed_at')
+        ]
+        paid = orders.filter(paid=True).count()
+        confirmations = OutgoingEmail.objects.filter(
+            subject__in=[f'Payment Confirmation - Order #{pk}' for pk in orders.values_list('pk', flat=True)],
+        )
+        emails = confirmations.count()
+
+        self.stdout.write(
+            f'{options["orders"]} {gateway_name} checkouts, {options["concurrency"]} at a time, '
+            f'{options["latency"] * 1000:.0f}ms gateway latency: {checkout_time:.2f}s '
+            f'({options["orders"] / checkout_time:.1f} checkouts/sec)'
+        )
+        for step in STEPS:
+            latencies = sorted(timings[step])
+            if not latencies:
+                continue
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f'  {step:<8} n={len(latencies):<5} p50={statistics.median(latencies) * 1000:8.1f}ms '
+                f'p99={p99 * 1000:8.1f}ms'
+            )
+        self.stdout.write('  (apply: from webhook receipt until the event was processed)')
+        self.stdout.write(f'  {paid} orders paid, {emails} confirmation emails queued')
+        for error in errors[:10]:
+            self.stderr.write(error)
+
+        if not options['keep']:
+            confirmations.delete()
+            events.delete()
+            orders.delete()
+            product.delete()
+            User.objects.filter(username__startswith=f'payment-bench-{run_id}-').delete()
+
+        if errors:
+            raise CommandError(f'{len(errors)} checkout(s) failed')
+        if paid != options['orders'] or emails != options['orders']:
+            raise CommandError(f'Expected {options["orders"]} paid orders and confirmation emails')
+        self.stdout.write(self.style.SUCCESS('Every order was paid exactly once'))
+
+    def retry(self, request, attempts=20):
+        # A view that caught "database is locked" rolled back, so resubmit
+        for attempt in range(attempts):
+            response = request()
+            if b'database is locked' not in response.content:
+                return response
+            time.sleep(0.01 * (attempt + 1))
+        return response
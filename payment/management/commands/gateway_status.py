@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from payment.gateways import DEFAULT_GATEWAYS, get_gateway
+from payment.health import call_metrics, reset_metrics, shared_state
+
+class Command(BaseCommand):
+    help = 'Show payment gateway circuit breaker state and call latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Clear the latency metrics after showing them')
+
+    def handle(self, *args, **options):
+        if not shared_state():
+            # This process would only see its own, empty, breakers and metrics
+            raise CommandError(
+                'Gateway health is kept in a per-process cache; set CACHE_URL to a shared cache '
+                'to see what the web workers recorded'
+            )
+        for name in DEFAULT_GATEWAYS:
+            gateway = get_gateway(name)
+            if not gateway.configured:
+                self.stdout.write(f'{name}: not configured')
+                continue
+            breaker = gateway.breaker
+            self.stdout.write(f'{name}: circuit {breaker.state()}, {breaker.failures()} failure(s) in a row')
+            for operation in gateway.operations:
+                metrics = call_metrics(name, operation)
+                if not metrics['calls']:
+                    self.stdout.write(f'  {operation}: no calls')
+                    continue
+                line = f'  {operation}: {metrics["calls"]} calls, {metrics["errors"]} errors, {metrics["rejected"]} rejected'
+                if metrics['mean'] is not None:
+                    line += (
+                        f', mean {metrics["mean"] * 1000:.0f}ms, p50 <= {self.format(metrics["p50"])}, '
+                        f'p99 <= {self.format(metrics["p99"])}'
+                    )
+                self.stdout.write(line)
+                if options['reset']:
+                    reset_metrics(name, operation)
+        if options['reset']:
+            self.stdout.write(self.style.SUCCESS('Metrics cleared'))
+
+    def format(self, seconds):
+        return 'inf' if seconds == float('inf') else f'{seconds * 1000:.0f}ms'
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from payment.webhooks import process_pending
+
+class Command(BaseCommand):
+    help = 'Apply stored payment webhook events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Events claimed at a time')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a worker instead of exiting')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to sleep when no events are due')
+
+    def handle(self, *args, **options):
+        while True:
+            totals = {}
+            # Drain everything that is due, one batch at a time
+            while True:
+                counts = process_pending(options['batch_size'])
+                for status, count in counts.items():
+                    totals[status] = totals.get(status, 0) + count
+                if sum(counts.values()) < options['batch_size']:
+                    break
+            if totals or options['verbosity'] > 1:
+                summary = ', '.join(f'{count} {status}' for status, count in sorted(totals.items())) or 'nothing due'
+                self.stdout.write(self.style.SUCCESS(f'Webhook events: {summary}'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -1,3 +1,48 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+class WebhookEvent(models.Model):
+    """
+    A payment gateway webhook, stored as received. The webhook views only
+    verify and store events; process_webhooks applies them.
+    """
+    STRIPE = 'stripe'
+    RAZORPAY = 'razorpay'
+    GATEWAY_CHOICES = [
+        (STRIPE, 'Stripe'),
+        (RAZORPAY, 'Razorpay'),
+    ]
+
+    PENDING = 'pending'
+    PROCESSED = 'processed'
+    IGNORED = 'ignored'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSED, 'Processed'),
+        (IGNORED, 'Ignored'),
+        (FAILED, 'Failed'),
+    ]
+
+    gateway = models.CharField(max_length=20, choices=GATEWAY_CHOICES)
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    received = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-received']
+        constraints = [
+            models.UniqueConstraint(fields=['gateway', 'event_id'], name='unique_gateway_event'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.gateway} {self.event_type} {self.event_id}'
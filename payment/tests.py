@@ -0,0 +1,127 @@
+import json
+import shutil
+import tempfile
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import Client, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from notifications.models import OutgoingEmail
+from orders.models import Order
+from products.models import Product
+from .gateways import get_gateway
+from .models import WebhookEvent
+from .webhooks import process_pending
+
+
+@override_settings(
+    PAYMENT_GATEWAYS={
+        'razorpay': 'payment.gateways.FakeRazorpayGateway',
+        'stripe': 'payment.gateways.FakeStripeGateway',
+    },
+    PAYMENT_FAKE_GATEWAY_LATENCY=0,
+    RAZORPAY_ENABLED=True,
+    RAZORPAY_WEBHOOK_SECRET='test-razorpay-secret',
+    STRIPE_ENABLED=True,
+    STRIPE_WEBHOOK_SECRET='test-stripe-secret',
+)
+class FakeGatewayPaymentTests(TransactionTestCase):
+    orders = 3
+    details = {
+        'first_name': 'Load', 'last_name': 'Test', 'email': 'load@example.com',
+        'address': '1 Test Street', 'postal_code': '00000', 'city': 'Testville',
+    }
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Gift Box', slug='gift-box', price=5, stock=50)
+
+    def checkout(self, username, gateway_name):
+        """
+        Order one gift box and pay for it; returns the order id and the
+        webhook the gateway would send as (url, body, headers).
+        """
+        client = Client()
+        client.force_login(User.objects.create_user(username=username, email=f'{username}@example.com'))
+        client.post(reverse('cart:cart_add', args=[self.product.id]), {'quantity': 1})
+        response = client.post(reverse('orders:order_create'), self.details)
+        self.assertEqual(response.status_code, 302)
+        order_id = int(response.url.rstrip('/').rsplit('/', 1)[-1])
+        response = client.post(f'{reverse("payment:process", args=[order_id])}?method={gateway_name}')
+        self.assertEqual(response.status_code, 200)
+        created = response.json()
+        gateway = get_gateway(gateway_name)
+
+        if gateway_name == 'razorpay':
+            # Checkout returns to the browser and the gateway calls the
+            # webhook; both report the same payment
+            payment_id, signature = gateway.pay(created['order_id'])
+            response = client.post(reverse('payment:razorpay_verify'), {
+                'razorpay_order_id': created['order_id'],
+                'razorpay_payment_id': payment_id,
+                'razorpay_signature': signature,
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            body, headers = gateway.payment_captured_webhook(created['order_id'], payment_id, created['amount'])
+            return order_id, reverse('payment:razorpay_webhook'), body, headers
+        order = Order.objects.get(pk=order_id)
+        session = SimpleNamespace(
+            id=created['sessionId'], payment_intent=order.payment_intent_id, client_reference_id=order_id,
+        )
+        body, headers = gateway.checkout_completed_webhook(session)
+        return order_id, reverse('payment:stripe_webhook'), body, headers
+
+    def assert_paid_once(self, gateway_name):
+        webhooks = [self.checkout(f'{gateway_name}-{i}', gateway_name) for i in range(self.orders)]
+        for _, url, body, headers in webhooks:
+            # Gateways retry deliveries; the second must be a no-op
+            for _ in range(2):
+                response = Client().post(url, body, content_type='application/json', **headers)
+                self.assertEqual(response.status_code, 200)
+        process_pending(100)
+
+        order_ids = [order_id for order_id, _, _, _ in webhooks]
+        self.assertEqual(Order.objects.filter(pk__in=order_ids, paid=True).count(), self.orders)
+        event_ids = [headers.get('HTTP_X_RAZORPAY_EVENT_ID') or json.loads(body)['id'] for _, _, body, headers in webhooks]
+        events = WebhookEvent.objects.filter(gateway=gateway_name, event_id__in=event_ids)
+        self.assertEqual(events.filter(status=WebhookEvent.PROCESSED).count(), self.orders)
+        for order_id in order_ids:
+            self.assertEqual(
+                OutgoingEmail.objects.filter(subject=f'Payment Confirmation - Order #{order_id}').count(), 1,
+            )
+
+    def test_razorpay_payments_are_applied_once(self):
+        self.assert_paid_once('razorpay')
+
+    def test_stripe_payments_are_applied_once(self):
+        self.assert_paid_once('stripe')
+
+    @override_settings(DEFAULT_CURRENCY='eur')
+    def test_gateways_charge_in_the_order_currency(self):
+        charged = {}
+        for gateway_name, method in (('razorpay', 'create_order'), ('stripe', 'create_checkout_session')):
+            gateway = get_gateway(gateway_name)
+            with mock.patch.object(gateway, method, wraps=getattr(gateway, method)) as create:
+                self.checkout(f'{gateway_name}-eur', gateway_name)
+            charged[gateway_name] = create.call_args.kwargs
+        self.assertEqual(charged['razorpay']['currency'], 'EUR')
+        self.assertEqual(charged['stripe']['line_items'][0]['price_data']['currency'], 'eur')
+
+
+class GatewayStatusTests(SimpleTestCase):
+    def test_refuses_a_per_process_cache(self):
+        with self.assertRaisesMessage(CommandError, 'per-process cache'):
+            call_command('gateway_status', stdout=StringIO())
+
+    def test_reports_from_a_shared_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        out = StringIO()
+        with self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }}):
+            call_command('gateway_status', stdout=out)
+        self.assertIn('razorpay:', out.getvalue())
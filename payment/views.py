@@ -1,30 +1,25 @@
 import stripe
-import razorpay
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from orders.models import Order
+from orders.holds import confirm_holds, release_holds, renew_holds
+from products.inventory import InsufficientStock
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 import json
 import hmac
 import hashlib
 import logging
-from utils.emails import send_payment_confirmation
+from .gateways import get_gateway
+from .health import GatewayUnavailable
+from .models import WebhookEvent
+from .webhooks import mark_order_paid, record_event
 
 logger = logging.getLogger(__name__)
 
-# Initialize payment gateways
-if settings.STRIPE_SECRET_KEY:
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-
-if settings.RAZORPAY_KEY_ID and settings.RAZORPAY_KEY_SECRET:
-    razorpay_client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-else:
-    razorpay_client = None
-
 def get_available_payment_methods():
     """Get list of available payment methods based on configuration"""
     methods = []
@@ -46,7 +41,8 @@ def get_available_payment_methods():
             'currencies': ['INR']
         })
     
-    if getattr(settings, 'RAZORPAY_ENABLED', False) and settings.RAZORPAY_KEY_ID:
+    # A gateway whose circuit breaker is open is left out until it recovers
+    if getattr(settings, 'RAZORPAY_ENABLED', False) and get_gateway('razorpay').available:
         methods.append({
             'id': 'razorpay',
             'name': 'Razorpay',
@@ -55,7 +51,7 @@ def get_available_payment_methods():
             'currencies': ['INR']
         })
     
-    if getattr(settings, 'STRIPE_ENABLED', False) and settings.STRIPE_SECRET_KEY:
+    if getattr(settings, 'STRIPE_ENABLED', False) and get_gateway('stripe').available:
         methods.append({
             'id': 'stripe',
             'name': 'Stripe',
@@ -69,6 +65,12 @@ def get_available_payment_methods():
 @login_required
 def payment_process(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user, paid=False)
+    # Hold the order's stock for the length of the payment attempt
+    try:
+        renew_holds(order)
+    except InsufficientStock:
+        messages.error(request, 'Sorry, some items in this order have sold out since it was placed.')
+        return redirect('orders:order_detail', id=order.id)
     available_methods = get_available_payment_methods()
     
     # Check if any payment methods are available
@@ -95,6 +97,7 @@ def payment_process(request, order_id):
     
     # Handle Cash on Delivery (offline)
     if payment_method == 'cod':
+        confirm_holds(order)
         messages.success(request, 'Cash on Delivery selected. Your order will be processed and payable upon delivery.')
         # Keep order.paid as False for COD. Redirect to success page showing COD as the method.
         success_url = f"/payment/success/{order.id}/?method=cod"
@@ -113,19 +116,22 @@ def payment_process(request, order_id):
 
 def handle_razorpay_payment(request, order):
     """Handle Razorpay payment processing"""
-    if not razorpay_client:
+    gateway = get_gateway('razorpay')
+    if not gateway.configured:
         messages.error(request, 'Razorpay is not configured properly.')
         return redirect('payment:process', order_id=order.id)
+    if request.method != 'POST' and not gateway.available:
+        messages.error(request, 'Razorpay is temporarily unavailable, please choose another payment method.')
+        return redirect('payment:process', order_id=order.id)
     
     if request.method == 'POST':
         try:
             # Create Razorpay order
-            razorpay_order = razorpay_client.order.create({
-                'amount': int(order.get_total_cost() * 100),  # Amount in paise (INR * 100)
-                'currency': 'INR',
-                'receipt': f'order_{order.id}',
-                'payment_capture': 1
-            })
+            razorpay_order = gateway.create_order(
+                amount=int(order.get_total_cost() * 100),  # Amount in the smallest unit (paise, cents)
+                currency=order.currency,
+                receipt=f'order_{order.id}',
+            )
             
             # Update order with Razorpay order ID
             order.payment_intent_id = razorpay_order['id']
@@ -135,8 +141,10 @@ def handle_razorpay_payment(request, order):
                 'order_id': razorpay_order['id'],
                 'amount': razorpay_order['amount'],
                 'currency': razorpay_order['currency'],
-                'key': settings.RAZORPAY_KEY_ID
+                'key': gateway.key_id
             })
+        except GatewayUnavailable:
+            return JsonResponse({'error': 'Razorpay is temporarily unavailable, please choose another payment method.'}, status=503)
         except Exception as e:
             logger.error(f'Razorpay order creation failed: {str(e)}')
             messages.error(request, f'Payment processing error: {str(e)}')
@@ -144,15 +152,19 @@ def handle_razorpay_payment(request, order):
     
     return render(request, 'payment/razorpay_process.html', {
         'order': order,
-        'razorpay_key_id': settings.RAZORPAY_KEY_ID,
-        'currency': 'INR'
+        'razorpay_key_id': gateway.key_id,
+        'currency': order.currency
     })
 
 def handle_stripe_payment(request, order):
     """Handle Stripe payment processing"""
-    if not settings.STRIPE_SECRET_KEY:
+    gateway = get_gateway('stripe')
+    if not gateway.configured:
         messages.error(request, 'Stripe is not configured properly.')
         return redirect('payment:process', order_id=order.id)
+    if request.method != 'POST' and not gateway.available:
+        messages.error(request, 'Stripe is temporarily unavailable, please choose another payment method.')
+        return redirect('payment:process', order_id=order.id)
     
     if request.method == 'POST':
         try:
@@ -172,7 +184,7 @@ def handle_stripe_payment(request, order):
                 session_data['line_items'].append({
                     'price_data': {
                         'unit_amount': int(item.price * 100),  # amount in cents
-                        'currency': getattr(settings, 'DEFAULT_CURRENCY', 'usd').lower(),
+                        'currency': order.currency.lower(),
                         'product_data': {
                             'name': item.product.name,
                         },
@@ -181,13 +193,15 @@ def handle_stripe_payment(request, order):
                 })
 
             # Create Stripe checkout session
-            session = stripe.checkout.Session.create(**session_data)
+            session = gateway.create_checkout_session(**session_data)
 
             # Update order with payment intent
             order.payment_intent_id = session.payment_intent
             order.save()
 
             return JsonResponse({'sessionId': session.id})
+        except GatewayUnavailable:
+            return JsonResponse({'error': 'Stripe is temporarily unavailable, please choose another payment method.'}, status=503)
         except Exception as e:
             logger.error(f'Stripe session creation failed: {str(e)}')
             messages.error(request, f'Payment processing error: {str(e)}')
@@ -211,13 +225,17 @@ def payment_success(request, order_id):
 @login_required
 def payment_cancel(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
+    if not order.paid:
+        # Put the stock back on sale now rather than when the hold lapses
+        release_holds(order)
     return render(request, 'payment/cancel.html', {'order': order})
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def razorpay_verify_payment(request):
     """Verify Razorpay payment after successful payment"""
-    if not razorpay_client:
+    gateway = get_gateway('razorpay')
+    if not gateway.configured:
         return JsonResponse({'error': 'Razorpay not configured'}, status=400)
     
     try:
@@ -230,35 +248,19 @@ def razorpay_verify_payment(request):
             return JsonResponse({'error': 'Missing payment details'}, status=400)
         
         # Verify payment signature
-        params_dict = {
-            'razorpay_order_id': razorpay_order_id,
-            'razorpay_payment_id': razorpay_payment_id,
-            'razorpay_signature': razorpay_signature
-        }
-        
         try:
-            razorpay_client.utility.verify_payment_signature(params_dict)
+            gateway.verify_payment_signature(razorpay_order_id, razorpay_payment_id, razorpay_signature)
         except:
             return JsonResponse({'error': 'Payment verification failed'}, status=400)
         
-        # Find and update order
-        try:
-            order = Order.objects.get(payment_intent_id=razorpay_order_id)
-            order.paid = True
-            order.stripe_id = razorpay_payment_id  # Reuse this field for Razorpay payment ID
-            order.save()
-            # Send payment confirmation with invoice
-            try:
-                send_payment_confirmation(order)
-            except Exception as e:
-                logger.warning(f'Failed to send payment confirmation email: {str(e)}')
-            
-            logger.info(f'Razorpay payment verified for order {order.id}')
-            return JsonResponse({'status': 'success', 'order_id': order.id})
-            
-        except Order.DoesNotExist:
+        # Mark the order paid unless the webhook already did
+        orders = Order.objects.filter(payment_intent_id=razorpay_order_id)
+        order = mark_order_paid(orders, razorpay_payment_id) or orders.first()
+        if order is None:
             logger.error(f'Order not found for Razorpay order ID: {razorpay_order_id}')
             return JsonResponse({'error': 'Order not found'}, status=404)
+        logger.info(f'Razorpay payment verified for order {order.id}')
+        return JsonResponse({'status': 'success', 'order_id': order.id})
             
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON data'}, status=400)
@@ -287,28 +289,11 @@ def razorpay_webhook(request):
             logger.warning('Invalid Razorpay webhook signature')
             return HttpResponse(status=400)
         
-        # Process webhook event
+        # Store the event and acknowledge; process_webhooks applies it
         data = json.loads(payload)
-        event_type = data.get('event')
-        
-        if event_type == 'payment.captured':
-            payment_data = data.get('payload', {}).get('payment', {}).get('entity', {})
-            order_id = payment_data.get('order_id')
-            payment_id = payment_data.get('id')
-            
-            if order_id:
-                try:
-                    order = Order.objects.get(payment_intent_id=order_id)
-                    order.paid = True
-                    order.stripe_id = payment_id
-                    order.save()
-                    try:
-                        send_payment_confirmation(order)
-                    except Exception as e:
-                        logger.warning(f'Failed to send payment confirmation email (webhook): {str(e)}')
-                    logger.info(f'Razorpay webhook processed for order {order.id}')
-                except Order.DoesNotExist:
-                    logger.error(f'Order not found in webhook: {order_id}')
+        event_id = request.META.get('HTTP_X_RAZORPAY_EVENT_ID') or hashlib.sha256(payload).hexdigest()
+        if not record_event(WebhookEvent.RAZORPAY, event_id, data.get('event', ''), data):
+            logger.info(f'Duplicate Razorpay webhook {event_id} ignored')
         
         return HttpResponse(status=200)
         
@@ -320,7 +305,7 @@ def razorpay_webhook(request):
 def stripe_webhook(request):
     """Handle Stripe webhooks"""
     # Skip webhook processing if Stripe is disabled
-    if not getattr(settings, 'STRIPE_ENABLED', False) or not settings.STRIPE_SECRET_KEY:
+    if not getattr(settings, 'STRIPE_ENABLED', False) or not get_gateway('stripe').configured:
         return HttpResponse(status=200)
     
     payload = request.body
@@ -338,20 +323,8 @@ def stripe_webhook(request):
         logger.error(f'Invalid Stripe signature: {str(e)}')
         return HttpResponse(status=400)
 
-    if event.type == 'checkout.session.completed':
-        session = event.data.object
-        order_id = session.client_reference_id
-        try:
-            order = Order.objects.get(id=order_id)
-            order.paid = True
-            order.stripe_id = session.payment_intent
-            order.save()
-            logger.info(f'Stripe webhook processed for order {order.id}')
-            try:
-                send_payment_confirmation(order)
-            except Exception as e:
-                logger.warning(f'Failed to send Stripe payment confirmation email: {str(e)}')
-        except Order.DoesNotExist:
-            logger.error(f'Order not found in Stripe webhook: {order_id}')
+    # Store the event and acknowledge; process_webhooks applies it
+    if not record_event(WebhookEvent.STRIPE, event.id, event.type, json.loads(payload)):
+        logger.info(f'Duplicate Stripe webhook {event.id} ignored')
 
     return HttpResponse(status=200)
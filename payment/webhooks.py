@@ -0,0 +1,148 @@
+"""
+Payment webhook event store and processor.
+
+Webhook views verify the signature, store the event with ``record_event``
+and acknowledge at once. A redelivered event has the same gateway event id
+and is dropped by the unique constraint. ``process_pending``, run by the
+process_webhooks command, applies stored events.
+
+Marking an order paid is a conditional ``UPDATE ... WHERE paid = false``,
+so however often an event is delivered or processed, and whichever of the
+webhook and the Razorpay verify endpoint gets there first, the order is
+flipped, and its confirmation email queued, exactly once.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from orders.holds import confirm_holds
+from orders.models import Order
+from utils.emails import send_payment_confirmation
+from .models import WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+def record_event(gateway, event_id, event_type, payload):
+    """
+    Store a verified webhook event. Returns False if it was already stored.
+    """
+    try:
+        with transaction.atomic():
+            WebhookEvent.objects.create(
+                gateway=gateway, event_id=event_id, event_type=event_type, payload=payload,
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def mark_order_paid(orders, payment_id):
+    """
+    Mark the unpaid order matched by the ``orders`` queryset as paid and
+    queue its confirmation email. Returns the order if this call changed
+    it, or None if it was already paid (or doesn't exist).
+    """
+    with transaction.atomic():
+        updated = orders.filter(paid=False).update(
+            paid=True, stripe_id=payment_id or '', updated=timezone.now(),
+        )
+        if not updated:
+            return None
+        order = orders.get()
+        # update() skips the post_save receiver that confirms stock holds
+        confirm_holds(order)
+        send_payment_confirmation(order)
+    logger.info(f'Order {order.id} marked paid ({payment_id})')
+    return order
+
+
+class EventIgnored(Exception):
+    pass
+
+
+def handle_razorpay_payment_captured(payload):
+    payment = payload.get('payload', {}).get('payment', {}).get('entity', {})
+    order_id = payment.get('order_id')
+    if not order_id:
+        raise EventIgnored('No order id in payment')
+    orders = Order.objects.filter(payment_intent_id=order_id)
+    if not orders.exists():
+        raise EventIgnored(f'Order not found: {order_id}')
+    mark_order_paid(orders, payment.get('id'))
+
+
+def handle_stripe_checkout_completed(payload):
+    session = payload.get('data', {}).get('object', {})
+    order_id = session.get('client_reference_id')
+    orders = Order.objects.filter(id=order_id) if str(order_id or '').isdigit() else Order.objects.none()
+    if not orders.exists():
+        raise EventIgnored(f'Order not found: {order_id}')
+    mark_order_paid(orders, session.get('payment_intent'))
+
+
+HANDLERS = {
+    (WebhookEvent.RAZORPAY, 'payment.captured'): handle_razorpay_payment_captured,
+    (WebhookEvent.STRIPE, 'checkout.session.completed'): handle_stripe_checkout_completed,
+}
+
+
+def process_event(event):
+    """
+    Apply one event; its order update and the event's new status commit
+    together.
+    """
+    handler = HANDLERS.get((event.gateway, event.event_type))
+    try:
+        with transaction.atomic():
+            if handler is None:
+                raise EventIgnored(f'No handler for {event.event_type}')
+            handler(event.payload)
+            event.status = WebhookEvent.PROCESSED
+            event.attempts += 1
+            event.processed_at = timezone.now()
+            event.save(update_fields=['status', 'attempts', 'processed_at'])
+    except EventIgnored as e:
+        event.status = WebhookEvent.IGNORED
+        event.last_error = str(e)
+        event.processed_at = timezone.now()
+        event.save(update_fields=['status', 'last_error', 'processed_at'])
+        return event.status
+    except Exception as e:
+        event.attempts += 1
+        event.last_error = f'{type(e).__name__}: {e}'
+        if event.attempts >= getattr(settings, 'WEBHOOK_MAX_ATTEMPTS', 5):
+            event.status = WebhookEvent.FAILED
+            logger.error(f'Giving up on webhook event {event}: {event.last_error}')
+        else:
+            event.next_attempt_at = timezone.now() + timedelta(
+                seconds=getattr(settings, 'WEBHOOK_RETRY_DELAY', 30) * 2 ** (event.attempts - 1)
+            )
+            logger.warning(f'Webhook event {event} failed (attempt {event.attempts}): {event.last_error}')
+        event.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
+    return event.status
+
+
+def process_pending(batch_size=100):
+    """
+    Process up to ``batch_size`` due events, oldest first. Returns a dict
+    of counts by resulting status.
+    """
+    counts = {}
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'WEBHOOK_PROCESSING_LEASE', 300))
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=WebhookEvent.PENDING, next_attempt_at__lte=now)
+            .order_by('received', 'id')[:batch_size]
+        )
+        # Lease the batch so other processors skip it
+        WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(next_attempt_at=now + lease)
+    for event in events:
+        status = process_event(event)
+        counts[status] = counts.get(status, 0) + 1
+    return counts
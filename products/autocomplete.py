@@ -0,0 +1,218 @@
+"""
+In-process autocomplete index over product and category names.
+
+Names are lower-cased and stored in a sorted array once per word start, so
+"Gourmet Chocolate Collection" is found by "gou", "choc" and "coll"; whole
+names also go in a second array so they are found first. A prefix lookup is
+a bisect plus a short forward scan and never touches the database.
+
+The index is built on first use (once, however many requests arrive
+together), kept current by Product/Category save and delete signals, and
+refreshed in a background thread after AUTOCOMPLETE_MAX_AGE seconds to pick
+up writes made by other processes; lookups keep using the old arrays until
+the new ones are swapped in. Lookups and updates share one lock; a lookup
+holds it only for its bounded scan.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+
+from .models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+PRODUCT = 'product'
+CATEGORY = 'category'
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def word_starts(name):
+    """
+    Every suffix of ``name`` that begins at a word boundary.
+    """
+    words = normalize(name).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # one rebuild at a time
+        self._keys = []      # sorted (key, kind, id)
+        self._names = []     # sorted (whole name, kind, id)
+        self._entries = {}   # (kind, id) -> (label, slug, keys)
+        self._built_at = None
+        self._changes = None  # edits made while a rebuild reads the DB
+
+    def _add(self, kind, pk, label, slug=''):
+        keys = word_starts(label)
+        self._entries[(kind, pk)] = (label, slug, keys)
+        for key in keys:
+            insort(self._keys, (key, kind, pk))
+        if keys:
+            insort(self._names, (keys[0], kind, pk))
+
+    def _remove(self, kind, pk):
+        entry = self._entries.pop((kind, pk), None)
+        if entry is None:
+            return
+        for key in entry[2]:
+            _discard(self._keys, (key, kind, pk))
+        if entry[2]:
+            _discard(self._names, (entry[2][0], kind, pk))
+
+    def rebuild(self):
+        with self._build_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._changes = []
+        try:
+            entries = {}
+            products = Product.objects.filter(available=True).values_list('id', 'name')
+            categories = Category.objects.values_list('id', 'name', 'slug')
+            for pk, name in products:
+                entries[(PRODUCT, pk)] = (name, '', word_starts(name))
+            for pk, name, slug in categories:
+                entries[(CATEGORY, pk)] = (name, slug, word_starts(name))
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+        keys = []
+        names = []
+        for (kind, pk), (_, _, entry_keys) in entries.items():
+            keys.extend((key, kind, pk) for key in entry_keys)
+            if entry_keys:
+                names.append((entry_keys[0], kind, pk))
+        keys.sort()
+        names.sort()
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+            self._names = names
+            # Saves signalled while we read may be missing from what we read
+            for change in self._changes:
+                change()
+            self._changes = None
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._built_at is None:
+            # Requests arriving before the first build wait for one build
+            with self._build_lock:
+                if self._built_at is None:
+                    self._rebuild()
+            return
+        max_age = getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 300)
+        if time.monotonic() - self._built_at > max_age and self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self._rebuild()
+        except Exception:
+            logger.exception('Autocomplete index refresh failed')
+        finally:
+            self._build_lock.release()
+            # Not a request, so nothing else closes this thread's connections
+            connections.close_all()
+
+    def _apply(self, change):
+        with self._lock:
+            if self._built_at is None and self._changes is None:
+                return
+            change()
+            if self._changes is not None:
+                self._changes.append(change)
+
+    def update_product(self, product):
+        pk, name, available = product.pk, product.name, product.available
+
+        def change():
+            self._remove(PRODUCT, pk)
+            if available:
+                self._add(PRODUCT, pk, name)
+        self._apply(change)
+
+    def remove_product(self, pk):
+        self._apply(lambda: self._remove(PRODUCT, pk))
+
+    def update_category(self, category):
+        pk, name, slug = category.pk, category.name, category.slug
+
+        def change():
+            self._remove(CATEGORY, pk)
+            self._add(CATEGORY, pk, name, slug)
+        self._apply(change)
+
+    def remove_category(self, pk):
+        self._apply(lambda: self._remove(CATEGORY, pk))
+
+    def suggest(self, query, limit=8):
+        """
+        Return up to ``limit`` suggestions for names with a word starting
+        with ``query``. Whole-name prefix matches rank before mid-name ones,
+        then suggestions are alphabetical.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self._ensure_fresh()
+
+        matches = {}
+        # Signal handlers edit the arrays in place, so scan under the lock.
+        # Whole names come first and are scanned in order, so the first
+        # ``limit`` of them are the best; the mid-name scan is bounded,
+        # which keeps very short prefixes cheap.
+        with self._lock:
+            entries = self._entries
+            names = self._names
+            i = bisect_left(names, (prefix,))
+            while i < len(names) and len(matches) < limit:
+                key, kind, pk = names[i]
+                if not key.startswith(prefix):
+                    break
+                label, slug, _ = entries[(kind, pk)]
+                matches[(kind, pk)] = (0, label, slug)
+                i += 1
+            keys = self._keys
+            i = bisect_left(keys, (prefix,))
+            scan_limit = limit * 10 if len(matches) < limit else 0
+            while i < len(keys) and scan_limit > 0:
+                key, kind, pk = keys[i]
+                if not key.startswith(prefix):
+                    break
+                if (kind, pk) not in matches:
+                    label, slug, _ = entries[(kind, pk)]
+                    matches[(kind, pk)] = (1, label, slug)
+                i += 1
+                scan_limit -= 1
+
+        ranked = sorted(matches.items(), key=lambda item: (item[1][0], item[1][1].lower()))
+        results = []
+        for (kind, pk), (_, label, slug) in ranked[:limit]:
+            if kind == PRODUCT:
+                url = reverse('products:product_detail', args=[pk])
+            else:
+                url = reverse('products:product_list_by_category', args=[slug])
+            results.append({'type': kind, 'id': pk, 'label': label, 'url': url})
+        return results
+
+
+def _discard(array, item):
+    i = bisect_left(array, item)
+    if i < len(array) and array[i] == item:
+        del array[i]
+
+
+index = AutocompleteIndex()
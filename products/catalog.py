@@ -0,0 +1,299 @@
+"""
+Catalog query engine for the product listing page.
+
+All listing filters (category, price band, stock, search) and the sort order
+are applied to a single queryset. Facet counts and the overall price range
+come from a cached catalog summary: one GROUP BY over available products,
+bucketed by category, price band and stock status. With a warm summary a
+listing page costs one query for the page itself. Pages are keyset-paginated
+(see pagination.py), so no COUNT is needed; legacy ``?page=N`` links and
+relevance-sorted searches use offset pages, which COUNT only when the summary
+cannot answer the total exactly.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import (
+    BooleanField, Case, Count, IntegerField, Max, Min, Q, Value, When,
+)
+
+from .models import Category, Product
+from .pagination import KeysetPaginator
+from .search import search_products, tokenize
+
+SUMMARY_CACHE_KEY = 'products:catalog_summary'
+
+# Upper edges of the price buckets used for facets, e.g. (25, 50) gives
+# "under 25", "25 - 50" and "50 and above".
+PRICE_BUCKETS = tuple(
+    Decimal(str(edge)) for edge in getattr(settings, 'CATALOG_PRICE_BUCKETS', (25, 50, 100, 250))
+)
+
+SORT_ORDERINGS = {
+    'name': ('name', 'id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+    'newest': ('-created', '-id'),
+    'relevance': ('-search_rank', 'id'),
+}
+DEFAULT_SORT = 'name'
+
+
+def _parse_price(value):
+    if value in (None, ''):
+        return None
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return price if price.is_finite() else None
+
+
+def price_bucket_bounds(bucket):
+    """
+    Return the (low, high) bounds of a price bucket; high is None for the
+    open-ended top bucket.
+    """
+    low = PRICE_BUCKETS[bucket - 1] if bucket > 0 else Decimal('0')
+    high = PRICE_BUCKETS[bucket] if bucket < len(PRICE_BUCKETS) else None
+    return low, high
+
+
+class CatalogSummary:
+    """
+    Per (category, price bucket, in stock) cell counts for available products.
+    """
+
+    def __init__(self, cells, categories):
+        # cells: list of (category_id, bucket, in_stock, count, min_price, max_price)
+        self.cells = cells
+        # categories: list of (id, name, slug) for every category
+        self.categories = categories
+
+    @classmethod
+    def build(cls):
+        bucket = Case(
+            *[When(price__lt=edge, then=Value(i)) for i, edge in enumerate(PRICE_BUCKETS)],
+            default=Value(len(PRICE_BUCKETS)),
+            output_field=IntegerField(),
+        )
+        in_stock = Case(
+            When(stock__gt=0, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+        rows = (
+            Product.objects.filter(available=True)
+            .annotate(bucket=bucket, in_stock=in_stock)
+            .values('category_id', 'bucket', 'in_stock')
+            .annotate(count=Count('id'), min_price=Min('price'), max_price=Max('price'))
+            .order_by()
+        )
+        cells = [
+            (row['category_id'], row['bucket'], bool(row['in_stock']),
+             row['count'], row['min_price'], row['max_price'])
+            for row in rows
+        ]
+        categories = list(Category.objects.values_list('id', 'name', 'slug'))
+        return cls(cells, categories)
+
+    @property
+    def price_range(self):
+        if not self.cells:
+            return {'min_price': None, 'max_price': None}
+        return {
+            'min_price': min(cell[4] for cell in self.cells),
+            'max_price': max(cell[5] for cell in self.cells),
+        }
+
+
+def get_summary():
+    """
+    Return the cached catalog summary, building it on a cache miss.
+    """
+    summary = cache.get(SUMMARY_CACHE_KEY)
+    if summary is None:
+        summary = CatalogSummary.build()
+        cache.set(SUMMARY_CACHE_KEY, summary, getattr(settings, 'CATALOG_SUMMARY_TIMEOUT', 300))
+    return summary
+
+
+def invalidate_summary():
+    cache.delete(SUMMARY_CACHE_KEY)
+
+
+class CatalogPaginator(Paginator):
+    """
+    Paginator that accepts a precomputed total so it can skip the COUNT query.
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            # Paginator.count is a cached_property; seed it directly.
+            self.__dict__['count'] = count
+
+
+class CatalogQuery:
+    """
+    A planned product listing: filters, sort order and facets in one place.
+    """
+
+    per_page = 9
+
+    def __init__(self, category=None, search='', min_price=None, max_price=None,
+                 in_stock=False, sort=None):
+        self.category = category
+        # Punctuation-only input has no searchable terms.
+        self.search = search if tokenize(search) else ''
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock = in_stock
+        if sort is None:
+            sort = 'relevance' if self.search else DEFAULT_SORT
+        if sort not in SORT_ORDERINGS or (sort == 'relevance' and not self.search):
+            sort = DEFAULT_SORT
+        self.sort = sort
+
+    @classmethod
+    def from_request(cls, request, category=None):
+        params = request.GET
+        return cls(
+            category=category,
+            search=params.get('search', '').strip(),
+            min_price=_parse_price(params.get('min_price')),
+            max_price=_parse_price(params.get('max_price')),
+            in_stock=bool(params.get('in_stock')),
+            sort=params.get('sort') or None,
+        )
+
+    @property
+    def ordering(self):
+        return SORT_ORDERINGS[self.sort]
+
+    def filter_q(self):
+        q = Q(available=True)
+        if self.category is not None:
+            q &= Q(category=self.category)
+        if self.min_price is not None:
+            q &= Q(price__gte=self.min_price)
+        if self.max_price is not None:
+            q &= Q(price__lte=self.max_price)
+        if self.in_stock:
+            q &= Q(stock__gt=0)
+        return q
+
+    def queryset(self):
+        queryset = search_products(Product.objects.filter(self.filter_q()), self.search)
+        return queryset.order_by(*self.ordering)
+
+    # Summary cell matching ------------------------------------------------
+
+    def _price_overlap(self, cell):
+        """
+        Return 'all', 'some' or 'none' for how much of a cell lies inside the
+        requested price band, judged from the cell's actual min/max prices.
+        """
+        low, high = cell[4], cell[5]
+        if self.min_price is not None and high < self.min_price:
+            return 'none'
+        if self.max_price is not None and low > self.max_price:
+            return 'none'
+        if self.min_price is not None and low < self.min_price:
+            return 'some'
+        if self.max_price is not None and high > self.max_price:
+            return 'some'
+        return 'all'
+
+    def _matches(self, cell, category=True, price=True, stock=True):
+        if category and self.category is not None and cell[0] != self.category.id:
+            return False
+        if price and self._price_overlap(cell) == 'none':
+            return False
+        if stock and self.in_stock and not cell[2]:
+            return False
+        return True
+
+    def total_from_summary(self, summary):
+        """
+        Exact number of matching products, or None when the summary can't
+        tell (search terms, or a price band splitting a cell).
+        """
+        if self.search:
+            return None
+        total = 0
+        for cell in summary.cells:
+            if not self._matches(cell, price=False):
+                continue
+            overlap = self._price_overlap(cell)
+            if overlap == 'some':
+                return None
+            if overlap == 'all':
+                total += cell[3]
+        return total
+
+    def facets(self, summary):
+        """
+        Facet counts, each computed with every other active filter applied.
+        Price filtering is at cell granularity and search is not reflected.
+        """
+        category_counts = {}
+        bucket_counts = {}
+        in_stock_count = 0
+        for cell in summary.cells:
+            category_id, bucket, cell_in_stock, count = cell[:4]
+            if self._matches(cell, category=False):
+                category_counts[category_id] = category_counts.get(category_id, 0) + count
+            if self._matches(cell, price=False):
+                bucket_counts[bucket] = bucket_counts.get(bucket, 0) + count
+            if cell_in_stock and self._matches(cell, stock=False):
+                in_stock_count += count
+
+        categories = [
+            {'id': pk, 'name': name, 'slug': slug, 'count': category_counts.get(pk, 0)}
+            for pk, name, slug in summary.categories
+        ]
+        price_buckets = []
+        for bucket in range(len(PRICE_BUCKETS) + 1):
+            low, high = price_bucket_bounds(bucket)
+            price_buckets.append({
+                'bucket': bucket,
+                'min_price': low,
+                'max_price': high,
+                'count': bucket_counts.get(bucket, 0),
+            })
+        return {
+            'categories': categories,
+            'price_buckets': price_buckets,
+            'in_stock': in_stock_count,
+        }
+
+    def execute(self, page=None, cursor=None):
+        """
+        Run the listing. Keyset pagination is used unless a legacy page
+        number is given or results are sorted by relevance, which has no
+        stable column to key on.
+        """
+        summary = get_summary()
+        if page or self.sort == 'relevance':
+            paginator = CatalogPaginator(
+                self.queryset(), self.per_page, count=self.total_from_summary(summary)
+            )
+            result_page = paginator.get_page(page or 1)
+        else:
+            paginator = KeysetPaginator(self.queryset(), self.per_page, self.ordering)
+            result_page = paginator.get_page(cursor)
+        return CatalogResult(
+            page=result_page,
+            facets=self.facets(summary),
+            price_range=summary.price_range,
+        )
+
+
+class CatalogResult:
+    def __init__(self, page, facets, price_range):
+        self.page = page
+        self.facets = facets
+        self.price_range = price_range
@@ -0,0 +1,187 @@
+"""
+Rule-based product categorization.
+
+A rule maps keywords (matched as whole words, plurals included) and regular
+expressions to a category slug. All rules are compiled into one
+case-insensitive regex with a named group per rule, so a product is
+classified in a single scan of its name, or of its description when the
+name matches nothing. When several rules match, the one listed first wins.
+
+Rules come from PRODUCT_CATEGORY_RULES, or DEFAULT_RULES for the categories
+made by create_categories, and can be overridden with a JSON file (a list
+of {"category": slug, "keywords": [...], "patterns": [...]}).
+"""
+import json
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Now
+
+from gift_shop.routers import routing_state
+
+from .catalog import invalidate_summary
+from .models import Category, Product
+
+DEFAULT_RULES = [
+    {'category': 'personalized-gifts', 'keywords': [
+        'personalized', 'personalised', 'custom', 'customized', 'engraved', 'monogram', 'initials',
+    ]},
+    {'category': 'wedding-gifts', 'keywords': ['wedding', 'bride', 'groom', 'bridal', 'newlywed']},
+    {'category': 'anniversary-gifts', 'keywords': ['anniversary', 'wine', 'crystal', 'clock', 'watch']},
+    {'category': 'valentine-gifts', 'keywords': ['valentine', 'romantic', 'love', 'heart', 'rose']},
+    {'category': 'corporate-gifts', 'keywords': [
+        'corporate', 'office', 'desk', 'business', 'executive', 'journal', 'stationery', 'pen',
+    ]},
+    {'category': 'birthday-gifts', 'keywords': [
+        'birthday', 'party', 'celebration', 'chocolate', 'candle', 'aromatherapy', 'hamper', 'tea',
+        'plant', 'box', 'toy', 'game',
+    ]},
+]
+
+
+class RuleError(ValueError):
+    pass
+
+
+@dataclass
+class Rule:
+    category: str
+    keywords: list = field(default_factory=list)
+    patterns: list = field(default_factory=list)
+
+    def regex(self):
+        alternatives = []
+        if self.keywords:
+            words = '|'.join(re.escape(keyword.strip()) for keyword in self.keywords if keyword.strip())
+            alternatives.append(rf'\b(?:{words})(?:s|es)?\b')
+        alternatives.extend(self.patterns)
+        return '|'.join(f'(?:{alternative})' for alternative in alternatives)
+
+
+def load_rules(path=None):
+    """
+    Rules from a JSON file, PRODUCT_CATEGORY_RULES or the defaults.
+    """
+    if path:
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise RuleError(f'Cannot read rules from {path}: {e}')
+    else:
+        data = getattr(settings, 'PRODUCT_CATEGORY_RULES', None) or DEFAULT_RULES
+    try:
+        rules = [Rule(**item) for item in data]
+    except TypeError as e:
+        raise RuleError(f'Invalid rule: {e}')
+    for rule in rules:
+        if not rule.keywords and not rule.patterns:
+            raise RuleError(f'Rule for {rule.category} has no keywords or patterns')
+        for pattern in rule.patterns:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise RuleError(f'Invalid pattern {pattern!r} for {rule.category}: {e}')
+    # Patterns valid on their own can still break the combined regex
+    CategoryMatcher(rules)
+    return rules
+
+
+class CategoryMatcher:
+    def __init__(self, rules):
+        self.rules = rules
+        try:
+            self.regex = re.compile(
+                '|'.join(f'(?P<r{index}>{rule.regex()})' for index, rule in enumerate(rules)), re.IGNORECASE,
+            )
+        except re.error as e:
+            # e.g. a global flag like (?i) that is no longer at the start,
+            # or a group name used by another rule
+            raise RuleError(f'Rules can\'t be combined into one pattern: {e}')
+
+    def match_text(self, text):
+        best = None
+        for match in self.regex.finditer(text or ''):
+            # The rule's own group closes last, even around nested groups
+            index = int(match.lastgroup[1:])
+            if best is None or index < best:
+                best = index
+                if index == 0:
+                    break
+        return best
+
+    def match(self, name, description=''):
+        """
+        Index of the rule matching the product, or None.
+        """
+        index = self.match_text(name)
+        return index if index is not None else self.match_text(description)
+
+
+class CategoryAssigner:
+    """
+    Applies rules across the catalog in primary-key chunks. In apply mode
+    each chunk's changes are written with one UPDATE per category.
+    """
+
+    def __init__(self, rules, chunk_size=2000, overwrite=False, apply=False):
+        self.matcher = CategoryMatcher(rules)
+        self.chunk_size = chunk_size
+        self.overwrite = overwrite
+        self.apply = apply
+        slugs = {rule.category for rule in rules}
+        self.category_ids = dict(Category.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+        missing = slugs - set(self.category_ids)
+        if missing:
+            raise RuleError(f'Unknown categories: {", ".join(sorted(missing))}')
+        self.hits = Counter()
+        self.changes = Counter()
+        self.scanned = self.unmatched = 0
+        self.elapsed = 0
+
+    def run(self):
+        started = time.perf_counter()
+        # Read what is about to be written from the primary, not the replica
+        with routing_state(pinned=self.apply):
+            products = Product.objects.order_by('pk')
+            if not self.overwrite:
+                products = products.filter(category__isnull=True)
+            last = 0
+            while True:
+                # Keyset chunks, so rows updated meanwhile can't shift the window
+                chunk = list(
+                    products.filter(pk__gt=last).values_list('pk', 'name', 'description', 'category_id')
+                    [:self.chunk_size]
+                )
+                if not chunk:
+                    break
+                last = chunk[-1][0]
+                self.process(chunk)
+        if self.apply and self.changes:
+            # Category facet counts come from the cached summary
+            invalidate_summary()
+        self.elapsed = time.perf_counter() - started
+        return self
+
+    def process(self, chunk):
+        moves = {}
+        for pk, name, description, category_id in chunk:
+            self.scanned += 1
+            index = self.matcher.match(name, description)
+            if index is None:
+                self.unmatched += 1
+                continue
+            self.hits[index] += 1
+            target = self.category_ids[self.matcher.rules[index].category]
+            if target != category_id:
+                self.changes[index] += 1
+                moves.setdefault(target, []).append(pk)
+        if self.apply and moves:
+            with transaction.atomic():
+                for category_id, pks in moves.items():
+                    # ``updated`` moves cached product cards to a fresh key
+                    Product.objects.filter(pk__in=pks).update(category_id=category_id, updated=Now())
@@ -0,0 +1,12 @@
+from django.conf import settings
+from .fragments import category_nav_version
+from .models import Category
+
+def catalog(request):
+    # Both values are lazy: the queryset only runs, and the version is only
+    # read from the cache, when a template actually uses them.
+    return {
+        'nav_categories': Category.objects.all(),
+        'category_nav_version': category_nav_version,
+        'fragment_cache_timeout': getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600),
+    }
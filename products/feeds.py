@@ -0,0 +1,311 @@
+"""
+Catalog feeds: streaming CSV and JSON Lines import/export of products.
+
+A feed has one product per row with the columns in FIELDS; ``category`` is
+the category name. Files are read and written a row at a time (``.gz``
+files are compressed on the fly), so memory stays flat however large the
+feed is.
+
+Imports upsert by slug in batches, one INSERT ... ON CONFLICT (slug) DO
+UPDATE per batch via ``bulk_create(update_conflicts=True)``, and only the
+columns present in the feed are overwritten. A feed without ``name`` or
+``price`` can therefore update stock or prices of existing products, but
+not create new ones. Categories are resolved by slug from an in-memory map
+and created in bulk the first time a name appears. Bulk writes skip the
+Product save signals, so the importer refreshes the search index for each
+batch and drops the cached catalog summary itself.
+"""
+import csv
+import gzip
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .catalog import invalidate_summary
+from .fragments import bump_category_nav_version
+from .models import Category, Product
+from .search import index_products
+
+FIELDS = ('slug', 'name', 'category', 'description', 'price', 'stock', 'available', 'featured')
+FORMATS = ('csv', 'jsonl')
+# Columns a row needs before it can be inserted as a new product
+REQUIRED_FOR_CREATE = ('name', 'price')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f', 'off'}
+# Used for blank cells
+DEFAULTS = {'description': '', 'stock': 0, 'available': True, 'featured': False}
+
+
+class FeedError(ValueError):
+    pass
+
+
+def feed_format(path, fmt=None):
+    """
+    The feed format given explicitly or implied by ``path``'s extension.
+    """
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    for candidate in FORMATS:
+        if name.endswith(f'.{candidate}'):
+            return candidate
+    if name.endswith('.ndjson'):
+        return 'jsonl'
+    raise FeedError(f'Cannot tell the format of {path}; use --format')
+
+
+def open_feed(path, mode):
+    """
+    Open a feed file for text reading ('r') or writing ('w'), compressed if
+    it ends in .gz. ``-`` is not handled here.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def read_feed(f, fmt):
+    """
+    Yield (line number, row dict) for each product in a feed.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_num, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            raise FeedError(f'line {line_num}: invalid JSON ({e})')
+        if not isinstance(row, dict):
+            raise FeedError(f'line {line_num}: expected a JSON object')
+        yield line_num, row
+
+
+class FeedWriter:
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(f, FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self.writer.writerow(row)
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False))
+            self.f.write('\n')
+
+
+def export_rows(queryset=None, chunk_size=2000):
+    """
+    Yield a feed row per product, streamed from the database in chunks.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    rows = queryset.order_by('pk').values_list(
+        'slug', 'name', 'category__name', 'description', 'price', 'stock', 'available', 'featured',
+    )
+    for slug, name, category, description, price, stock, available, featured in rows.iterator(chunk_size=chunk_size):
+        yield {
+            'slug': slug, 'name': name, 'category': category or '', 'description': description,
+            # A string, so JSON consumers don't turn 19.99 into a float
+            'price': str(price), 'stock': stock, 'available': available, 'featured': featured,
+        }
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f'not a boolean: {value!r}')
+
+
+def parse_price(value):
+    try:
+        price = Decimal(str(value).strip())
+        # NaN and Infinity are valid Decimals but not prices
+        if not price.is_finite():
+            raise InvalidOperation
+        price = price.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'not a price: {value!r}')
+    if price < 0 or price >= Decimal('1e8'):
+        raise ValueError(f'price out of range: {value!r}')
+    return price
+
+
+def parse_name(value):
+    name = str(value).strip()[:200]
+    if not name:
+        raise ValueError('no name')
+    return name
+
+
+def parse_stock(value):
+    stock = int(str(value).strip())
+    if stock < 0:
+        raise ValueError(f'negative stock: {value!r}')
+    return stock
+
+
+PARSERS = {
+    'name': parse_name,
+    'description': str,
+    'price': parse_price,
+    'stock': parse_stock,
+    'available': parse_bool,
+    'featured': parse_bool,
+}
+
+
+class CatalogImporter:
+    """
+    Upserts feed rows in batches of ``batch_size``. Each batch is its own
+    transaction, so a failure leaves earlier batches imported and the feed
+    can simply be run again.
+    """
+
+    def __init__(self, batch_size=1000, dry_run=False, max_errors=20):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.max_errors = max_errors
+        self.columns = None
+        self.categories = None
+        self.created = self.updated = self.categories_created = 0
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, line_num, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f'line {line_num}: {message}')
+
+    def run(self, rows):
+        """
+        Import (line number, row) pairs as produced by ``read_feed``.
+        """
+        batch = {}
+        for line_num, raw in rows:
+            if self.columns is None:
+                # The first row decides which columns the import overwrites
+                self.columns = [field for field in FIELDS if field in raw]
+                if 'slug' not in self.columns and 'name' not in self.columns:
+                    raise FeedError('the feed needs a slug or name column')
+            values = self.parse(line_num, raw)
+            if values is None:
+                continue
+            # A slug repeated within a batch keeps its last row; one
+            # INSERT ... ON CONFLICT can't touch the same row twice
+            batch.pop(values['slug'], None)
+            batch[values['slug']] = (line_num, values)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = {}
+        if batch:
+            self.flush(batch)
+        if not self.dry_run and (self.created or self.updated):
+            invalidate_summary()
+        return self
+
+    def parse(self, line_num, raw):
+        values = {}
+        try:
+            for field in self.columns:
+                if field not in PARSERS:
+                    continue
+                value = raw.get(field)
+                if value is None or value == '':
+                    if field not in DEFAULTS:
+                        raise ValueError(f'no {field}')
+                    values[field] = DEFAULTS[field]
+                else:
+                    values[field] = PARSERS[field](value)
+            values['slug'] = slugify(raw.get('slug') or values.get('name', ''))
+        except (ArithmeticError, TypeError, ValueError) as e:
+            self.error(line_num, e)
+            return None
+        if not values['slug']:
+            self.error(line_num, 'no slug or name')
+            return None
+        if 'category' in self.columns:
+            values['category'] = str(raw.get('category') or '').strip()
+        return values
+
+    def resolve_categories(self, names):
+        """
+        Map category names to ids, creating the missing categories.
+        """
+        if self.categories is None:
+            self.categories = dict(Category.objects.values_list('slug', 'id'))
+        missing = {}
+        for name in names:
+            slug = slugify(name)
+            if slug and slug not in self.categories:
+                missing.setdefault(slug, name[:200])
+        if missing:
+            if not self.dry_run:
+                Category.objects.bulk_create(
+                    [Category(name=name, slug=slug) for slug, name in missing.items()], ignore_conflicts=True,
+                )
+                self.categories.update(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+                bump_category_nav_version()
+            else:
+                self.categories.update((slug, None) for slug in missing)
+            self.categories_created += len(missing)
+        return {name: self.categories.get(slugify(name)) for name in names}
+
+    def flush(self, batch):
+        # Reads inside the transaction go to the primary, not the replica
+        with transaction.atomic():
+            self.upsert(batch)
+
+    def upsert(self, batch):
+        existing = set(Product.objects.filter(slug__in=list(batch)).values_list('slug', flat=True))
+        category_ids = {}
+        if 'category' in self.columns:
+            category_ids = self.resolve_categories({values['category'] for _, values in batch.values()})
+        products = []
+        for slug, (line_num, values) in batch.items():
+            if slug not in existing:
+                missing = [field for field in REQUIRED_FOR_CREATE if field not in values]
+                if missing:
+                    self.error(line_num, f'unknown slug {slug!r} and no {", ".join(missing)} to create it')
+                    continue
+            product = Product(
+                slug=slug, name=values.get('name', ''), description=values.get('description', ''),
+                price=values.get('price', 0), stock=values.get('stock', DEFAULTS['stock']),
+                available=values.get('available', DEFAULTS['available']),
+                featured=values.get('featured', DEFAULTS['featured']),
+            )
+            if 'category' in values:
+                product.category_id = category_ids.get(values['category'])
+            products.append(product)
+            if slug in existing:
+                self.updated += 1
+            else:
+                self.created += 1
+        if self.dry_run or not products:
+            return
+
+        # ``updated`` moves cached product cards to a fresh key
+        update_fields = [field for field in self.columns if field != 'slug'] + ['updated']
+        Product.objects.bulk_create(
+            products, update_conflicts=True, unique_fields=['slug'], update_fields=update_fields,
+        )
+        if 'name' in self.columns or 'description' in self.columns:
+            index_products(
+                Product.objects.filter(slug__in=[product.slug for product in products])
+                .only('id', 'name', 'description')
+            )
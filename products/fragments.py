@@ -0,0 +1,36 @@
+"""
+Template fragment caching for catalog markup.
+
+Product cards are cached under ``product_card`` keyed by product id and
+``updated``, so any save moves the card to a fresh key; deleting a product
+drops its entry. Layout fragments that list categories vary on a category
+navigation version that is bumped whenever a category is saved or deleted.
+Everything goes through the configured cache, so entries are per-process
+with locmem and shared between workers with Redis or Memcached.
+"""
+import time
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+CATEGORY_NAV_VERSION_KEY = 'products:category_nav_version'
+
+
+def category_nav_version():
+    """
+    Current category navigation version, used as a ``{% cache %}`` vary-on
+    value by fragments that render the category list.
+    """
+    return cache.get_or_set(CATEGORY_NAV_VERSION_KEY, time.time_ns(), None)
+
+
+def bump_category_nav_version():
+    cache.set(CATEGORY_NAV_VERSION_KEY, time.time_ns(), None)
+
+
+def product_card_key(product):
+    return make_template_fragment_key('product_card', [product.id, product.updated])
+
+
+def invalidate_product_card(product):
+    cache.delete(product_card_key(product))
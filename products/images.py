@@ -0,0 +1,158 @@
+"""
+Responsive image derivatives for Product.image and ProductImage.image.
+
+Every uploaded image is resized to the IMAGE_DERIVATIVE_WIDTHS narrower than
+the original, in WebP and JPEG. Derivatives are content-addressed: they are
+stored under ``IMAGE_DERIVATIVE_DIR/<xx>/<digest>/<width>.<format>`` with the
+digest taken from the original file's bytes, so the same picture uploaded
+twice is stored once, and a replaced image gets new URLs that can be
+cached forever.
+
+Each row records what was generated in ``image_variants``: the image name it
+was made from, the digest and the widths. The ``responsive_image`` template
+tag only uses a record whose source still matches the current image, and
+falls back to the original otherwise.
+
+Saving a row with a new image schedules the work after commit on a process
+pool (IMAGE_DERIVATIVE_WORKERS processes), which reads, hashes and resizes
+the file, so uploads don't wait for Pillow. The build_image_derivatives
+command covers existing media, rows written without signals and storage
+backends without local files.
+"""
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.functions import Now
+
+from utils.background import BackgroundPool
+from utils.images import FORMATS, digest_and_render_file, source_digest
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_pool = BackgroundPool('IMAGE_DERIVATIVE_WORKERS', 1)
+
+
+def derivative_widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (120, 240, 400, 800, 1200))))
+
+
+def derivative_dir(digest):
+    return f"{getattr(settings, 'IMAGE_DERIVATIVE_DIR', 'derivatives')}/{digest[:2]}/{digest}"
+
+
+def derivative_name(digest, width, fmt):
+    return f'{derivative_dir(digest)}/{width}.{EXTENSIONS[fmt]}'
+
+
+def variants_record(source, digest, widths):
+    return {'source': source, 'digest': digest, 'widths': sorted(widths)}
+
+
+def current_variants(obj):
+    """
+    The derivative record for ``obj``'s current image, or None if it has
+    none yet (or it was made from a previous image).
+    """
+    record = obj.image_variants or {}
+    if not obj.image or record.get('source') != obj.image.name:
+        return None
+    return record
+
+
+def needs_variants(obj):
+    return bool(obj.image) and current_variants(obj) is None
+
+
+def stored_widths(digest):
+    """
+    Widths already generated for ``digest`` in every format, or None if the
+    derivatives haven't been made.
+    """
+    try:
+        _, files = default_storage.listdir(derivative_dir(digest))
+    except (FileNotFoundError, NotImplementedError):
+        return None
+    by_format = {fmt: set() for fmt in FORMATS}
+    extensions = {ext: fmt for fmt, ext in EXTENSIONS.items()}
+    for name in files:
+        width, _, ext = name.partition('.')
+        if width.isdigit() and ext in extensions:
+            by_format[extensions[ext]].add(int(width))
+    widths = set.intersection(*by_format.values())
+    # The directory only exists once a render was stored; an image smaller
+    # than every width legitimately has no derivatives at all.
+    return sorted(widths) if widths or files else None
+
+
+def store_variants(digest, variants):
+    """
+    Save rendered (width, format, bytes) derivatives. Returns the widths.
+    """
+    for width, fmt, content in variants:
+        name = derivative_name(digest, width, fmt)
+        if not default_storage.exists(name):
+            saved = default_storage.save(name, ContentFile(content))
+            if saved != name:
+                # Another process stored the same derivative first
+                default_storage.delete(saved)
+    # Marks the digest as done even when the image was too small to resize
+    if not variants:
+        default_storage.save(f'{derivative_dir(digest)}/none', ContentFile(b''))
+    return sorted({width for width, _, _ in variants})
+
+
+def save_variants(model, pk, record):
+    """
+    Record derivatives on a row, provided its image hasn't changed meanwhile.
+    """
+    fields = {'image_variants': record}
+    if any(field.name == 'updated' for field in model._meta.concrete_fields):
+        # Moves cached product cards to a fresh key
+        fields['updated'] = Now()
+    return model.objects.filter(pk=pk, image=record['source']).update(**fields)
+
+
+def read_source(obj):
+    with obj.image.open('rb') as f:
+        return f.read()
+
+
+def request_variants(obj):
+    """
+    Generate derivatives for ``obj``'s image in the background, unless they
+    are being made already. Returns a future for the stored record (None if
+    the image couldn't be read or decoded), or None if the image isn't a
+    local file.
+    """
+    model, pk, source = type(obj), obj.pk, obj.image.name
+    try:
+        path = obj.image.path
+    except NotImplementedError:
+        return None
+
+    def store(render):
+        # Runs in the pool's result thread once the images are back
+        try:
+            digest, variants = render.result()
+            if digest is None:
+                logger.warning(f'Image {source} for {model.__name__} {pk} is unreadable')
+                return None
+            # Another row with the same picture may have stored them first
+            widths = stored_widths(digest)
+            if widths is None:
+                if variants is None:
+                    logger.warning(f'Image {source} for {model.__name__} {pk} could not be decoded')
+                    return None
+                widths = store_variants(digest, variants)
+            record = variants_record(source, digest, widths)
+            save_variants(model, pk, record)
+            return record
+        except Exception as e:
+            logger.error(f'Generating derivatives of {source} failed: {e}')
+            return None
+
+    return _pool.submit((model, pk, source), digest_and_render_file, path, derivative_widths(), on_done=store)
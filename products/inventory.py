@@ -0,0 +1,107 @@
+"""
+Stock reservation.
+
+Every line of a checkout is taken out of ``Product.stock`` by one conditional
+UPDATE::
+
+    UPDATE product SET stock = stock - CASE id WHEN ... END
+    WHERE id IN (...) AND stock >= CASE id WHEN ... END
+
+The database checks and decrements each row atomically, so two checkouts can
+never both take the last unit and no row locks are held between reading and
+writing. If fewer rows were updated than requested, the partial update is
+rolled back and the short lines are reported.
+
+Stock is written with queryset updates, which skip model signals, so
+``updated`` is bumped here (it keys the cached product cards) and the catalog
+summary is invalidated once the transaction commits.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+
+from .catalog import invalidate_summary
+from .models import Product
+
+StockShortfall = namedtuple('StockShortfall', ['product_id', 'requested', 'available'])
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__(', '.join(
+            f'product {s.product_id}: {s.requested} requested, {s.available} available'
+            for s in shortfalls
+        ))
+
+
+def _quantities(lines):
+    """
+    Merge (product_id, quantity) pairs into {product_id: quantity}.
+    """
+    quantities = {}
+    for product_id, quantity in lines:
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise ValueError(f'Invalid quantity {quantity} for product {product_id}')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _per_product(quantities):
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _shortfalls(quantities):
+    available = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'stock'))
+    return [
+        StockShortfall(product_id, quantity, available.get(product_id, 0))
+        for product_id, quantity in quantities.items()
+        if available.get(product_id, 0) < quantity
+    ]
+
+
+def reserve_stock(lines, attempts=3):
+    """
+    Take ``lines`` of (product_id, quantity) out of stock, all or nothing.
+    Raises InsufficientStock listing every line that can't be filled.
+    """
+    quantities = _quantities(lines)
+    if not quantities:
+        return
+    amount = _per_product(quantities)
+    shortfalls = []
+    for _ in range(attempts):
+        with transaction.atomic():
+            updated = Product.objects.filter(pk__in=quantities, stock__gte=amount).update(
+                stock=F('stock') - amount, updated=Now(),
+            )
+            if updated == len(quantities):
+                transaction.on_commit(invalidate_summary)
+                return
+            transaction.set_rollback(True)
+        shortfalls = _shortfalls(quantities)
+        if shortfalls:
+            raise InsufficientStock(shortfalls)
+        # Stock came back between the UPDATE and the re-read; try again.
+    raise InsufficientStock(shortfalls or [
+        StockShortfall(product_id, quantity, None) for product_id, quantity in quantities.items()
+    ])
+
+
+def release_stock(lines):
+    """
+    Put ``lines`` of (product_id, quantity) back into stock in one UPDATE.
+    """
+    quantities = _quantities(lines)
+    if not quantities:
+        return
+    amount = _per_product(quantities)
+    Product.objects.filter(pk__in=quantities).update(stock=F('stock') + amount, updated=Now())
+    transaction.on_commit(invalidate_summary)
@@ -1,27 +1,41 @@
-from django.core.management.base import BaseCommand
-from django.db.models import Q
-from products.models import Product, Category
-import random
+from django.core.management.base import BaseCommand, CommandError
+from products.categorize import CategoryAssigner, RuleError, load_rules
 
 class Command(BaseCommand):
-    help = 'Assigns random categories to existing products'
+    help = 'Assign categories to products from keyword/regex rules (dry run unless --apply)'
 
-    def handle(self, *args, **kwargs):
-        # Get all products without a category
-        products = Product.objects.filter(Q(category__isnull=True))
-        categories = list(Category.objects.all())
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true', help='Write the assignments')
+        parser.add_argument('--all', action='store_true',
+                            help='Also re-categorize products that already have a category')
+        parser.add_argument('--rules', help='JSON file of rules instead of PRODUCT_CATEGORY_RULES')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Products read and updated at a time')
 
-        if not categories:
+    def handle(self, *args, **options):
+        try:
+            rules = load_rules(options['rules'])
+            assigner = CategoryAssigner(
+                rules, chunk_size=options['chunk_size'], overwrite=options['all'], apply=options['apply'],
+            ).run()
+        except RuleError as e:
+            raise CommandError(f'{e}. Run create_categories first or fix the rules.'
+                               if str(e).startswith('Unknown categories') else e)
+
+        self.stdout.write(f'{"rule":<4} {"category":<28} {"hits":>8} {"changes":>8}')
+        for index, rule in enumerate(rules):
             self.stdout.write(
-                self.style.ERROR('No categories found. Please run create_categories first.')
+                f'{index + 1:<4} {rule.category:<28} {assigner.hits[index]:>8} {assigner.changes[index]:>8}'
             )
-            return
-
-        for product in products:
-            # Assign a random category
-            category = random.choice(categories)
-            product.category = category
-            product.save()
+        changed = sum(assigner.changes.values())
+        self.stdout.write(
+            f'{assigner.scanned} products scanned, {assigner.unmatched} matched no rule, '
+            f'{changed} {"recategorized" if options["apply"] else "would change"}'
+        )
+        if assigner.scanned:
             self.stdout.write(
-                self.style.SUCCESS(f'Assigned category "{category.name}" to product "{product.name}"')
+                f'Throughput: {assigner.scanned / assigner.elapsed:.0f} products/sec'
             )
+        if options['apply']:
+            self.stdout.write(self.style.SUCCESS(f'Done in {assigner.elapsed:.1f}s'))
+        else:
+            self.stdout.write(self.style.WARNING('Dry run: nothing was written. Use --apply to save.'))
@@ -0,0 +1,112 @@
+import os
+import random
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.feeds import FORMATS, CatalogImporter, FeedWriter, export_rows, open_feed, read_feed
+from products.models import Category, Product
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+WORDS = [
+    'handcrafted', 'wooden', 'box', 'personalized', 'photo', 'frame', 'aromatherapy',
+    'candle', 'necklace', 'silver', 'gold', 'chocolate', 'gourmet', 'leather', 'journal',
+    'plant', 'pot', 'bamboo', 'tea', 'crystal', 'wine', 'glass', 'clock', 'luxury',
+]
+SLUG_PREFIX = 'bench-catalog-'
+CATEGORY_PREFIX = 'Bench Catalog '
+
+def peak_rss_mb():
+    if resource is None:
+        return float('nan')
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Command(BaseCommand):
+    help = 'Benchmark import_catalog/export_catalog on a synthetic feed and check memory stays flat'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Products in the synthetic feed')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic products afterwards')
+
+    def handle(self, *args, **options):
+        total = options['rows']
+        fmt = options['format']
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG is on: every query is logged, which inflates time and memory'))
+        rng = random.Random(42)
+        with tempfile.TemporaryDirectory() as directory:
+            feed = os.path.join(directory, f'feed.{fmt}')
+            started = time.perf_counter()
+            with open_feed(feed, 'w') as f:
+                writer = FeedWriter(f, fmt)
+                for i in range(total):
+                    writer.write({
+                        'slug': f'{SLUG_PREFIX}{i}',
+                        'name': ' '.join(rng.sample(WORDS, 3)).title(),
+                        'category': f'{CATEGORY_PREFIX}{i % 50}',
+                        'description': ' '.join(rng.choices(WORDS, k=15)),
+                        'price': f'{rng.randint(100, 50000) / 100:.2f}',
+                        'stock': rng.randint(0, 50),
+                        'available': True,
+                        'featured': i % 100 == 0,
+                    })
+            self.stdout.write(
+                f'Wrote {total} rows ({os.path.getsize(feed) / 1024 / 1024:.0f} MB) '
+                f'in {time.perf_counter() - started:.1f}s'
+            )
+            self.stdout.write(f'{"phase":<10} {"rows":>9} {"seconds":>8} {"rows/sec":>9} {"peak RSS MB":>12}')
+            # Run twice: the first pass inserts everything, the second is all updates
+            for phase in ('insert', 'update'):
+                self.report(phase, *self.time_import(feed, fmt, options['batch_size'], total))
+
+            export = os.path.join(directory, f'export.{fmt}')
+            started = time.perf_counter()
+            count = 0
+            with open_feed(export, 'w') as f:
+                writer = FeedWriter(f, fmt)
+                for row in export_rows(Product.objects.filter(slug__startswith=SLUG_PREFIX)):
+                    writer.write(row)
+                    count += 1
+            self.report('export', count, time.perf_counter() - started, peak_rss_mb())
+
+        if not options['keep']:
+            started = time.perf_counter()
+            # Deleted a chunk at a time so the collector never holds the lot
+            products = Product.objects.filter(slug__startswith=SLUG_PREFIX)
+            while True:
+                chunk = list(products.values_list('pk', flat=True)[:options['batch_size'] * 10])
+                if not chunk:
+                    break
+                Product.objects.filter(pk__in=chunk).delete()
+            Category.objects.filter(name__startswith=CATEGORY_PREFIX).delete()
+            self.stdout.write(f'Removed synthetic products in {time.perf_counter() - started:.1f}s')
+
+    def time_import(self, feed, fmt, batch_size, total):
+        """
+        Import the feed, noting peak RSS a tenth of the way through so a
+        growing footprint shows up as a difference from the final peak.
+        """
+        checkpoint = {}
+
+        def rows(f):
+            for n, row in enumerate(read_feed(f, fmt)):
+                if n == total // 10:
+                    checkpoint['rss'] = peak_rss_mb()
+                yield row
+
+        started = time.perf_counter()
+        with open_feed(feed, 'r') as f:
+            importer = CatalogImporter(batch_size=batch_size).run(rows(f))
+        elapsed = time.perf_counter() - started
+        if importer.error_count:
+            self.stderr.write(f'{importer.error_count} rows rejected, e.g. {importer.errors[0]}')
+        self.stdout.write(f'  (peak RSS at 10%: {checkpoint.get("rss", float("nan")):.0f} MB)')
+        return importer.created + importer.updated, elapsed, peak_rss_mb()
+
+    def report(self, phase, rows, elapsed, rss):
+        self.stdout.write(f'{phase:<10} {rows:>9} {elapsed:>8.1f} {rows / elapsed:>9.0f} {rss:>12.0f}')
@@ -0,0 +1,93 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from products.models import Product
+from products.search import get_backend, rebuild_index, search_products
+
+WORDS = [
+    'handcrafted', 'wooden', 'box', 'personalized', 'photo', 'frame', 'aromatherapy',
+    'candle', 'necklace', 'silver', 'gold', 'chocolate', 'gourmet', 'leather', 'journal',
+    'plant', 'pot', 'bamboo', 'tea', 'crystal', 'wine', 'glass', 'clock', 'luxury',
+    'premium', 'artisan', 'vintage', 'modern', 'hamper', 'basket', 'blanket', 'scarf',
+]
+QUERIES = ['choc', 'wooden box', 'silver neck', 'tea', 'lux hamper', 'photo frame gold', 'giftnestmissing']
+SLUG_PREFIX = 'bench-search-'
+
+class Command(BaseCommand):
+    help = 'Benchmark product search latency (full-text index vs. icontains) on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Synthetic products to create')
+        parser.add_argument('--runs', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic products afterwards')
+
+    def handle(self, *args, **options):
+        total = options['products']
+        existing = Product.objects.filter(slug__startswith=SLUG_PREFIX).count()
+        if existing < total:
+            self.stdout.write(f'Creating {total - existing} synthetic products...')
+            rng = random.Random(42)
+            # A few thousand filler words keep the term distribution closer to
+            # a real catalog than the handful of gift words alone.
+            vocabulary = WORDS + [
+                ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 9)))
+                for _ in range(5000)
+            ]
+            batch = []
+            for i in range(existing, total):
+                name = ' '.join(rng.sample(vocabulary, 3)).title()
+                batch.append(Product(
+                    name=name,
+                    slug=f'{SLUG_PREFIX}{i}',
+                    description=' '.join(rng.choices(vocabulary, k=20)),
+                    price=rng.randint(100, 50000) / 100,
+                    stock=rng.randint(0, 50),
+                ))
+                if len(batch) == 5000:
+                    Product.objects.bulk_create(batch)
+                    batch = []
+            if batch:
+                Product.objects.bulk_create(batch)
+            # bulk_create bypasses the save signals that maintain the index
+            rebuild_index()
+
+        self.stdout.write(f'Backend: {type(get_backend()).__name__}, catalog size: {Product.objects.count()}')
+        self.stdout.write(f'{"query":<20} {"fts p50 ms":>11} {"fts p95 ms":>11} {"like p50 ms":>12} {"hits":>7}')
+
+        # Each timed run is what a listing page does: fetch one page and COUNT.
+        base = Product.objects.filter(available=True)
+        for text in QUERIES:
+            fts_qs = search_products(base, text).order_by('-search_rank', 'id')
+            like_q = Q()
+            for term in text.split():
+                like_q &= Q(name__icontains=term) | Q(description__icontains=term)
+            like_qs = base.filter(like_q).order_by('name', 'id')
+            fts = lambda: (list(fts_qs[:9]), fts_qs.count())
+            like = lambda: (list(like_qs[:9]), like_qs.count())
+            fts_times = self.time_runs(fts, options['runs'])
+            like_times = self.time_runs(like, options['runs'])
+            hits = search_products(base, text).count()
+            self.stdout.write(
+                f'{text:<20} {self.pct(fts_times, 50):>11.2f} {self.pct(fts_times, 95):>11.2f} '
+                f'{self.pct(like_times, 50):>12.2f} {hits:>7}'
+            )
+
+        if not options['keep']:
+            Product.objects.filter(slug__startswith=SLUG_PREFIX).delete()
+            self.stdout.write('Removed synthetic products.')
+
+    def time_runs(self, func, runs):
+        func()  # warm up
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def pct(self, timings, percentile):
+        if len(timings) < 2:
+            return timings[0]
+        return statistics.quantiles(timings, n=100)[percentile - 1]
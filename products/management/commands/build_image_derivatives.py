@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.core.management.base import BaseCommand, CommandError
+from products.images import (
+    derivative_widths, needs_variants, read_source, save_variants, source_digest, store_variants,
+    stored_widths, variants_record,
+)
+from products.models import Product, ProductImage
+from utils.images import Image, render_variants
+
+class Command(BaseCommand):
+    help = 'Generate responsive WebP/JPEG derivatives for product images that are missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Resizing processes')
+        parser.add_argument('--force', action='store_true',
+                            help='Render again even where derivatives exist, e.g. after changing IMAGE_DERIVATIVE_WIDTHS')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError('Pillow is not installed')
+        widths = derivative_widths()
+        counts = {'rendered': 0, 'reused': 0, 'current': 0, 'missing': 0, 'failed': 0}
+        # Rows waiting on a render, by content digest: identical files are
+        # resized once however many rows use them
+        waiting = {}
+        in_flight = {}
+        window = options['workers'] * 4
+        started = time.perf_counter()
+
+        def collect(done):
+            for future in done:
+                digest = in_flight.pop(future)
+                rows = waiting.pop(digest)
+                try:
+                    variants = future.result()
+                except Exception as e:
+                    variants = None
+                    self.stderr.write(f'{rows[0][2]}: {e}')
+                if variants is None:
+                    counts['failed'] += len(rows)
+                    continue
+                stored = store_variants(digest, variants)
+                for model, pk, source in rows:
+                    save_variants(model, pk, variants_record(source, digest, stored))
+                counts['rendered'] += len(rows)
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+            for model in (Product, ProductImage):
+                rows = model.objects.exclude(image='').only('pk', 'image', 'image_variants').order_by('pk')
+                for obj in rows.iterator(chunk_size=500):
+                    if not options['force'] and not needs_variants(obj):
+                        counts['current'] += 1
+                        continue
+                    try:
+                        data = read_source(obj)
+                    except OSError as e:
+                        counts['missing'] += 1
+                        self.stderr.write(f'{model.__name__} {obj.pk}: {e}')
+                        continue
+                    digest = source_digest(data)
+                    row = (model, obj.pk, obj.image.name)
+                    if digest in waiting:
+                        waiting[digest].append(row)
+                        continue
+                    existing = None if options['force'] else stored_widths(digest)
+                    if existing is not None:
+                        save_variants(model, obj.pk, variants_record(obj.image.name, digest, existing))
+                        counts['reused'] += 1
+                        continue
+                    if len(in_flight) >= window:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    waiting[digest] = [row]
+                    in_flight[pool.submit(render_variants, data, widths)] = digest
+            collect(wait(in_flight).done)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{counts["rendered"]} rendered, {counts["reused"]} reused existing derivatives, '
+            f'{counts["current"]} already current, {counts["missing"]} missing files, {counts["failed"]} failed'
+        )
+        if counts['rendered']:
+            self.stdout.write(f'Throughput: {counts["rendered"] / elapsed:.1f} images/sec')
+        if counts['failed']:
+            raise CommandError(f'{counts["failed"]} images could not be processed')
+        self.stdout.write(self.style.SUCCESS(f'Done in {elapsed:.1f}s'))
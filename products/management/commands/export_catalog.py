@@ -0,0 +1,47 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from products.feeds import FORMATS, FeedError, FeedWriter, export_rows, feed_format, open_feed
+from products.models import Product
+
+class Command(BaseCommand):
+    help = 'Export products as a CSV or JSON Lines feed that import_catalog can read back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file (.csv, .jsonl, optionally .gz), or - for stdout')
+        parser.add_argument('--format', choices=FORMATS, help='Feed format if the file name does not tell')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+        parser.add_argument('--category', help='Only products in the category with this slug')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            if path == '-':
+                if not options['format']:
+                    raise FeedError('Writing stdout needs --format')
+                f = sys.stdout
+            else:
+                f = open_feed(path, 'w')
+            fmt = feed_format(path, options['format'])
+        except (FeedError, OSError) as e:
+            raise CommandError(e)
+
+        products = Product.objects.all()
+        if options['category']:
+            products = products.filter(category__slug=options['category'])
+        started = time.perf_counter()
+        count = 0
+        writer = FeedWriter(f, fmt)
+        for row in export_rows(products, chunk_size=options['chunk_size']):
+            writer.write(row)
+            count += 1
+        if f is sys.stdout:
+            f.flush()
+        else:
+            f.close()
+        elapsed = time.perf_counter() - started
+
+        # Keep stdout clean for the feed itself
+        report = self.stderr if f is sys.stdout else self.stdout
+        report.write(f'Exported {count} products ({count / elapsed if elapsed else 0:.0f} rows/sec)')
+        report.write(self.style.SUCCESS(f'Done in {elapsed:.1f}s'))
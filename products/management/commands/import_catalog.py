@@ -0,0 +1,49 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from products.feeds import FORMATS, CatalogImporter, FeedError, feed_format, open_feed, read_feed
+
+class Command(BaseCommand):
+    help = 'Import products from a CSV or JSON Lines feed, creating or updating them by slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file (.csv, .jsonl, optionally .gz), or - for stdin')
+        parser.add_argument('--format', choices=FORMATS, help='Feed format if the file name does not tell')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products per INSERT ... ON CONFLICT')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the feed and report without writing')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            if path == '-':
+                if not options['format']:
+                    raise FeedError('Reading stdin needs --format')
+                f = sys.stdin
+            else:
+                f = open_feed(path, 'r')
+            fmt = feed_format(path, options['format'])
+        except (FeedError, OSError) as e:
+            raise CommandError(e)
+
+        importer = CatalogImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        started = time.perf_counter()
+        try:
+            with f:
+                importer.run(read_feed(f, fmt))
+        except FeedError as e:
+            raise CommandError(f'{e} ({importer.created} created and {importer.updated} updated before it)')
+        elapsed = time.perf_counter() - started
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        if importer.error_count > len(importer.errors):
+            self.stderr.write(f'... and {importer.error_count - len(importer.errors)} more')
+        rows = importer.created + importer.updated
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(
+            f'{verb} {rows} products: {importer.created} new, {importer.updated} updated, '
+            f'{importer.categories_created} new categories, {importer.error_count} rows skipped'
+        )
+        if rows:
+            self.stdout.write(f'Throughput: {rows / elapsed:.0f} rows/sec')
+        self.stdout.write(self.style.SUCCESS(f'Done in {elapsed:.1f}s'))
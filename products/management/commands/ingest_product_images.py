@@ -0,0 +1,270 @@
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from products.images import derivative_widths, source_digest, store_variants, stored_widths, variants_record
+from products.models import Product, ProductImage
+from utils.images import Image, render_file
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+# Ingested files are stored once per content digest, so running the command
+# again (or over a folder with copies) never duplicates anything
+LIBRARY_DIR = 'products/library'
+
+def library_name(digest, path):
+    return f'{LIBRARY_DIR}/{digest[:2]}/{digest}{os.path.splitext(path)[1].lower()}'
+
+def tokens(text):
+    return set(re.findall(r'[a-z0-9]{3,}', text.lower()))
+
+def stage(path, dry_run):
+    """
+    Hash ``path`` and copy it into the library unless it's there already.
+    Runs in a worker thread.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = source_digest(data)
+    name = library_name(digest, path)
+    new = not default_storage.exists(name)
+    if new and not dry_run:
+        saved = default_storage.save(name, ContentFile(data))
+        if saved != name:
+            # Another thread stored an identical file first
+            default_storage.delete(saved)
+            new = False
+    return digest, name, len(data), new, stored_widths(digest)
+
+class Command(BaseCommand):
+    help = (
+        'Copy images from a folder into the media library and attach them to products: '
+        'a main image where a product has none and up to --images gallery images'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', nargs='?', help='Folder to scan (default: static/images)')
+        parser.add_argument('--images', type=int, default=3, help='Gallery images per product')
+        parser.add_argument('--threads', type=int, default=min(32, (os.cpu_count() or 1) + 4),
+                            help='Threads hashing and copying files')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help='Processes generating responsive derivatives')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--replace', action='store_true',
+                            help='Replace existing main and gallery images instead of filling gaps')
+        parser.add_argument('--no-derivatives', action='store_true',
+                            help='Leave derivatives to build_image_derivatives')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be done without writing')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if directory is None:
+            static_root = settings.STATICFILES_DIRS[0] if settings.STATICFILES_DIRS else settings.BASE_DIR / 'static'
+            directory = os.path.join(static_root, 'images')
+        if not os.path.isdir(directory):
+            raise CommandError(f'{directory} is not a directory')
+        if not Product.objects.exists():
+            self.stdout.write(self.style.WARNING('No products found. Please add some products first.'))
+            return
+
+        paths = sorted(
+            os.path.join(root, name)
+            for root, dirs, files in os.walk(directory)
+            for name in files if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not paths:
+            self.stdout.write(self.style.WARNING(f'No image files found in {directory}.'))
+            return
+        self.stdout.write(f'Found {len(paths)} image files in {directory}')
+
+        dry_run = options['dry_run']
+        render = not (dry_run or options['no_derivatives'])
+        if render and Image is None:
+            self.stdout.write(self.style.WARNING('Pillow is not installed; skipping derivatives'))
+            render = False
+        started = time.perf_counter()
+        library, records = self.build_library(paths, options, render)
+        ingested = time.perf_counter()
+
+        images, products = self.assign(library, records, options)
+        finished = time.perf_counter()
+
+        counts = self.counts
+        megabytes = counts['bytes'] / 1024 / 1024
+        self.stdout.write(
+            f'{len(library)} unique images, {counts["duplicates"]} duplicates skipped, '
+            f'{counts["unreadable"]} unreadable'
+        )
+        self.stdout.write(
+            f'{counts["new"]} {"to copy" if dry_run else "copied"} to {LIBRARY_DIR}, '
+            f'{len(library) - counts["new"]} already there'
+        )
+        self.stdout.write(
+            f'Derivatives: {counts["rendered"]} rendered, {counts["reused"]} reused, '
+            f'{counts["render_failed"]} failed'
+        )
+        self.stdout.write(
+            f'{"Would create" if dry_run else "Created"} {images} gallery images and '
+            f'set {products} main images'
+        )
+        elapsed = finished - started
+        self.stdout.write(
+            f'Throughput: {len(paths) / elapsed:.1f} files/sec, {megabytes / elapsed:.1f} MB/sec '
+            f'({ingested - started:.1f}s hashing, copying and resizing {megabytes:.1f} MB, '
+            f'{finished - ingested:.1f}s writing rows)'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Done in {elapsed:.1f}s'))
+
+    def build_library(self, paths, options, render):
+        """
+        Hash and copy every file in a thread pool, and resize the new ones
+        in a process pool as they come in. Returns {digest: (name, paths)}
+        for the unique files and {digest: derivative widths}.
+        """
+        self.counts = counts = Counter()
+        library = {}
+        records = {}
+        staging = {}
+        rendering = {}
+        window = max(options['threads'], options['workers']) * 4
+        widths = derivative_widths()
+
+        def rendered(done):
+            for future in done:
+                digest = rendering.pop(future)
+                try:
+                    variants = future.result()
+                except Exception as e:
+                    variants = None
+                    self.stderr.write(f'{library[digest][1][0]}: {e}')
+                if variants is None:
+                    counts['render_failed'] += 1
+                    continue
+                records[digest] = store_variants(digest, variants)
+                counts['rendered'] += 1
+
+        def staged(done):
+            for future in done:
+                path = staging.pop(future)
+                try:
+                    digest, name, size, new, stored = future.result()
+                except OSError as e:
+                    counts['unreadable'] += 1
+                    self.stderr.write(f'{path}: {e}')
+                    continue
+                if digest in library:
+                    # Copies still lend their file names to the matching
+                    library[digest][1].append(path)
+                    counts['duplicates'] += 1
+                    continue
+                library[digest] = (name, [path])
+                counts['bytes'] += size
+                counts['new'] += new
+                if stored is not None:
+                    records[digest] = stored
+                    counts['reused'] += 1
+                elif render:
+                    if len(rendering) >= window:
+                        rendered(wait(rendering, return_when=FIRST_COMPLETED).done)
+                    rendering[processes.submit(render_file, path, widths)] = digest
+
+        context = multiprocessing.get_context('spawn')
+        with ThreadPoolExecutor(max_workers=options['threads']) as threads, \
+                ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as processes:
+            for path in paths:
+                if len(staging) >= window:
+                    staged(wait(staging, return_when=FIRST_COMPLETED).done)
+                staging[threads.submit(stage, path, options['dry_run'])] = path
+            staged(wait(staging).done)
+            rendered(wait(rendering).done)
+        return library, records
+
+    def assign(self, library, records, options):
+        """
+        Give every product a main image if it has none and fill its gallery
+        up to --images, preferring files whose names share words with the
+        product's slug. Returns (gallery images created, main images set).
+        """
+        entries = sorted(library.items(), key=lambda item: min(item[1][1]))
+        names = [name for _, (name, _) in entries]
+        # Words used by many files (IMG, DSC, ...) say nothing about a product
+        common = max(10, len(entries) // 20)
+        index = defaultdict(list)
+        for position, (_, (_, paths)) in enumerate(entries):
+            words = set().union(*(tokens(os.path.splitext(os.path.basename(path))[0]) for path in paths))
+            for token in words:
+                index[token].append(position)
+        index = {token: positions for token, positions in index.items() if len(positions) <= common}
+
+        def candidates(product):
+            scores = Counter()
+            for token in tokens(product.slug):
+                scores.update(index.get(token, ()))
+            yield from sorted(scores, key=lambda position: (-scores[position], position))
+            # Then the rest of the library, starting at a different place per
+            # product so the same few files aren't used everywhere
+            start = product.pk * (options['images'] + 1)
+            for offset in range(len(entries)):
+                yield (start + offset) % len(entries)
+
+        def record(position):
+            digest = entries[position][0]
+            widths = records.get(digest)
+            return variants_record(names[position], digest, widths) if widths is not None else {}
+
+        gallery = defaultdict(set)
+        if not options['replace']:
+            for product_id, name in ProductImage.objects.values_list('product_id', 'image'):
+                gallery[product_id].add(name)
+
+        new_images = []
+        updated_products = []
+        now = timezone.now()
+        products = Product.objects.only('pk', 'name', 'slug', 'image', 'image_variants', 'updated').order_by('pk')
+        for product in products.iterator(chunk_size=options['batch_size']):
+            needs_main = options['replace'] or not product.image
+            wanted = max(0, options['images'] - len(gallery[product.pk])) + needs_main
+            if not wanted:
+                continue
+            taken = set(gallery[product.pk])
+            if not needs_main:
+                taken.add(product.image.name)
+            picks = []
+            for position in candidates(product):
+                if len(picks) == wanted:
+                    break
+                if names[position] not in taken:
+                    taken.add(names[position])
+                    picks.append(position)
+            if needs_main and picks:
+                position = picks.pop(0)
+                product.image.name = names[position]
+                product.image_variants = record(position)
+                # bulk_update skips auto_now; a new value also moves cached
+                # product cards to a fresh key
+                product.updated = now
+                updated_products.append(product)
+            for view, position in enumerate(picks, start=len(gallery[product.pk]) + 1):
+                image = ProductImage(product_id=product.pk, alt_text=f'{product.name} - View {view}',
+                                     image_variants=record(position))
+                image.image.name = names[position]
+                new_images.append(image)
+
+        if not options['dry_run']:
+            # Bulk writes skip post_save, so no derivative jobs are queued:
+            # the records above were filled in from the library already
+            with transaction.atomic():
+                if options['replace']:
+                    ProductImage.objects.filter(product_id__in=[product.pk for product in updated_products]).delete()
+                ProductImage.objects.bulk_create(new_images, batch_size=options['batch_size'])
+                Product.objects.bulk_update(
+                    updated_products, ['image', 'image_variants', 'updated'], batch_size=options['batch_size'],
+                )
+        return len(new_images), len(updated_products)
@@ -1,8 +1,6 @@
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from products.models import Product
 from django.utils.text import slugify
-import random
+from products.feeds import CatalogImporter
 
 class Command(BaseCommand):
     help = 'Populate database with sample data'
@@ -72,17 +70,13 @@ class Command(BaseCommand):
             }
         ]
 
-        # Create products
-        for product_data in products_data:
-            product = Product(
-                name=product_data['name'],
-                slug=slugify(product_data['name']),
-                description=product_data['description'],
-                price=product_data['price'],
-                stock=product_data['stock'],
-                available=True
-            )
-            product.save()
-            self.stdout.write(self.style.SUCCESS(f'Created product: {product.name}'))
+        # Upserted by slug, so running this again updates rather than fails
+        importer = CatalogImporter().run(
+            (line, {**product_data, 'slug': slugify(product_data['name'])})
+            for line, product_data in enumerate(products_data, start=1)
+        )
+        for error in importer.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(f'Created {importer.created} and updated {importer.updated} products'))
 
         self.stdout.write(self.style.SUCCESS('Successfully populated database with sample data'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from products.models import Product, Review
+
+class Command(BaseCommand):
+    help = 'Rebuild per-star rating counters, rating sums, review counts and averages from the reviews table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products written per bulk update')
+
+    def handle(self, *args, **options):
+        # One grouped query gives every product's histogram
+        histograms = {}
+        for row in Review.objects.values('product_id', 'rating').annotate(n=Count('id')).order_by():
+            rating = Review.star_bucket(row['rating'])
+            if rating is not None:
+                histograms.setdefault(row['product_id'], {})[rating] = row['n']
+
+        fields = list(Product.COUNTER_FIELDS)
+        batch = []
+        updated = 0
+        for product in Product.objects.only('id', *fields).order_by('id').iterator(chunk_size=options['batch_size']):
+            histogram = histograms.get(product.id, {})
+            for rating in range(1, 6):
+                setattr(product, f'rating_{rating}', histogram.get(rating, 0))
+            total = sum(histogram.values())
+            product.review_count = total
+            product.rating_sum = sum(rating * n for rating, n in histogram.items())
+            product.average_rating = round(product.rating_sum / total, 2) if total else 0
+            batch.append(product)
+            if len(batch) >= options['batch_size']:
+                Product.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt rating counters for {updated} products ({len(histograms)} with reviews)')
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.search import get_backend, rebuild_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from the products table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = get_backend(using)
+        rebuild_index(using=using)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt search index ({type(backend).__name__}) for '
+                f'{Product.objects.using(using).count()} products'
+            )
+        )
@@ -0,0 +1,54 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from gift_shop.routers import routing_state
+from products.models import RelatedProduct
+from products.recommendations import RelatedProductsBuilder, last_refresh
+
+class Command(BaseCommand):
+    help = 'Recompute the related products shown on product pages for products that changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every product')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Products recomputed per transaction')
+        parser.add_argument('--candidates', type=int, default=20,
+                            help='Nearest-price candidates per product, in its category and overall')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a worker instead of exiting')
+        parser.add_argument('--interval', type=float, default=3600, help='Seconds between refreshes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            self.refresh(options)
+            if not options['loop']:
+                break
+            # Only the first pass is a full one
+            options['full'] = False
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def refresh(self, options):
+        started = time.perf_counter()
+        # Read the tables being rewritten from the primary
+        with routing_state(pinned=True):
+            builder = RelatedProductsBuilder(candidates=options['candidates'])
+            since = None if options['full'] else last_refresh()
+            if since is None:
+                product_ids = None
+                self.stdout.write(f'Full refresh of {len(builder.catalog)} available products')
+            else:
+                product_ids = builder.dirty_products(since)
+                self.stdout.write(f'{len(product_ids)} products changed since {since:%Y-%m-%d %H:%M:%S}')
+            loaded = time.perf_counter()
+
+            def progress(done, total):
+                if done % (options['chunk_size'] * 50) == 0:
+                    self.stdout.write(f'  {done}/{total}')
+
+            refreshed = builder.refresh(product_ids, chunk_size=options['chunk_size'], progress=progress)
+        elapsed = time.perf_counter() - started
+        if refreshed:
+            self.stdout.write(
+                f'Refreshed {refreshed} products ({refreshed / (elapsed - (loaded - started) or 1):.0f}/sec, '
+                f'{RelatedProduct.objects.count()} related entries, {loaded - started:.1f}s loading the catalog)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Done in {elapsed:.1f}s'))
@@ -0,0 +1,25 @@
+import sqlite3
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from gift_shop.routers import REPLICA_DB_ALIAS
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary database into the SQLite replica, standing in for replication locally'
+
+    def handle(self, *args, **options):
+        if REPLICA_DB_ALIAS not in connections.settings:
+            raise CommandError('No replica database configured; set DATABASE_REPLICA_URL')
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[REPLICA_DB_ALIAS]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Both databases must be SQLite; a real replica is kept up to date by the server')
+        replica.close()
+        primary.ensure_connection()
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            # Online backup: a consistent copy while the primary stays usable
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Copied {primary.settings_dict["NAME"]} to {replica.settings_dict["NAME"]}'
+        ))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:01
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_sum(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+    totals = Review.objects.values('product_id').annotate(total=Sum('rating'), n=Count('id')).order_by()
+    for row in totals:
+        Product.objects.filter(pk=row['product_id']).update(
+            rating_sum=row['total'],
+            review_count=row['n'],
+            average_rating=round(row['total'] / row['n'], 2),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_sum, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 from django.conf import settings
-from django.db.models import Avg
+from decimal import Decimal
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 class Category(models.Model):
     name = models.CharField(max_length=200)
@@ -34,6 +38,26 @@ class Product(models.Model):
     featured = models.BooleanField(default=False)
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
     review_count = models.PositiveIntegerField(default=0)
+    # Running total of all review ratings; average_rating = rating_sum / review_count
+    rating_sum = models.PositiveIntegerField(default=0)
+    # Per-star review counts, only ever written with F() updates
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    # Resized copies of ``image`` (see products/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Columns maintained atomically in the database; a regular save() of an
+    # existing product leaves them alone so stale in-memory values can't
+    # overwrite concurrent updates.
+    COUNTER_FIELDS = (
+        'average_rating', 'review_count', 'rating_sum',
+        'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+    )
+    # Written by the image derivative worker, never by a regular save()
+    WORKER_FIELDS = ('image_variants',)
 
     class Meta:
         ordering = ['name']
@@ -41,6 +65,8 @@ class Product(models.Model):
             models.Index(fields=['id', 'slug']),
             models.Index(fields=['name']),
             models.Index(fields=['featured']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['created', 'id']),
         ]
 
     def __str__(self):
@@ -48,19 +74,63 @@ class Product(models.Model):
 
     def get_absolute_url(self):
         return reverse('products:product_detail', args=[self.id])
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Fields deferred by only()/defer() weren't loaded, so there's
+            # nothing of ours to write; ``updated`` is set by auto_now
+            skipped = set(self.COUNTER_FIELDS + self.WORKER_FIELDS) | (self.get_deferred_fields() - {'updated'})
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped and field.name not in skipped
+            ]
+        super().save(*args, **kwargs)
         
-    def update_rating(self):
-        avg_rating = self.reviews.aggregate(Avg('rating'))['rating__avg']
-        self.average_rating = avg_rating if avg_rating else 0
-        self.review_count = self.reviews.count()
-        self.save()
+    def apply_review_change(self, added=None, removed=None):
+        """
+        Record a review entering the ``added`` star rating and/or leaving the
+        ``removed`` one. Counters, running sum and average are all updated in
+        a single UPDATE built from F() expressions, so concurrent reviews
+        never overwrite each other, and the change is mirrored on this
+        instance.
+        """
+        deltas = {}
+        if removed is not None:
+            deltas[f'rating_{removed}'] = -1
+        if added is not None:
+            deltas[f'rating_{added}'] = deltas.get(f'rating_{added}', 0) + 1
+        deltas['rating_sum'] = (added or 0) - (removed or 0)
+        deltas['review_count'] = (added is not None) - (removed is not None)
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        sum_delta = deltas.get('rating_sum', 0)
+        count_delta = deltas.get('review_count', 0)
+        # Every F() on the right-hand side reads the pre-update row
+        average = Case(
+            When(review_count__lte=-count_delta, then=Value(0.0)),
+            default=Cast(F('rating_sum') + sum_delta, FloatField()) / (F('review_count') + count_delta),
+            output_field=FloatField(),
+        )
+        Product.objects.filter(pk=self.pk).update(
+            average_rating=average,
+            **{field: F(field) + delta for field, delta in deltas.items()},
+        )
+
+        for field, delta in deltas.items():
+            setattr(self, field, getattr(self, field) + delta)
+        self.average_rating = (
+            round(Decimal(self.rating_sum) / self.review_count, 2) if self.review_count > 0 else Decimal('0')
+        )
 
     def get_rating_distribution(self):
         distribution = []
-        total_reviews = self.review_count
+        counts = {rating: getattr(self, f'rating_{rating}') for rating in range(1, 6)}
+        total_reviews = sum(counts.values())
         
         for rating in range(5, 0, -1):
-            count = self.reviews.filter(rating=rating).count()
+            count = counts[rating]
             percentage = (count / total_reviews * 100) if total_reviews > 0 else 0
             distribution.append({
                 'rating': rating,
@@ -76,6 +146,8 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=200, blank=True)
     is_primary = models.BooleanField(default=False)
     created = models.DateTimeField(auto_now_add=True)
+    # Resized copies of ``image`` (see products/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.product.name} - Image {self.id}"
@@ -94,10 +166,124 @@ class Review(models.Model):
     class Meta:
         ordering = ['-created']
         unique_together = ['product', 'user']
+        indexes = [
+            models.Index(fields=['product', 'created', 'id']),
+        ]
         
     def __str__(self):
         return f'{self.user.username}\'s review for {self.product.name}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+    @staticmethod
+    def star_bucket(rating):
+        """
+        Return ``rating`` as an int in 1..5, or None if it isn't one.
+        """
+        try:
+            rating = int(rating)
+        except (TypeError, ValueError):
+            return None
+        return rating if 1 <= rating <= 5 else None
         
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.product.update_rating()
+        previous = self.star_bucket(getattr(self, '_loaded_rating', None))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            current = self.star_bucket(self.rating)
+            self.product.apply_review_change(added=current, removed=previous)
+        self._loaded_rating = current
+
+class RelatedProduct(models.Model):
+    """
+    A precomputed "related products" entry (see products/recommendations.py),
+    rebuilt offline by refresh_related_products.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_to')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    # Start of the refresh that wrote this row
+    computed = models.DateTimeField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['computed']),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id} (#{self.rank})'
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    previous = Review.star_bucket(getattr(instance, '_loaded_rating', instance.rating))
+    try:
+        product = instance.product
+    except Product.DoesNotExist:
+        return
+    product.apply_review_change(removed=previous)
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog_summary(sender, **kwargs):
+    from .catalog import invalidate_summary
+    invalidate_summary()
+
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'description'} & set(update_fields):
+        return
+    from .search import index_products
+    index_products([instance], using=using)
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search(sender, instance, using, **kwargs):
+    from .search import remove_products
+    remove_products([instance.pk], using=using)
+
+@receiver(post_save, sender=Product)
+def update_product_autocomplete(sender, instance, **kwargs):
+    from .autocomplete import index
+    index.update_product(instance)
+
+@receiver(post_delete, sender=Product)
+def remove_product_autocomplete(sender, instance, **kwargs):
+    from .autocomplete import index
+    index.remove_product(instance.pk)
+
+@receiver(post_save, sender=Category)
+def update_category_autocomplete(sender, instance, **kwargs):
+    from .autocomplete import index
+    index.update_category(instance)
+
+@receiver(post_delete, sender=Category)
+def remove_category_autocomplete(sender, instance, **kwargs):
+    from .autocomplete import index
+    index.remove_category(instance.pk)
+
+@receiver(post_delete, sender=Product)
+def invalidate_product_fragments(sender, instance, **kwargs):
+    from .fragments import invalidate_product_card
+    invalidate_product_card(instance)
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_fragments(sender, **kwargs):
+    from .fragments import bump_category_nav_version
+    bump_category_nav_version()
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def generate_image_derivatives(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    from .images import needs_variants, request_variants
+    if needs_variants(instance):
+        transaction.on_commit(lambda: request_variants(instance))
@@ -0,0 +1,156 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by an opaque cursor holding the sort key of the first or
+last row of the neighbouring page, so fetching a page is an indexed range
+scan on the ordering columns with no OFFSET and no COUNT. Deep pages cost the
+same as page one. The ordering must end with a unique column (``id``) so
+that every row has a distinct key.
+"""
+import base64
+import binascii
+import json
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _encode_cursor(direction, values):
+    payload = json.dumps({'d': direction, 'k': values}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return payload['d'], payload['k']
+    except (binascii.Error, ValueError, UnicodeError, KeyError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """
+    One page of results, duck-compatible with the parts of Django's Page that
+    the templates use (iteration, has_next, has_previous, has_other_pages).
+    """
+
+    paginator = None
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+        self.fields = [
+            queryset.model._meta.get_field(name) for name, _ in self.ordering
+        ]
+
+    def _keys(self, obj):
+        return [field.value_from_object(obj) for field in self.fields]
+
+    def _parse(self, token):
+        decoded = _decode_cursor(token)
+        if decoded is None:
+            raise InvalidCursor(token)
+        direction, raw_values = decoded
+        if direction not in ('n', 'p') or not isinstance(raw_values, list) \
+                or len(raw_values) != len(self.fields):
+            raise InvalidCursor(token)
+        try:
+            values = [field.to_python(value) for field, value in zip(self.fields, raw_values)]
+        except Exception:
+            raise InvalidCursor(token)
+        return direction, values
+
+    def _after(self, values, reverse):
+        """
+        Q matching rows strictly after ``values`` in the ordering (or strictly
+        before it when ``reverse`` is set).
+        """
+        condition = Q()
+        for i, (name, descending) in enumerate(self.ordering):
+            forwards = descending == reverse
+            lookup = f'{name}__gt' if forwards else f'{name}__lt'
+            branch = Q(**{lookup: values[i]})
+            for j in range(i):
+                branch &= Q(**{self.ordering[j][0]: values[j]})
+            condition |= branch
+        return condition
+
+    def get_page(self, cursor=None):
+        """
+        Return the page addressed by ``cursor``, or the first page for a
+        missing or malformed cursor.
+        """
+        direction, values = 'n', None
+        if cursor:
+            try:
+                direction, values = self._parse(cursor)
+            except InvalidCursor:
+                direction, values = 'n', None
+
+        reverse = direction == 'p'
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+        order = [
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.ordering
+        ]
+        rows = list(queryset.order_by(*order)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage([], None, None)
+        if reverse:
+            has_next, has_previous = values is not None, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        next_cursor = _encode_cursor('n', self._keys(rows[-1])) if has_next else None
+        previous_cursor = _encode_cursor('p', self._keys(rows[0])) if has_previous else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def paginate(queryset, per_page, ordering, params):
+    """
+    Paginate ``queryset`` from request parameters: a legacy ``?page=N`` link
+    gets a regular offset page, anything else a keyset page addressed by
+    ``?cursor=``.
+    """
+    if params.get('page'):
+        return Paginator(queryset.order_by(*ordering), per_page).get_page(params.get('page'))
+    return KeysetPaginator(queryset, per_page, ordering).get_page(params.get('cursor'))
@@ -0,0 +1,190 @@
+"""
+Precomputed related products.
+
+Each available product's RELATED_PRODUCTS_STORED best neighbours are kept in
+the RelatedProduct table, so product_detail reads them with one query on the
+(product, rank) index. Neighbours are scored offline from three signals,
+weighted by RELATED_PRODUCTS_WEIGHTS:
+
+- co_purchase: how often the two products were ordered together, as a
+  cosine similarity of the orders they appear in (0..1);
+- category: 1 when both products are in the same category;
+- price: the ratio of the lower price to the higher (0..1).
+
+Scoring every pair is quadratic, so candidates for a product are its
+co-purchased products plus its nearest neighbours by price, within its
+category and across the catalog.
+
+refresh_related_products recomputes incrementally: only products that
+changed, appeared in new orders, or list a changed product as a neighbour
+since the last refresh. --full recomputes everything. Until a product's
+first refresh, product pages fall back to the newest products in its
+category.
+"""
+import math
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import Product, RelatedProduct
+
+DEFAULT_WEIGHTS = {'co_purchase': 3.0, 'category': 1.0, 'price': 0.5}
+
+
+def related_products(product, limit=4):
+    """
+    The top ``limit`` available neighbours of ``product``, or until the next
+    refresh gives it some, the newest products in its category.
+    """
+    related = list(
+        Product.objects.filter(related_to__product=product, available=True)
+        .order_by('related_to__rank')[:limit]
+    )
+    if related or product.category_id is None:
+        return related
+    return list(
+        Product.objects.filter(category_id=product.category_id, available=True)
+        .exclude(pk=product.pk).order_by('-created', '-id')[:limit]
+    )
+
+
+def nearest_by_price(entries, price, count):
+    """
+    Up to ``count`` ids from ``entries`` (sorted (price, id) pairs) with the
+    prices closest to ``price``.
+    """
+    right = bisect_left(entries, (price, -1))
+    left = right - 1
+    found = []
+    while len(found) < count and (left >= 0 or right < len(entries)):
+        if right >= len(entries) or (left >= 0 and price - entries[left][0] <= entries[right][0] - price):
+            found.append(entries[left][1])
+            left -= 1
+        else:
+            found.append(entries[right][1])
+            right += 1
+    return found
+
+
+class RelatedProductsBuilder:
+    def __init__(self, stored=None, candidates=20, weights=None):
+        self.stored = stored or getattr(settings, 'RELATED_PRODUCTS_STORED', 12)
+        self.candidates = candidates
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or getattr(settings, 'RELATED_PRODUCTS_WEIGHTS', {}))}
+        self.catalog = {}
+        by_price = []
+        by_category = defaultdict(list)
+        rows = Product.objects.filter(available=True).values_list('id', 'category_id', 'price')
+        for pk, category_id, price in rows.iterator(chunk_size=5000):
+            price = float(price)
+            self.catalog[pk] = (category_id, price)
+            by_price.append((price, pk))
+            if category_id is not None:
+                by_category[category_id].append((price, pk))
+        by_price.sort()
+        for entries in by_category.values():
+            entries.sort()
+        self.by_price = by_price
+        self.by_category = by_category
+        self.order_counts = {}
+
+    def dirty_products(self, since):
+        """
+        Ids of products whose neighbours may have changed since ``since``.
+        """
+        from orders.models import OrderItem
+
+        changed = set(Product.objects.filter(updated__gte=since).values_list('id', flat=True))
+        ordered = set(OrderItem.objects.filter(order__created__gte=since).values_list('product_id', flat=True))
+        # New products, and ones that came back into sale, have no rows yet
+        missing = set(self.catalog) - set(RelatedProduct.objects.values_list('product_id', flat=True).distinct())
+        dirty = changed | ordered | missing
+        # Products listing a changed one, whose score for it is now stale
+        dirty.update(RelatedProduct.objects.filter(related_id__in=changed).values_list('product_id', flat=True))
+        return dirty
+
+    def co_purchases(self, product_ids):
+        """
+        {product: {other: orders with both}} for ``product_ids``, and order
+        counts for every product involved.
+        """
+        from orders.models import OrderItem
+
+        pairs = defaultdict(dict)
+        rows = (
+            OrderItem.objects.filter(product_id__in=product_ids)
+            .values('product_id', other=F('order__items__product_id'))
+            .annotate(orders=Count('order_id', distinct=True))
+        )
+        for row in rows:
+            if row['other'] != row['product_id']:
+                pairs[row['product_id']][row['other']] = row['orders']
+        needed = set(product_ids).union(*pairs.values()) - set(self.order_counts)
+        if needed:
+            self.order_counts.update(
+                OrderItem.objects.filter(product_id__in=needed).values('product_id')
+                .annotate(orders=Count('order_id', distinct=True)).values_list('product_id', 'orders')
+            )
+        return pairs
+
+    def neighbours(self, pk, co_purchased):
+        category_id, price = self.catalog[pk]
+        candidates = set(co_purchased)
+        candidates.update(nearest_by_price(self.by_price, price, self.candidates + 1))
+        if category_id is not None:
+            candidates.update(nearest_by_price(self.by_category[category_id], price, self.candidates + 1))
+        candidates.discard(pk)
+        scored = []
+        for other in candidates:
+            if other not in self.catalog:
+                continue
+            other_category, other_price = self.catalog[other]
+            score = 0.0
+            together = co_purchased.get(other)
+            if together:
+                score += self.weights['co_purchase'] * together / math.sqrt(
+                    self.order_counts.get(pk, together) * self.order_counts.get(other, together)
+                )
+            if category_id is not None and other_category == category_id:
+                score += self.weights['category']
+            if max(price, other_price) > 0:
+                score += self.weights['price'] * min(price, other_price) / max(price, other_price)
+            if score > 0:
+                scored.append((-score, other))
+        scored.sort()
+        return [(other, -score) for score, other in scored[:self.stored]]
+
+    def refresh(self, product_ids=None, chunk_size=1000, progress=None):
+        """
+        Recompute neighbours for ``product_ids`` (default: all available
+        products). Returns the number of products refreshed.
+        """
+        started = timezone.now()
+        ids = sorted(self.catalog if product_ids is None else product_ids)
+        done = 0
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            available = [pk for pk in chunk if pk in self.catalog]
+            pairs = self.co_purchases(available)
+            rows = []
+            for pk in available:
+                for rank, (other, score) in enumerate(self.neighbours(pk, pairs.get(pk, {})), start=1):
+                    rows.append(RelatedProduct(product_id=pk, related_id=other, rank=rank, score=score,
+                                               computed=started))
+            with transaction.atomic():
+                # Unavailable products in the chunk just lose their rows
+                RelatedProduct.objects.filter(product_id__in=chunk).delete()
+                RelatedProduct.objects.bulk_create(rows, batch_size=2000)
+            done += len(chunk)
+            if progress:
+                progress(done, len(ids))
+        return len(ids)
+
+
+def last_refresh():
+    return RelatedProduct.objects.aggregate(last=Max('computed'))['last']
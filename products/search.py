@@ -0,0 +1,142 @@
+"""
+Full-text product search.
+
+On PostgreSQL products carry a generated ``search_vector`` tsvector column
+(name weighted above description) with a GIN index, so the index follows
+every write automatically. On SQLite an FTS5 table ``products_product_fts``
+mirrors name and description and is kept in sync from Product save/delete
+signals. Databases without either fall back to ``icontains`` matching.
+
+Every search term is matched as a prefix, and results are annotated with a
+``search_rank`` where higher means more relevant.
+"""
+import re
+
+from django.db import connections
+from django.db.models import IntegerField, Q, Value
+
+FTS_TABLE = 'products_product_fts'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Cache of "does this database have the FTS5 table" keyed by alias.
+_fts_available = {}
+
+
+def tokenize(text):
+    return [token.lower() for token in _TOKEN_RE.findall(text or '')]
+
+
+def _has_fts_table(connection):
+    alias = connection.alias
+    if alias not in _fts_available:
+        with connection.cursor() as cursor:
+            _fts_available[alias] = FTS_TABLE in connection.introspection.table_names(cursor)
+    return _fts_available[alias]
+
+
+class BasicSearchBackend:
+    """
+    LIKE-based matching for databases without a full-text index.
+    """
+
+    def search(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        return queryset.annotate(search_rank=Value(0, output_field=IntegerField()))
+
+    def index(self, connection, products):
+        pass
+
+    def remove(self, connection, product_ids):
+        pass
+
+    def rebuild(self, connection):
+        pass
+
+
+class PostgresSearchBackend(BasicSearchBackend):
+    """
+    tsvector/GIN search; the column is generated, so indexing is a no-op.
+    """
+
+    def search(self, queryset, terms):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.extra(
+            select={
+                'search_rank': 'ts_rank("products_product"."search_vector", to_tsquery(%s, %s))',
+            },
+            select_params=['english', tsquery],
+            where=['"products_product"."search_vector" @@ to_tsquery(%s, %s)'],
+            params=['english', tsquery],
+        )
+
+
+class SqliteSearchBackend(BasicSearchBackend):
+    """
+    FTS5 search; ranked with bm25, name weighted ten times the description.
+    """
+
+    def search(self, queryset, terms):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            select={'search_rank': f'-bm25("{FTS_TABLE}", 10.0, 1.0)'},
+            tables=[FTS_TABLE],
+            where=[
+                f'"{FTS_TABLE}"."rowid" = "products_product"."id"',
+                f'"{FTS_TABLE}" MATCH %s',
+            ],
+            params=[match],
+        )
+
+    def index(self, connection, products):
+        rows = [(p.id, p.name, p.description) for p in products]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO "{FTS_TABLE}" (rowid, name, description) VALUES (%s, %s, %s)', rows
+            )
+
+    def remove(self, connection, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{FTS_TABLE}"')
+            cursor.execute(
+                f'INSERT INTO "{FTS_TABLE}" (rowid, name, description) '
+                f'SELECT id, name, description FROM "products_product"'
+            )
+
+
+def get_backend(using='default'):
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite' and _has_fts_table(connection):
+        return SqliteSearchBackend()
+    return BasicSearchBackend()
+
+
+def search_products(queryset, text):
+    """
+    Restrict a Product queryset to matches for ``text`` and annotate each
+    row with ``search_rank``. Returns the queryset unchanged for blank text.
+    """
+    terms = tokenize(text)
+    if not terms:
+        return queryset
+    return get_backend(queryset.db).search(queryset, terms)
+
+
+def index_products(products, using='default'):
+    get_backend(using).index(connections[using], products)
+
+
+def remove_products(product_ids, using='default'):
+    get_backend(using).remove(connections[using], product_ids)
+
+
+def rebuild_index(using='default'):
+    get_backend(using).rebuild(connections[using])
@@ -0,0 +1,39 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from ..images import current_variants, derivative_name
+
+register = template.Library()
+
+
+def _srcset(digest, widths, fmt):
+    return ', '.join(f'{default_storage.url(derivative_name(digest, width, fmt))} {width}w' for width in widths)
+
+
+@register.simple_tag
+def responsive_image(obj, sizes='100vw', alt='', **attrs):
+    """
+    ``<picture>`` for a Product or ProductImage with WebP and JPEG
+    ``srcset``s of its derivatives, so the browser fetches the smallest copy
+    that fills ``sizes``. Falls back to a plain ``<img>`` of the original
+    until the derivatives exist. Extra keyword arguments become ``<img>``
+    attributes (use ``class_`` for ``class``).
+    """
+    if not obj.image:
+        return ''
+    attributes = format_html_join(
+        '', ' {}="{}"', ((name.rstrip('_').replace('_', '-'), value) for name, value in attrs.items()),
+    )
+    record = current_variants(obj)
+    if not record or not record['widths']:
+        return format_html('<img src="{}" alt="{}"{} loading="lazy">', obj.image.url, alt, attributes)
+    digest, widths = record['digest'], record['widths']
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{} loading="lazy"></picture>',
+        _srcset(digest, widths, 'webp'), sizes,
+        # Browsers without srcset get the largest JPEG, still smaller than the original
+        default_storage.url(derivative_name(digest, widths[-1], 'jpeg')),
+        _srcset(digest, widths, 'jpeg'), sizes, alt, attributes,
+    )
@@ -1,3 +1,315 @@
-from django.test import TestCase
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
\ No newline at end of file
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import OperationalError, connection, connections
+from django.db.utils import load_backend
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from gift_shop.settings import database_config
+
+from .autocomplete import AutocompleteIndex
+from .categorize import RuleError, load_rules
+from .feeds import CatalogImporter
+from .images import current_variants, request_variants
+from .recommendations import RelatedProductsBuilder, related_products
+from .models import Category, Product, Review
+
+
+def retry(func, attempts=50):
+    # SQLite serialises writers and reports contention as "database is locked"
+    for attempt in range(attempts):
+        try:
+            return func()
+        except OperationalError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.01 * (attempt + 1))
+
+
+class ProductSaveTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Vase', slug='vase', price=12, stock=4, description='Blue')
+
+    def test_save_of_partial_instance_leaves_deferred_fields_alone(self):
+        product = Product.objects.only('id', 'name').get(pk=self.product.pk)
+        Product.objects.filter(pk=product.pk).update(description='Green', stock=9)
+        product.name = 'Tall vase'
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        writes = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "products_product"')]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"name"', writes[0])
+        self.assertNotIn('"description"', writes[0])
+        self.assertNotIn('"stock"', writes[0])
+        # The image wasn't saved, so it isn't loaded to look for derivatives
+        self.assertIn('image', product.get_deferred_fields())
+        saved = Product.objects.get(pk=product.pk)
+        self.assertEqual((saved.name, saved.description, saved.stock), ('Tall vase', 'Green', 9))
+        self.assertGreater(saved.updated, self.product.updated)
+
+    def test_save_leaves_counters_alone(self):
+        Product.objects.filter(pk=self.product.pk).update(review_count=3, rating_sum=12)
+        self.product.price = 15
+        self.product.save()
+        saved = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((saved.price, saved.review_count, saved.rating_sum), (15, 3, 12))
+
+
+class CatalogImportTests(TestCase):
+    def test_non_finite_prices_are_row_errors(self):
+        rows = [
+            (2, {'slug': 'nan', 'name': 'NaN', 'price': 'NaN'}),
+            (3, {'slug': 'snan', 'name': 'sNaN', 'price': 'sNaN'}),
+            (4, {'slug': 'inf', 'name': 'Infinity', 'price': 'Infinity'}),
+            (5, {'slug': 'lamp', 'name': 'Lamp', 'price': '19.99'}),
+        ]
+        importer = CatalogImporter().run(rows)
+        self.assertEqual(importer.error_count, 3)
+        self.assertEqual(importer.created, 1)
+        self.assertEqual(list(Product.objects.values_list('slug', 'price')), [('lamp', Decimal('19.99'))])
+
+
+class RelatedProductsTests(TestCase):
+    def setUp(self):
+        self.mugs = Category.objects.create(name='Mugs', slug='mugs')
+        self.lamps = Category.objects.create(name='Lamps', slug='lamps')
+        self.mug = Product.objects.create(name='Mug', slug='mug', price=10, stock=1, category=self.mugs)
+        self.cup = Product.objects.create(name='Cup', slug='cup', price=11, stock=1, category=self.mugs)
+        self.lamp = Product.objects.create(name='Lamp', slug='lamp', price=10, stock=1, category=self.lamps)
+
+    def test_unrefreshed_product_falls_back_to_its_category(self):
+        self.assertEqual(related_products(self.mug), [self.cup])
+
+    def test_refreshed_product_uses_stored_neighbours(self):
+        RelatedProductsBuilder().refresh()
+        related = related_products(self.mug)
+        self.assertEqual(related[0], self.cup)
+        self.assertIn(self.lamp, related)
+
+
+class ProductListTests(TestCase):
+    def test_sidebar_shows_facet_counts_and_price_range(self):
+        mugs = Category.objects.create(name='Mugs', slug='mugs')
+        Category.objects.create(name='Lamps', slug='lamps')
+        Product.objects.create(name='Mug', slug='mug', price=10, stock=1, category=mugs)
+        Product.objects.create(name='Big mug', slug='big-mug', price=300, stock=0, category=mugs)
+        response = self.client.get(reverse('products:product_list'), {'in_stock': '1'})
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        content = content[content.index('<aside'):content.index('</aside>')]
+        self.assertRegex(content, r'>Mugs</a>\s*<span class="text-muted">1</span>')
+        # Categories with nothing to show are left out
+        self.assertNotIn('>Lamps</a>', content)
+        self.assertIn('Under $25', content)
+        self.assertIn('In stock only (1)', content)
+        self.assertIn('placeholder="10"', content)
+        self.assertIn('placeholder="300"', content)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        Product.objects.create(name='Gourmet Chocolate Collection', slug='chocolates', price=20, stock=1)
+        self.index = AutocompleteIndex()
+        self.index.rebuild()
+
+    def test_suggest_matches_word_starts(self):
+        self.assertEqual([s['label'] for s in self.index.suggest('choc')], ['Gourmet Chocolate Collection'])
+
+    def test_whole_names_beyond_the_scan_window_rank_first(self):
+        Product.objects.bulk_create([
+            Product(name=f'Gift candle {i:03}', slug=f'gift-candle-{i}', price=5, stock=1) for i in range(100)
+        ] + [Product(name='Cup', slug='cup', price=5, stock=1)])
+        self.index.rebuild()
+        labels = [s['label'] for s in self.index.suggest('c', limit=8)]
+        self.assertEqual(labels[0], 'Cup')
+        self.assertEqual(len(labels), 8)
+
+    def test_stale_index_is_refreshed_once_in_the_background(self):
+        started, release = threading.Event(), threading.Event()
+        rebuilds = []
+
+        def rebuild():
+            rebuilds.append(threading.current_thread())
+            started.set()
+            release.wait(10)
+
+        self.index._built_at -= 3600
+        with mock.patch.object(self.index, '_rebuild', side_effect=rebuild):
+            for _ in range(3):
+                # Served from the old arrays while the refresh runs
+                self.assertEqual(len(self.index.suggest('choc')), 1)
+            self.assertTrue(started.wait(10))
+            release.set()
+            with self.index._build_lock:
+                pass
+        self.assertEqual(len(rebuilds), 1)
+        self.assertIsNot(rebuilds[0], threading.current_thread())
+
+    def test_suggest_during_updates(self):
+        errors = []
+        done = threading.Event()
+
+        def writer():
+            try:
+                for i in range(2000):
+                    product = SimpleNamespace(pk=10_000 + i % 50, name=f'Chocolate box {i}', available=True)
+                    self.index.update_product(product)
+                    if i % 3 == 0:
+                        self.index.remove_product(product.pk)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                done.set()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            while not done.is_set():
+                for suggestion in self.index.suggest('choc', limit=5):
+                    self.assertTrue(suggestion['label'].lower().split()[0].startswith(('choc', 'gourmet')))
+        finally:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+class ImageDerivativeTests(TransactionTestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=media, IMAGE_DERIVATIVE_WIDTHS=(40, 80))
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def image(self):
+        from PIL import Image
+        out = io.BytesIO()
+        Image.new('RGB', (100, 60), (200, 30, 30)).save(out, 'PNG')
+        return ContentFile(out.getvalue(), name='red.png')
+
+    def test_derivatives_are_rendered_once_and_recorded(self):
+        # Saving queues a render after commit; this also requests it directly
+        product = Product.objects.create(name='Red', slug='red', price=1, stock=1, image=self.image())
+        first = request_variants(product)
+        self.assertIs(request_variants(product), first)
+        record = first.result(timeout=60)
+        self.assertEqual(record['widths'], [40, 80])
+        product.refresh_from_db()
+        self.assertEqual(current_variants(product), record)
+
+        # The same picture on another product reuses the stored files
+        other = Product.objects.create(name='Red too', slug='red-too', price=1, stock=1, image=self.image())
+        self.assertEqual(request_variants(other).result(timeout=60)['digest'], record['digest'])
+
+
+class CategoryRuleTests(TestCase):
+    def test_patterns_that_only_break_the_combined_regex_are_rule_errors(self):
+        for pattern in ('(?i)mug', '(?P<r0>mug)'):
+            with self.subTest(pattern=pattern), self.settings(PRODUCT_CATEGORY_RULES=[
+                {'category': 'mugs', 'keywords': ['cup']},
+                {'category': 'lamps', 'patterns': [pattern]},
+            ]):
+                with self.assertRaises(RuleError):
+                    load_rules()
+
+
+class ReviewRatingConcurrencyTests(TransactionTestCase):
+    writers = 6
+    reviews = 15
+
+    def test_counters_match_reviews_after_parallel_writes(self):
+        product = Product.objects.create(name='Rating stress', slug='rating-stress', price=1, stock=1)
+        users = User.objects.bulk_create([
+            User(username=f'rating-stress-{i}') for i in range(self.writers * self.reviews)
+        ])
+        errors = []
+
+        def writer(index):
+            rng = random.Random(index)
+            try:
+                for user in users[index * self.reviews:(index + 1) * self.reviews]:
+                    review = retry(lambda: Review.objects.create(
+                        product_id=product.id, user=user, rating=rng.randint(1, 5), content='stress',
+                    ))
+                    action = rng.random()
+                    if action < 0.3:
+                        review = retry(lambda: Review.objects.get(pk=review.pk))
+                        review.rating = rng.randint(1, 5)
+                        retry(review.save)
+                    elif action < 0.45:
+                        review = retry(lambda: Review.objects.get(pk=review.pk))
+                        retry(review.delete)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        product.refresh_from_db()
+        reviews = Review.objects.filter(product=product)
+        expected = reviews.aggregate(total=Sum('rating'), n=Count('id'))
+        histogram = dict(reviews.values_list('rating').annotate(n=Count('id')).order_by())
+        self.assertEqual(product.review_count, expected['n'])
+        self.assertEqual(product.rating_sum, expected['total'] or 0)
+        for rating in range(1, 6):
+            self.assertEqual(getattr(product, f'rating_{rating}'), histogram.get(rating, 0), f'rating_{rating}')
+        if expected['n']:
+            average = (Decimal(expected['total']) / expected['n']).quantize(Decimal('0.01'))
+            self.assertEqual(product.average_rating, average)
+
+
+class ConnectionReuseTests(SimpleTestCase):
+    requests = 1000
+
+    def opens(self, **overrides):
+        """
+        Connections opened over ``requests`` request cycles to a file-backed
+        SQLite database configured like the real ones (the test database is
+        in memory, and Django never closes that).
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        database = database_config(ENGINE='django.db.backends.sqlite3', NAME=os.path.join(directory, 'reuse.sqlite3'))
+        database = connections.configure_settings({'default': {**database, **overrides}})['default']
+        wrapper = load_backend(database['ENGINE']).DatabaseWrapper(database, 'reuse')
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            if connection is wrapper:
+                opened.append(connection)
+
+        connection_created.connect(count)
+        try:
+            for _ in range(self.requests):
+                # close_old_connections() does this before and after a request
+                wrapper.close_if_unusable_or_obsolete()
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                wrapper.close_if_unusable_or_obsolete()
+        finally:
+            connection_created.disconnect(count)
+            wrapper.close()
+        return len(opened)
+
+    def test_requests_reuse_connections(self):
+        self.assertEqual(self.opens(), 1)
+        self.assertEqual(self.opens(CONN_MAX_AGE=0), self.requests)
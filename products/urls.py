@@ -6,6 +6,7 @@ app_name = 'products'
 urlpatterns = [
     path('', views.product_list, name='product_list'),
     path('category/<slug:category_slug>/', views.product_list, name='product_list_by_category'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('<int:id>/', views.product_detail, name='product_detail'),
     path('<int:id>/modal/', views.product_detail_modal, name='product_detail_modal'),
     path('<int:product_id>/reviews/', views.product_reviews, name='product_reviews'),
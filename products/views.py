@@ -1,113 +1,64 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Q, Min, Max
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.http import JsonResponse, HttpResponse
-from django.db import models
-from decimal import Decimal
-from .models import Product, Review, Category
+from django.db import transaction
+from .models import Product, ProductImage, Review, Category
+from .catalog import CatalogQuery
+from .autocomplete import index as autocomplete_index
+from .pagination import paginate
+from .recommendations import related_products
 from .forms import ProductForm, ProductImageForm
 from django import forms
 
+REVIEW_ORDERING = ('-created', '-id')
+
 def product_list(request, category_slug=None):
     category = None
-    categories = Category.objects.all()
-    products = Product.objects.filter(available=True)
-    
     if category_slug:
         category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
-    
-    # Search functionality
-    search_query = request.GET.get('search', '')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
-    
-    # Price filtering
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
-    
-    # Sorting
-    sort_by = request.GET.get('sort', 'name')  # Default sort by name
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created')
-    else:  # sort_by == 'name'
-        products = products.order_by('name')
-    
-    # Stock filtering
-    in_stock = request.GET.get('in_stock')
-    if in_stock:
-        products = products.filter(stock__gt=0)
-    
-    # Pagination
-    page = request.GET.get('page', 1)
-    paginator = Paginator(products, 9)  # Show 9 products per page
-    
-    try:
-        products = paginator.page(page)
-    except PageNotAnInteger:
-        products = paginator.page(1)
-    except EmptyPage:
-        products = paginator.page(paginator.num_pages)
-    
-    # Get min and max prices for the filter
-    price_range = Product.objects.filter(available=True).aggregate(
-        min_price=models.Min('price'),
-        max_price=models.Max('price')
-    )
-    
+
+    query = CatalogQuery.from_request(request, category=category)
+    result = query.execute(page=request.GET.get('page'), cursor=request.GET.get('cursor'))
+
     context = {
-        'products': products,
-        'search_query': search_query,
-        'min_price': min_price or '',
-        'max_price': max_price or '',
-        'sort_by': sort_by,
-        'in_stock': in_stock,
-        'price_range': price_range,
+        'category': category,
+        'products': result.page,
+        'facets': result.facets,
+        'search_query': query.search,
+        'min_price': request.GET.get('min_price') or '',
+        'max_price': request.GET.get('max_price') or '',
+        'sort_by': query.sort,
+        'in_stock': request.GET.get('in_stock'),
+        'price_range': result.price_range,
     }
     return render(request, 'products/list.html', context)
 
+def autocomplete(request):
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    return JsonResponse({
+        'query': query,
+        'results': autocomplete_index.suggest(query, limit=limit),
+    })
+
 def product_detail(request, id):
     product = get_object_or_404(Product, id=id, available=True)
-    # Get related products (same category or similar price range)
-    price_min = product.price * Decimal('0.8')
-    price_max = product.price * Decimal('1.2')
-    
-    related_products = Product.objects.filter(
-        Q(available=True) &
-        (Q(price__range=(price_min, price_max)) |
-         Q(name__icontains=product.name.split()[0]))
-    ).exclude(id=product.id)[:4]
+    # Precomputed by refresh_related_products
+    related = related_products(product)
     
     # Get reviews with pagination
-    reviews = product.reviews.all()
-    paginator = Paginator(reviews, 5)  # Show 5 reviews per page
-    page = request.GET.get('page')
-    try:
-        reviews = paginator.page(page)
-    except PageNotAnInteger:
-        reviews = paginator.page(1)
-    except EmptyPage:
-        reviews = paginator.page(paginator.num_pages)
+    reviews = paginate(product.reviews.all(), 5, REVIEW_ORDERING, request.GET)  # Show 5 reviews per page
 
     # Get rating distribution
     rating_distribution = product.get_rating_distribution()
     
     return render(request, 'products/detail.html', {
         'product': product,
-        'related_products': related_products,
+        'related_products': related,
         'reviews': reviews,
         'rating_distribution': rating_distribution
     })
@@ -123,27 +74,31 @@ def add_review(request, product_id):
             messages.error(request, 'Both rating and review content are required.')
             return redirect('products:product_detail', id=product_id)
             
-        try:
-            # Update existing review if it exists
-            review = Review.objects.get(product=product, user=request.user)
-            review.rating = rating
-            review.content = content
-            review.save()
-            messages.success(request, 'Your review has been updated.')
-        except Review.DoesNotExist:
-            # Create new review
-            Review.objects.create(
-                product=product,
-                user=request.user,
-                rating=rating,
-                content=content
-            )
-            messages.success(request, 'Your review has been added.')
+        # Reads in a transaction go to the primary (gift_shop.routers), so a
+        # lagging replica can't hide the review or its previous rating
+        with transaction.atomic():
+            try:
+                # Update existing review if it exists
+                review = Review.objects.get(product=product, user=request.user)
+                review.rating = rating
+                review.content = content
+                review.save()
+                messages.success(request, 'Your review has been updated.')
+            except Review.DoesNotExist:
+                # Create new review
+                Review.objects.create(
+                    product=product,
+                    user=request.user,
+                    rating=rating,
+                    content=content
+                )
+                messages.success(request, 'Your review has been added.')
             
         return redirect('products:product_detail', id=product_id)
     return redirect('products:product_detail', id=product_id)
 
 @login_required
+@transaction.atomic  # reads the review from the primary, as add_review does
 def edit_review(request, review_id):
     review = get_object_or_404(Review, id=review_id, user=request.user)
     if request.method == 'POST':
@@ -161,6 +116,7 @@ def edit_review(request, review_id):
     return redirect('products:product_detail', id=review.product.id)
 
 @login_required
+@transaction.atomic  # reads the review from the primary, as add_review does
 def delete_review(request, review_id):
     review = get_object_or_404(Review, id=review_id, user=request.user)
     product_id = review.product.id
@@ -170,17 +126,8 @@ def delete_review(request, review_id):
 
 def product_reviews(request, product_id):
     product = get_object_or_404(Product, id=product_id, available=True)
-    reviews = product.reviews.all()
-    paginator = Paginator(reviews, 10)  # Show 10 reviews per page
-    
-    page = request.GET.get('page')
-    try:
-        reviews = paginator.page(page)
-    except PageNotAnInteger:
-        reviews = paginator.page(1)
-    except EmptyPage:
-        reviews = paginator.page(paginator.num_pages)
-        
+    reviews = paginate(product.reviews.all(), 10, REVIEW_ORDERING, request.GET)  # Show 10 reviews per page
+
     return render(request, 'products/reviews.html', {
         'product': product,
         'reviews': reviews,
@@ -189,7 +136,10 @@ def product_reviews(request, product_id):
 
 def product_detail_modal(request, id):
     product = get_object_or_404(Product, id=id, available=True)
-    return render(request, 'products/modal_detail.html', {'product': product})
+    return render(request, 'products/modal_detail.html', {
+        'product': product,
+        'related_products': related_products(product),
+    })
 
 class ProductForm(forms.ModelForm):
     class Meta:
@@ -8,6 +8,7 @@ from django.contrib import messages
 from django import forms
 from products.models import Product
 from orders.models import Order
+from gift_shop.routers import read_from_replica
 
 def register(request):
     if request.method == 'POST':
@@ -70,6 +71,7 @@ def edit_profile(request):
     return render(request, 'users/edit_profile.html', {'form': form})
 
 @login_required
+@read_from_replica
 def admin_dashboard(request):
     if not request.user.is_staff:
         return redirect('users:login')
@@ -80,6 +82,7 @@ def admin_dashboard(request):
     users = User.objects.filter(username__icontains=search_query) if search_query else User.objects.all()
     products = Product.objects.filter(name__icontains=search_query) if search_query else Product.objects.all()
     orders = Order.objects.filter(id__icontains=search_query) if search_query else Order.objects.all()
+    orders = orders.select_related('user')
     return render(request, 'users/admin_dashboard.html', {
         'user_count': user_count,
         'product_count': product_count,
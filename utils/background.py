@@ -0,0 +1,79 @@
+"""
+Process pools for CPU-heavy work started from web requests (see
+products/images.py and orders/invoices.py).
+
+Workers are spawned rather than forked, since web processes may be
+multithreaded. A pool is started on first use and replaced if one of its
+workers dies. Jobs are keyed, so asking again for work that is already in
+flight returns the same future instead of doing it twice.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import connections
+
+
+class BackgroundPool:
+    def __init__(self, workers_setting, default_workers):
+        self.workers_setting = workers_setting
+        self.default_workers = default_workers
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=getattr(settings, self.workers_setting, self.default_workers),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    def reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, key, fn, *args, on_done):
+        """
+        Run ``fn(*args)`` in the pool unless a job for ``key`` is in flight.
+        ``on_done`` is called with the job's future in the pool's result
+        thread, and what it returns (or raises) becomes the outcome of the
+        future returned here.
+        """
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = self._pending[key] = Future()
+
+        def done(job):
+            try:
+                future.set_result(on_done(job))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                # The result thread isn't a request, so nothing else closes
+                # the connections on_done opened
+                connections.close_all()
+                with self._lock:
+                    self._pending.pop(key, None)
+
+        try:
+            try:
+                job = self.get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                self.reset()
+                job = self.get_executor().submit(fn, *args)
+            job.add_done_callback(done)
+        except Exception:
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+        return future
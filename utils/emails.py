@@ -1,39 +1,18 @@
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
-from django.conf import settings
-import io
-try:
-    from xhtml2pdf import pisa  # type: ignore
-except Exception:  # ModuleNotFoundError or other import-time errors
-    pisa = None
+from notifications.outbox import queue_email
 
-def send_html_email(subject, template, context, recipient_list):
+# These functions queue mail in the outbox (notifications app) and return
+# straight away; the send_queued_email worker does the actual sending.
+
+def send_html_email(subject, template, context, recipient_list, attachments=()):
     """
-    Send HTML email using a template
+    Queue HTML email using a template
     """
     html_content = render_to_string(template, context)
     text_content = strip_tags(html_content)
-    
-    email = EmailMultiAlternatives(
-        subject,
-        text_content,
-        settings.DEFAULT_FROM_EMAIL,
-        recipient_list
-    )
-    email.attach_alternative(html_content, "text/html")
-    return email.send()
-
-def send_welcome_email(user):
-    """
-    Send welcome email to newly registered users
-    """
-    subject = 'Welcome to GiftNest!'
-    template = 'emails/welcome.html'
-    context = {
-        'user': user
-    }
-    return send_html_email(subject, template, context, [user.email])
+    return queue_email(subject, text_content, recipient_list, body_html=html_content,
+                       attachments=attachments)
 
 def send_order_confirmation(order):
     """
@@ -48,9 +27,26 @@ def send_order_confirmation(order):
     recipient_list = [order.email]
     return send_html_email(subject, template, context, recipient_list)
 
+def invoice_attachment(order_id):
+    """
+    The invoice PDF for an order as an email attachment, or None if it
+    can't be rendered. Uses the stored copy when there is one.
+    """
+    from orders.models import Order
+    from orders.invoices import invoice_filename, invoice_pdf
+    try:
+        order = Order.objects.get(pk=order_id)
+        pdf_content = invoice_pdf(order)
+    except Exception:
+        # If PDF generation fails, still send email without attachment
+        return None
+    if not pdf_content:
+        return None
+    return (invoice_filename(order), pdf_content, 'application/pdf')
+
 def send_payment_confirmation(order):
     """
-    Send payment confirmation email
+    Send payment confirmation email, with the invoice PDF attached
     """
     subject = f'Payment Confirmation - Order #{order.id}'
     template = 'emails/payment_confirmation.html'
@@ -58,35 +54,9 @@ def send_payment_confirmation(order):
         'order': order,
         'user': order.user
     }
-    html_content = render_to_string(template, context)
-    text_content = strip_tags(html_content)
-
-    email = EmailMultiAlternatives(
-        subject,
-        text_content,
-        settings.DEFAULT_FROM_EMAIL,
-        [order.email]
-    )
-    email.attach_alternative(html_content, "text/html")
-
-    # Try to render and attach invoice PDF
-    try:
-        if pisa is not None:
-            invoice_html = render_to_string('orders/invoice.html', {'order': order})
-            pdf_bytes_io = io.BytesIO()
-            pisa.CreatePDF(io.BytesIO(invoice_html.encode('utf-8')), dest=pdf_bytes_io, encoding='utf-8')
-            pdf_content = pdf_bytes_io.getvalue()
-            if pdf_content:
-                email.attach(
-                    filename=f'invoice_order_{order.id}.pdf',
-                    content=pdf_content,
-                    mimetype='application/pdf'
-                )
-    except Exception:
-        # If PDF generation fails, still send email without attachment
-        pass
-
-    return email.send()
+    # The PDF is rendered by the worker, not in the request
+    attachments = [('utils.emails.invoice_attachment', [order.id])]
+    return send_html_email(subject, template, context, [order.email], attachments=attachments)
 
 def send_welcome_email(user):
     """
@@ -0,0 +1,79 @@
+"""
+Image resizing with no Django dependency, so it can run in a separate
+worker process (see products/images.py).
+"""
+import hashlib
+import io
+try:
+    from PIL import Image, ImageOps
+except Exception:  # ModuleNotFoundError or other import-time errors
+    Image = None
+
+# Pillow format name and save() options per derivative format
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+def source_digest(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+def render_variants(data, widths, formats=('webp', 'jpeg')):
+    """
+    Resize the image in ``data`` to each of ``widths`` narrower than the
+    original and encode it in each of ``formats``. Returns a list of
+    (width, format, bytes), or None if the image can't be decoded.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except Exception:
+        return None
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    variants = []
+    # Largest first, each one resized from the previous, which is much
+    # cheaper than starting from the full-size original every time
+    source = image
+    for width in sorted((w for w in widths if w < image.width), reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        source = source.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            pillow_format, options = FORMATS[fmt]
+            frame = source
+            if pillow_format == 'JPEG' and frame.mode == 'RGBA':
+                # JPEG has no alpha; flatten onto white
+                background = Image.new('RGB', frame.size, (255, 255, 255))
+                background.paste(frame, mask=frame.getchannel('A'))
+                frame = background
+            out = io.BytesIO()
+            frame.save(out, pillow_format, **options)
+            variants.append((width, fmt, out.getvalue()))
+    return variants
+
+def render_file(path, widths, formats=('webp', 'jpeg')):
+    """
+    ``render_variants`` for an image file, read in the worker process so
+    the bytes don't have to be sent to it.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    return render_variants(data, widths, formats)
+
+def digest_and_render_file(path, widths, formats=('webp', 'jpeg')):
+    """
+    (digest, ``render_variants`` result) for an image file, read and hashed
+    in the worker process. Both are None if the file can't be read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None, None
+    return source_digest(data), render_variants(data, widths, formats)
@@ -0,0 +1,36 @@
+"""
+HTML to PDF conversion with no Django dependency, so it can run in a
+separate worker process (see orders/invoices.py).
+"""
+import io
+import os
+try:
+    from xhtml2pdf import pisa  # type: ignore
+except Exception:  # ModuleNotFoundError or other import-time errors
+    pisa = None
+
+def html_to_pdf(html):
+    """
+    Render ``html`` to PDF bytes, or return None if it can't be rendered.
+    """
+    if pisa is None:
+        return None
+    result = io.BytesIO()
+    status = pisa.CreatePDF(io.BytesIO(html.encode('utf-8')), dest=result, encoding='utf-8')
+    if status.err:
+        return None
+    return result.getvalue() or None
+
+def write_pdf(html, path):
+    """
+    Render ``html`` to a PDF file at ``path``, written atomically. Returns
+    the file size, or None if it can't be rendered.
+    """
+    pdf = html_to_pdf(html)
+    if pdf is None:
+        return None
+    partial = f'{path}.partial'
+    with open(partial, 'wb') as f:
+        f.write(pdf)
+    os.replace(partial, path)
+    return len(pdf)